@@ -0,0 +1,181 @@
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from threading import Condition
+from typing import Any
+import os
+import shutil
+import time
+
+
+# Seconds between the checks of the free space while a SIP waits for room
+DEFAULT_POLL_INTERVAL = 5
+
+# Seconds a SIP waits for room before it is given up, and redelivered later
+DEFAULT_TIMEOUT = 15 * 60
+
+# The METS and the zip headers are estimated per file, on top of the files
+METS_SIZE_PER_FILE = 16 * 1024
+METS_SIZE = 64 * 1024
+
+
+class AdmissionError(Exception):
+    """Raised for a SIP that can never fit in the AIP folder."""
+
+
+class AdmissionTimeout(Exception):
+    """
+    Raised for a SIP that gave up waiting for room, after the timeout or as
+    the controller was stopped.
+    """
+
+
+def estimate_output_size(files: list[dict[str, Any]], staged: bool = False) -> int:
+    """
+    Estimate the bytes the MediaHaven SIP of `files` takes up in the AIP
+    folder, assuming the files are stored without compression.
+
+    Args:
+        files: The files of the METS data, of which the source files exist.
+        staged: The unzipped SIP is written next to the zip as well, in the
+            worst case as a copy.
+    """
+    files_size = sum(os.stat(file["source_href"]).st_size for file in files)
+    size = files_size + METS_SIZE + METS_SIZE_PER_FILE * len(files)
+    if staged:
+        size += files_size
+    return size
+
+
+class AdmissionController:
+    """
+    Limits the SIPs that are packaged at the same time by their estimated
+    size.
+
+    A SIP reserves its size before it is written and waits while the bytes
+    in flight would exceed `max_in_flight_bytes`, or the free space minus the
+    reserved bytes would drop below `min_free_bytes`. A limit of 0 is not
+    enforced. A SIP that is larger than `max_in_flight_bytes` is admitted
+    once nothing else is in flight.
+
+    SIPs are admitted in the order in which they started waiting, so a large
+    SIP is not overtaken by smaller ones. A SIP waits at most `timeout`
+    seconds, without limit when it is 0, and stops waiting when the
+    controller is stopped.
+
+    Only the reservations of this process are known, other processes that
+    write to the same folder show up in the free space once they write.
+    """
+
+    def __init__(
+        self,
+        folder: Path,
+        max_in_flight_bytes: int = 0,
+        min_free_bytes: int = 0,
+        poll_interval: float = DEFAULT_POLL_INTERVAL,
+        timeout: float = DEFAULT_TIMEOUT,
+    ):
+        self.folder = folder
+        self.max_in_flight_bytes = max_in_flight_bytes
+        self.min_free_bytes = min_free_bytes
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.in_flight_bytes = 0
+        # The reservations that wait for room, oldest first
+        self.waiting: list[object] = []
+        self.stopped = False
+        self.condition = Condition()
+
+    def get_free_bytes(self) -> int:
+        """Get the free space of the folder that is not reserved yet."""
+        return shutil.disk_usage(self.folder).free - self.in_flight_bytes
+
+    def can_admit(self, size: int) -> bool:
+        if (
+            self.max_in_flight_bytes
+            and self.in_flight_bytes
+            and self.in_flight_bytes + size > self.max_in_flight_bytes
+        ):
+            return False
+        if self.min_free_bytes and self.get_free_bytes() - size < self.min_free_bytes:
+            return False
+        return True
+
+    def is_open(self) -> bool:
+        """Check whether there is room to receive more messages."""
+        if self.waiting:
+            return False
+        if (
+            self.max_in_flight_bytes
+            and self.in_flight_bytes >= self.max_in_flight_bytes
+        ):
+            return False
+        return self.can_admit(0)
+
+    def wait_until_open(self, timeout: float) -> bool:
+        """
+        Wait at most `timeout` seconds until there is room to receive more
+        messages.
+
+        Returns:
+            Whether there is room.
+        """
+        with self.condition:
+            return self.condition.wait_for(self.is_open, timeout)
+
+    def stop(self):
+        """Stop the SIPs that wait for room."""
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+
+    @contextmanager
+    def reserve(self, size: int) -> Iterator[None]:
+        """
+        Reserve `size` bytes while the SIP is written, after waiting for room
+        behind the SIPs that were already waiting.
+
+        Raises:
+            AdmissionError: The SIP does not fit on the volume, not even when
+                nothing else is in flight.
+            AdmissionTimeout: The SIP waited for `timeout` seconds, or the
+                controller was stopped while it waited.
+        """
+        usable = shutil.disk_usage(self.folder).total - self.min_free_bytes
+        if size > usable:
+            raise AdmissionError(
+                f"SIP of {size} bytes does not fit in {usable} usable bytes"
+            )
+
+        ticket = object()
+        deadline = time.monotonic() + self.timeout
+        with self.condition:
+            self.waiting.append(ticket)
+            try:
+                while self.waiting[0] is not ticket or not self.can_admit(size):
+                    if self.stopped:
+                        raise AdmissionTimeout(
+                            f"Stopped while a SIP of {size} bytes waited for room"
+                        )
+                    remaining = deadline - time.monotonic()
+                    if self.timeout and remaining <= 0:
+                        raise AdmissionTimeout(
+                            f"SIP of {size} bytes waited {self.timeout} seconds"
+                            " for room"
+                        )
+                    self.condition.wait(
+                        min(self.poll_interval, remaining)
+                        if self.timeout
+                        else self.poll_interval
+                    )
+                self.in_flight_bytes += size
+            finally:
+                self.waiting.remove(ticket)
+                # The next SIP in line may fit now
+                self.condition.notify_all()
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.in_flight_bytes -= size
+                self.condition.notify_all()
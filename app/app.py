@@ -1,38 +1,182 @@
+from collections.abc import Callable
+from concurrent.futures import Executor, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
 from pathlib import Path
+from threading import BoundedSemaphore, Lock
+from typing import Any, NamedTuple
+import asyncio
 
 import _pulsar
+from pulsar import Message
 
 from cloudevents.events import Event, PulsarBinding, EventOutcome, EventAttributes
 from viaa.configuration import ConfigParser
 from viaa.observability import logging
 
-from app.services.pulsar import PulsarClient
+from app.admission import (
+    DEFAULT_POLL_INTERVAL,
+    DEFAULT_TIMEOUT,
+    AdmissionController,
+    AdmissionError,
+)
+from app.claim_check import DEFAULT_METADATA_THRESHOLD, get_event_metadata
+from app.manifest import (
+    DEFAULT_MANIFEST_MAX_AGE,
+    cleanup_manifests,
+    complete_manifest,
+    create_manifest,
+    get_manifest_path,
+    get_mets_copy_path,
+    get_state_folder,
+    is_completed,
+    read_manifest,
+    remove_manifest,
+    write_manifest,
+)
+from app.packaging import cleanup_orphans
+from app.services.pulsar import PulsarClient, decode_message
 from app.services.pid import PidClient
-from app.utils import get_sip_creator
+from app.utils import deserialize_sip, get_sip_creator
 
 import sippy
 
 
 APP_NAME = "sipin-mh-sip-creator-v2"
 
+# Partial output of other replicas is only removed when it is older than a day
+DEFAULT_ORPHAN_MAX_AGE = 24 * 60 * 60
+
+
+def cleanup_leftovers(config: dict[str, Any]) -> list[Path]:
+    """
+    Remove the partial output that crashed runs left behind in the AIP folder
+    and the state folder, and the manifests that expired.
+
+    Returns:
+        The paths that were removed.
+    """
+    orphan_max_age = config.get("orphan_max_age", DEFAULT_ORPHAN_MAX_AGE)
+    state_folder = get_state_folder(config)
+    return [
+        *cleanup_orphans(Path(config["aip_folder"]), orphan_max_age),
+        *cleanup_orphans(state_folder, orphan_max_age),
+        *cleanup_manifests(
+            state_folder, config.get("manifest_max_age", DEFAULT_MANIFEST_MAX_AGE)
+        ),
+    ]
+
+
+class OutgoingEvent(NamedTuple):
+    topic: str
+    data: dict
+    subject: str
+    outcome: EventOutcome
+    correlation_id: str
+
+
+@dataclass
+class ListenerMetrics:
+    """
+    Counters of the handled messages, which are updated by the worker threads.
+    """
+
+    acknowledged: int = 0
+    negatively_acknowledged: int = 0
+    lock: Lock = field(default_factory=Lock, repr=False, compare=False)
+
+    def record(self, acknowledged: int = 0, negatively_acknowledged: int = 0):
+        with self.lock:
+            self.acknowledged += acknowledged
+            self.negatively_acknowledged += negatively_acknowledged
+
+    def snapshot(self) -> dict[str, int]:
+        with self.lock:
+            return {
+                "acknowledged": self.acknowledged,
+                "negatively_acknowledged": self.negatively_acknowledged,
+            }
+
 
 class EventListener:
     """
     EventListener is responsible for listening to Pulsar events and processing them.
     """
 
-    def __init__(self, timeout_ms: int | None = None):
+    def __init__(
+        self,
+        timeout_ms: int | None = None,
+        clean_orphans: bool = True,
+        pid_config: dict | None = None,
+    ):
         """
         Initializes the EventListener with configuration, logging, and Pulsar client.
+
+        A listener that runs next to other listeners on the same host, started
+        by the supervisor, leaves removing the orphans to the supervisor with
+        `clean_orphans`, and gets its own `pid_config`.
         """
         config_parser = ConfigParser()
         self.config = config_parser.app_cfg
 
         self.log = logging.get_logger(__name__, config=config_parser)
         self.pulsar_client = PulsarClient(timeout_ms=timeout_ms)
-        self.pid_client = PidClient()
+        self.pid_client = PidClient(pid_config)
+        self.pid_executor = ThreadPoolExecutor(
+            self.config.get("workers", 1), thread_name_prefix="pid"
+        )
 
         self.running = True
+        # The IDs of the messages that were negatively acknowledged in a batch
+        self.pending_redelivery: set[bytes] = set()
+        self.metrics = ListenerMetrics()
+        self.admission = self.create_admission_controller()
+        self.state_folder = get_state_folder(self.config)
+
+        if clean_orphans:
+            self.cleanup_orphans()
+
+    def create_admission_controller(self) -> AdmissionController | None:
+        """
+        Create the admission controller that limits the SIPs that are created
+        at the same time by their size, or None without limits.
+        """
+        max_in_flight_bytes = self.config.get("max_in_flight_bytes", 0)
+        min_free_bytes = self.config.get("min_free_bytes", 0)
+        if not max_in_flight_bytes and not min_free_bytes:
+            return None
+        return AdmissionController(
+            Path(self.config["aip_folder"]),
+            max_in_flight_bytes,
+            min_free_bytes,
+            self.config.get("admission_poll_interval", DEFAULT_POLL_INTERVAL),
+            self.config.get("admission_timeout", DEFAULT_TIMEOUT),
+        )
+
+    def wait_for_admission(self) -> bool:
+        """
+        Wait a second at most until there is room to receive more messages.
+        """
+        if self.admission is None:
+            return True
+        return self.admission.wait_until_open(timeout=1)
+
+    def stop(self):
+        """
+        Stop receiving messages, after which the messages in flight are
+        finished. The SIPs that wait for room are given up, so their messages
+        are redelivered.
+        """
+        self.running = False
+        if self.admission is not None:
+            self.admission.stop()
+
+    def cleanup_orphans(self):
+        """
+        Remove the partial zips and folders that crashed runs left behind, and
+        the manifests that expired.
+        """
+        for path in cleanup_leftovers(self.config):
+            self.log.warning(f"Removed leftover output {path}.")
 
     def produce_event(
         self,
@@ -41,7 +185,7 @@ class EventListener:
         subject: str,
         outcome: EventOutcome,
         correlation_id: str,
-    ):
+    ) -> Future[None]:
         """Produce an event on a Pulsar topic.
         Args:
             topic: The topic to send the cloudevent to.
@@ -49,6 +193,9 @@ class EventListener:
             subject: The subject of the event.
             outcome: The attributes outcome of the Event.
             correlation_id: The correlation ID.
+
+        Returns:
+            A future that is done once the event is persisted.
         """
         attributes = EventAttributes(
             type=topic,
@@ -59,18 +206,47 @@ class EventListener:
         )
 
         event = Event(attributes, data)
-        self.pulsar_client.produce_event(topic, event)
+        return self.pulsar_client.produce_event(topic, event)
 
-    def handle_incoming_message(self, event: Event):
+    def handle_incoming_message(
+        self, event: Event, event_data: dict[str, Any] | None = None
+    ) -> Future[None] | None:
         """
         Handles an incoming Pulsar event.
 
         Args:
             event (Event): The incoming event to process.
+            event_data: The data of the event, when it was decoded separately.
+
+        Returns:
+            A future that is done once the outgoing event is persisted, or None
+            when the event was dropped.
+        """
+        outgoing_event = self.create_outgoing_event(event, event_data)
+        if outgoing_event is None:
+            return None
+        return self.produce_event(*outgoing_event)
+
+    def create_outgoing_event(
+        self, event: Event, event_data: dict[str, Any] | None = None
+    ) -> OutgoingEvent | None:
+        """
+        Create the MediaHaven SIP of an incoming Pulsar event and the event
+        that announces it.
+
+        Args:
+            event (Event): The incoming event to process.
+            event_data: The data of the event, when it was decoded separately.
+
+        Returns:
+            The outgoing event, or None when the incoming event was dropped.
         """
+        if event_data is None:
+            event_data = event.get_data()
+
         if not event.has_successful_outcome():
-            self.log.info(f"Dropping non successful event: {event.get_data()}")
-            return
+            self.log.info(f"Dropping non successful event: {event_data}")
+            return None
 
         event_attributes = event.get_attributes()
 
@@ -78,17 +254,36 @@ class EventListener:
         unzipped_path = event_attributes.get("subject")
         if unzipped_path is None:
             self.log.error("Invalid event: subject is missing.")
-            return
+            return None
         self.log.info(f"Start handling of {unzipped_path}.")
         zip_folder_path = Path(unzipped_path).parent
 
-        event_data = event.get_data()
         event_data.pop("is_valid")
-        sip = sippy.SIP.deserialize(event_data)
-        pid = self.get_pid(sip)
+        sip = deserialize_sip(
+            event_data, self.config.get("sip_deserialization", "full")
+        )
 
-        write_mediahaven_sip_fn = get_sip_creator(sip)
-        mh_sip_path, mets_xml = write_mediahaven_sip_fn(sip, self.config, pid)
+        producer_topic = self.config["pulsar"]["producer_topic"]
+        try:
+            pid, mh_sip_path, metadata = self.create_mediahaven_sip(
+                sip, event.correlation_id
+            )
+        except AdmissionError as e:
+            # A redelivery would not fit either, so the SIP fails for good
+            data = {
+                "source": str(zip_folder_path),
+                "host": self.config["host"],
+                "outcome": EventOutcome.FAIL,
+                "message": f"AIP not created for {unzipped_path}: {e}",
+            }
+            self.log.error(data["message"])
+            return OutgoingEvent(
+                producer_topic,
+                data,
+                unzipped_path,
+                EventOutcome.FAIL,
+                event.correlation_id,
+            )
         profile = str(sip.profile).split("/")[-1]
 
         # Cursed knowlegde:
@@ -103,19 +298,24 @@ class EventListener:
             "host": self.config["host"],
             "paths": [
                 str(Path(f"{mh_sip_path}.zip")),
+                # The METS that is referred to is delivered with the zip
+                *(
+                    [metadata["metadata_reference"]["path"]]
+                    if "metadata_reference" in metadata
+                    else []
+                ),
             ],
             "cp_id": sip.entity.maintainer.identifier,
             "type": "complex",
             "sip_profile": profile,
             "pid": pid,
             "outcome": EventOutcome.SUCCESS,
-            "metadata": mets_xml,
+            **metadata,
             "message": f"AIP created: MH2.0 complex created for {unzipped_path}",
         }
-        producer_topic = self.config["pulsar"]["producer_topic"]
 
         self.log.info(data["message"], pid=pid)
-        self.produce_event(
+        return OutgoingEvent(
             producer_topic,
             data,
             unzipped_path,
@@ -123,28 +323,413 @@ class EventListener:
             event.correlation_id,
         )
 
+    def create_mediahaven_sip(
+        self, sip: sippy.SIP, correlation_id: str
+    ) -> tuple[str, Path, dict[str, Any]]:
+        """
+        Create the MediaHaven SIP, unless it was already created for a previous
+        delivery of the same event.
+
+        The progress is tracked in a manifest in the state folder, so a
+        redelivered event reuses the finished zip or, when the creation did not
+        finish, the PID that was already assigned. The METS for the outgoing
+        event is taken from a copy next to the manifest, as the published zip
+        can be moved away at any time. Only a streamed METS is copied, as a
+        rendered METS is at hand in memory, so a redelivered event of which
+        the METS was not streamed writes the SIP again, with the same PID. A
+        METS that is referred to in the outgoing event is written before the
+        manifest is completed. The manifest is removed once the event is
+        acknowledged.
+
+        Args:
+            sip: The deserialized SIP.
+            correlation_id: The correlation ID of the incoming event.
+
+        Returns:
+            The PID, the path of the MediaHaven SIP (without `.zip`) and the
+            fields that carry the METS in the outgoing event.
+        """
+        manifest_path = get_manifest_path(self.state_folder, correlation_id)
+        manifest = read_manifest(manifest_path)
+        if manifest is not None and manifest["correlation_id"] != correlation_id:
+            manifest = None
+
+        if manifest is not None and is_completed(manifest):
+            pid = manifest["pid"]
+            mh_sip_path = Path(manifest["zip"]).with_suffix("")
+            self.log.info("MediaHaven SIP was already created.", pid=pid)
+            return (
+                pid,
+                mh_sip_path,
+                self.get_event_metadata(Path(manifest["mets"]), mh_sip_path),
+            )
+
+        if manifest is not None:
+            pid_future: Future[str] = Future()
+            pid_future.set_result(manifest["pid"])
+        else:
+            # The SIP is mapped while the PID is fetched
+            pid_future = self.pid_executor.submit(
+                self.assign_pid, sip, correlation_id, manifest_path
+            )
+
+        mets_path = (
+            get_mets_copy_path(manifest_path)
+            if self.config.get("stream_mets", False)
+            else None
+        )
+        write_mediahaven_sip_fn = get_sip_creator(sip)
+        mh_sip_path, load_mets = write_mediahaven_sip_fn(
+            sip, self.config, pid_future, self.admission, mets_path
+        )
+        pid = pid_future.result()
+        metadata = self.get_event_metadata(mets_path or load_mets(), mh_sip_path)
+
+        zip_path = Path(f"{mh_sip_path}.zip")
+        manifest = read_manifest(manifest_path) or create_manifest(correlation_id, pid)
+        write_manifest(manifest_path, complete_manifest(manifest, zip_path, mets_path))
+
+        return pid, mh_sip_path, metadata
+
+    def get_event_metadata(self, mets: Path | str, mh_sip_path: Path) -> dict[str, Any]:
+        """
+        Get the fields that carry the METS in the outgoing event, following the
+        `metadata_mode`. A METS that is referred to is written as
+        `<pid>.mets.xml` next to the zip.
+        """
+        return get_event_metadata(
+            mets,
+            Path(f"{mh_sip_path}.mets.xml"),
+            self.config.get("metadata_mode", "inline"),
+            self.config.get("metadata_threshold", DEFAULT_METADATA_THRESHOLD),
+        )
+
+    def assign_pid(
+        self, sip: sippy.SIP, correlation_id: str, manifest_path: Path
+    ) -> str:
+        """
+        Get the PID of the SIP and record it in the manifest, before anything
+        is written with it.
+        """
+        pid = self.get_pid(sip)
+        write_manifest(manifest_path, create_manifest(correlation_id, pid))
+        return pid
+
     def get_pid(self, sip: sippy.SIP) -> str:
         if len(sip.entity.identifier) == 10:
             return sip.entity.identifier
         return self.pid_client.get_pid()
 
+    def run(self):
+        """
+        Listens for incoming messages, on an asyncio event loop when `asyncio`
+        is enabled.
+        """
+        if self.config.get("asyncio", False):
+            self.start_listening_async()
+        else:
+            self.start_listening()
+
     def start_listening(self):
         """
         Starts listening for incoming messages from the Pulsar topic.
+
+        The messages are handled by a pool of `workers` threads. No more than
+        `max_in_flight` messages are received but not yet acknowledged, so a
+        slow SIP does not hold back the ones after it, while the consumer does
+        not take more messages than the workers can handle.
+
+        With batch receive, a batch that is handled by a single worker is
+        acknowledged at once, with a cumulative acknowledgement, when that is
+        safe.
+
+        With `max_in_flight_bytes` or `min_free_bytes`, receiving pauses while
+        the SIPs that are being created take up too much space.
         """
-        while self.running:
-            try:
-                msg = self.pulsar_client.receive()
-            except _pulsar.Timeout:
-                continue
+        workers = self.config.get("workers", 1)
+        max_in_flight = self.config.get("max_in_flight", workers)
+        in_flight = BoundedSemaphore(max_in_flight)
+        batch_receive = self.pulsar_client.batch_receive
+        cumulative_ack = (
+            batch_receive
+            and workers == 1
+            and self.pulsar_client.supports_cumulative_ack
+        )
+
+        with ThreadPoolExecutor(workers, thread_name_prefix="worker") as executor:
+
+            def release(processed: Future[Future[None] | None]):
+                """Release the slot once the message is (negatively) acknowledged."""
+                acknowledged = None if processed.exception() else processed.result()
+                if acknowledged is None:
+                    in_flight.release()
+                else:
+                    acknowledged.add_done_callback(lambda _: in_flight.release())
+
+            def submit(fn: Callable, *args):
+                executor.submit(fn, *args).add_done_callback(release)
+
+            def acquire() -> bool:
+                """Wait for a free slot, unless the listener is stopped."""
+                while self.running:
+                    if in_flight.acquire(timeout=1):
+                        return True
+                return False
+
+            while self.running:
+                if not self.wait_for_admission():
+                    continue
+
+                if batch_receive:
+                    messages = self.pulsar_client.receive_batch()
+                    if cumulative_ack and messages:
+                        if not acquire():
+                            self.negative_acknowledge_all(messages)
+                            continue
+                        submit(self.process_batch, messages)
+                        continue
+                    for idx, msg in enumerate(messages):
+                        if not acquire():
+                            # Stopped, the rest of the batch is redelivered
+                            self.negative_acknowledge_all(messages[idx:])
+                            break
+                        submit(self.process_message, msg)
+                    continue
+
+                if not in_flight.acquire(timeout=1):
+                    continue
+
+                try:
+                    msg = self.pulsar_client.receive()
+                except _pulsar.Timeout:
+                    in_flight.release()
+                    continue
+
+                submit(self.process_message, msg)
+
+        # Leaving the executor waits for the messages that are still handled,
+        # after which the messages of which the event is being sent are waited for
+        self.pulsar_client.flush()
+        for _ in range(max_in_flight):
+            in_flight.acquire()
+        self.close()
+
+    def start_listening_async(self):
+        """
+        Starts listening for incoming messages with the asyncio pipeline of
+        `listen`.
+        """
+        asyncio.run(self.listen())
+
+    async def listen(self):
+        """
+        Listens for incoming messages on an asyncio event loop.
+
+        Messages are received, their MediaHaven SIPs created and their events
+        produced in thread pools, while the event loop only waits for them.
+        The PID of a SIP is fetched while the SIP is mapped. No more than
+        `max_in_flight` messages are received but not yet acknowledged, and no
+        more than `workers` SIPs created, at the same time. With batch receive,
+        the rest of a received batch waits for a slot.
+        """
+        loop = asyncio.get_running_loop()
+        workers = self.config.get("workers", 1)
+        in_flight = asyncio.Semaphore(self.config.get("max_in_flight", workers))
+        tasks: set[asyncio.Task] = set()
+
+        with (
+            ThreadPoolExecutor(1, thread_name_prefix="receiver") as receiver,
+            ThreadPoolExecutor(workers, thread_name_prefix="worker") as packaging,
+        ):
+
+            async def receive() -> list[Message]:
+                if not await loop.run_in_executor(receiver, self.wait_for_admission):
+                    return []
+                if self.pulsar_client.batch_receive:
+                    return await loop.run_in_executor(
+                        receiver, self.pulsar_client.receive_batch
+                    )
+                try:
+                    return [
+                        await loop.run_in_executor(receiver, self.pulsar_client.receive)
+                    ]
+                except _pulsar.Timeout:
+                    return []
+
+            def start(msg: Message):
+                task = asyncio.create_task(self.process_message_async(msg, packaging))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                task.add_done_callback(lambda _: in_flight.release())
+
+            while self.running:
+                # A slot is taken before receiving, so no message waits for one
+                await in_flight.acquire()
+                messages = await receive() if self.running else []
+                if not messages:
+                    in_flight.release()
+                    continue
+
+                start(messages[0])
+                # The rest of a batch waits for a slot
+                for msg in messages[1:]:
+                    await in_flight.acquire()
+                    start(msg)
+
+            await asyncio.gather(*tasks)
+
+        self.close()
+
+    async def process_message_async(self, msg: Message, packaging: Executor):
+        """
+        Handle a message and acknowledge it once the outgoing event is
+        persisted, or negatively acknowledge it when it could not be handled.
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            outgoing_event = await loop.run_in_executor(
+                packaging, lambda: self.create_outgoing_event(*self.decode(msg))
+            )
+            if outgoing_event is not None:
+                persisted = await loop.run_in_executor(
+                    None, self.produce_event, *outgoing_event
+                )
+                await asyncio.wrap_future(persisted)
+        except Exception as e:
+            # Catch and log any errors during message processing
+            self.log.error(f"Error: {e}")
+            self.negative_acknowledge(msg)
+            return
+
+        self.acknowledge(
+            msg, outgoing_event.correlation_id if outgoing_event is not None else None
+        )
+
+    def negative_acknowledge_all(self, messages: list[Message]):
+        for msg in messages:
+            self.negative_acknowledge(msg)
+
+    def acknowledge(self, msg: Message, correlation_id: str | None = None):
+        """
+        Acknowledge a message, after which the manifest of the SIP with
+        `correlation_id` is no longer needed.
+        """
+        self.pulsar_client.acknowledge(msg)
+        self.metrics.record(acknowledged=1)
+        if correlation_id is not None:
+            self.remove_manifest(correlation_id)
+
+    def remove_manifest(self, correlation_id: str):
+        remove_manifest(get_manifest_path(self.state_folder, correlation_id))
+
+    def negative_acknowledge(self, msg: Message):
+        self.pulsar_client.negative_acknowledge(msg)
+        self.metrics.record(negatively_acknowledged=1)
+
+    def close(self):
+        """
+        Close the clients, after the PIDs that are being fetched arrived.
+        """
+        self.pid_executor.shutdown()
+        self.pid_client.close()
+        self.pulsar_client.close()
+
+    def process_message(self, msg: Message) -> Future[None]:
+        """
+        Handle a message and acknowledge it once the outgoing event is
+        persisted, or negatively acknowledge it when it could not be handled.
+
+        Returns:
+            A future that is done once the message is (negatively)
+            acknowledged.
+        """
+        acknowledged: Future[None] = Future()
 
+        def acknowledge(handled: Future[str | None]):
             try:
-                event = PulsarBinding.from_protocol(msg)  # type: ignore
-                self.handle_incoming_message(event)
-                self.pulsar_client.acknowledge(msg)
-            except Exception as e:
-                # Catch and log any errors during message processing
+                if handled.exception() is None:
+                    self.acknowledge(msg, handled.result())
+                else:
+                    self.negative_acknowledge(msg)
+            finally:
+                acknowledged.set_result(None)
+
+        self.handle_message(msg).add_done_callback(acknowledge)
+        return acknowledged
+
+    def process_batch(self, messages: list[Message]):
+        """
+        Handle the messages of a batch in order and acknowledge them.
+
+        A cumulative acknowledgement would also acknowledge the messages that
+        were negatively acknowledged and are waiting to be redelivered. It is
+        therefore only used when all messages of the batch were handled and no
+        message is waiting to be redelivered. A cumulative acknowledgement only
+        covers the partition of its message, so a batch that spans partitions
+        of a partitioned topic is acknowledged message by message.
+        """
+        handled = [self.handle_message(msg) for msg in messages]
+        wait(handled)
+        for msg in messages:
+            self.pending_redelivery.discard(msg.message_id().serialize())
+
+        succeeded = [future.exception() is None for future in handled]
+        single_partition = len({msg.topic_name() for msg in messages}) == 1
+        if all(succeeded) and not self.pending_redelivery and single_partition:
+            self.pulsar_client.acknowledge_cumulative(messages[-1])
+            self.metrics.record(acknowledged=len(messages))
+            for future in handled:
+                if (correlation_id := future.result()) is not None:
+                    self.remove_manifest(correlation_id)
+            return
+
+        for msg, future, success in zip(messages, handled, succeeded):
+            if success:
+                self.acknowledge(msg, future.result())
+            else:
+                self.pending_redelivery.add(msg.message_id().serialize())
+                self.negative_acknowledge(msg)
+
+    def handle_message(self, msg: Message) -> Future[str | None]:
+        """
+        Decode and handle a message.
+
+        Returns:
+            A future that is done once the message is handled and its outgoing
+            event persisted, with the correlation ID of the event, None when
+            the event was dropped, or the exception when that failed.
+        """
+        handled: Future[str | None] = Future()
+        try:
+            event, event_data = self.decode(msg)
+            correlation_id: str = event.correlation_id
+            persisted = self.handle_incoming_message(event, event_data)
+        except Exception as e:
+            # Catch and log any errors during message processing
+            self.log.error(f"Error: {e}")
+            handled.set_exception(e)
+            return handled
+
+        if persisted is None:
+            handled.set_result(None)
+            return handled
+
+        def done(persisted: Future[None]):
+            e = persisted.exception()
+            if e is None:
+                handled.set_result(correlation_id)
+            else:
                 self.log.error(f"Error: {e}")
-                self.pulsar_client.negative_acknowledge(msg)
+                handled.set_exception(e)
 
-        self.pulsar_client.close()
+        persisted.add_done_callback(done)
+        return handled
+
+    def decode(self, msg: Message) -> tuple[Event, dict[str, Any] | None]:
+        """
+        Decode the event of a message, and its data when `fast_decode` is
+        enabled.
+        """
+        if self.config.get("fast_decode", False):
+            return decode_message(msg)
+        return PulsarBinding.from_protocol(msg), None  # type: ignore
@@ -0,0 +1,100 @@
+from pathlib import Path
+from typing import Any, BinaryIO, Final
+import base64
+import gzip
+import hashlib
+import io
+import shutil
+
+from app.packaging import CHUNK_SIZE, get_partial_path, publish
+
+
+METADATA_MODES: Final = ("inline", "reference", "compressed")
+
+# METS of up to 1 MiB is always sent inline
+DEFAULT_METADATA_THRESHOLD = 1024 * 1024
+
+
+def get_event_metadata(
+    mets: Path | str,
+    reference_path: Path,
+    mode: str = "inline",
+    threshold: int = DEFAULT_METADATA_THRESHOLD,
+) -> dict[str, Any]:
+    """
+    Get the fields that carry the METS in the outgoing event. `mets` is the
+    METS itself, or the path of the file with it when it was streamed.
+
+    METS of up to `threshold` bytes is put in `metadata` as it is. Larger METS
+    is, depending on `mode`:
+
+    - `inline`: put in `metadata` anyway.
+    - `reference`: copied to `reference_path`, of which the path, size and
+      checksum are put in `metadata_reference` (a claim check).
+    - `compressed`: gzipped and base64 encoded in `metadata_compressed`.
+
+    Only inline METS is read from a file into memory as a whole.
+
+    Returns:
+        The fields to add to the data of the outgoing event.
+    """
+    if mode not in METADATA_MODES:
+        raise ValueError(f"Unknown metadata mode '{mode}'")
+
+    size = len(mets.encode("utf-8")) if isinstance(mets, str) else mets.stat().st_size
+    if mode == "inline" or size <= threshold:
+        if isinstance(mets, str):
+            return {"metadata": mets}
+        return {"metadata": mets.read_text(encoding="utf-8")}
+
+    if mode == "reference":
+        return {
+            "metadata": None,
+            "metadata_reference": {
+                "path": str(reference_path),
+                "size": size,
+                "checksum": copy_mets(mets, reference_path),
+                "checksum_type": "SHA-256",
+            },
+        }
+
+    compressed = io.BytesIO()
+    with open_mets(mets) as src, gzip.GzipFile(fileobj=compressed, mode="wb") as gz:
+        shutil.copyfileobj(src, gz, CHUNK_SIZE)
+    return {
+        "metadata": None,
+        "metadata_compressed": {
+            "encoding": "gzip+base64",
+            "data": base64.b64encode(compressed.getvalue()).decode("ascii"),
+        },
+    }
+
+
+def open_mets(mets: Path | str) -> BinaryIO:
+    """
+    Open the METS, or the file with it, to read its bytes.
+    """
+    if isinstance(mets, str):
+        return io.BytesIO(mets.encode("utf-8"))
+    return open(mets, "rb")
+
+
+def copy_mets(mets: Path | str, path: Path) -> str:
+    """
+    Copy the METS to `path`, so it is never read half-written.
+
+    Returns:
+        The SHA-256 checksum of the METS.
+    """
+    checksum = hashlib.sha256()
+    partial_path = get_partial_path(path)
+    try:
+        with open_mets(mets) as src, open(partial_path, "wb") as dest:
+            while chunk := src.read(CHUNK_SIZE):
+                checksum.update(chunk)
+                dest.write(chunk)
+    except BaseException:
+        partial_path.unlink(missing_ok=True)
+        raise
+    publish(partial_path, path)
+    return checksum.hexdigest()
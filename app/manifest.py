@@ -0,0 +1,175 @@
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Final
+import json
+import re
+import time
+import zipfile
+
+from app.packaging import get_partial_path, publish
+
+
+# The manifests are kept out of sight of the transport, which picks up the
+# files in the AIP folder, in a hidden folder by default
+DEFAULT_STATE_FOLDER: Final = ".state"
+
+# Manifests of which the event was never acknowledged are removed after a week
+DEFAULT_MANIFEST_MAX_AGE = 7 * 24 * 60 * 60
+
+
+def get_state_folder(config: dict[str, Any]) -> Path:
+    """
+    Get the folder of the manifests, which is `state_folder` or a hidden
+    folder in the AIP folder.
+    """
+    state_folder = config.get("state_folder")
+    if state_folder:
+        return Path(state_folder)
+    return Path(config["aip_folder"]) / DEFAULT_STATE_FOLDER
+
+
+def get_manifest_path(state_folder: str | Path, correlation_id: str) -> Path:
+    """
+    Get the path of the completion manifest of the SIP with `correlation_id`.
+
+    The manifest is keyed on the correlation ID, as it is known before a PID is
+    assigned to the SIP.
+    """
+    name = re.sub(r"[^A-Za-z0-9._-]", "_", correlation_id)
+    return Path(state_folder) / f"{name}.manifest.json"
+
+
+def get_mets_copy_path(manifest_path: Path) -> Path:
+    """
+    Get the path of the copy of the METS that is kept next to the manifest,
+    from which the outgoing event is created.
+    """
+    name = manifest_path.name.removesuffix(".manifest.json")
+    return manifest_path.with_name(f"{name}.mets.xml")
+
+
+def read_manifest(path: Path) -> dict[str, Any] | None:
+    """
+    Read the manifest at `path`, returns None when there is no (valid) manifest.
+    """
+    try:
+        with open(path) as manifest_file:
+            return json.load(manifest_file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def write_manifest(path: Path, manifest: dict[str, Any]):
+    """
+    Write the manifest to `path`, replacing an existing manifest atomically.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    partial_path = get_partial_path(path)
+    with open(partial_path, "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+    publish(partial_path, path)
+
+
+def remove_manifest(path: Path):
+    """
+    Remove the manifest at `path` and the copy of its METS, once the event of
+    its SIP was acknowledged.
+    """
+    path.unlink(missing_ok=True)
+    get_mets_copy_path(path).unlink(missing_ok=True)
+
+
+def cleanup_manifests(state_folder: Path, max_age: float) -> list[Path]:
+    """
+    Remove the manifests and copies of the METS that were not modified for
+    `max_age` seconds, of which the event was never acknowledged.
+
+    Returns:
+        The paths that were removed.
+    """
+    if not state_folder.is_dir():
+        return []
+
+    removed = []
+    now = time.time()
+    for path in [
+        *state_folder.glob("*.manifest.json"),
+        *state_folder.glob("*.mets.xml"),
+    ]:
+        try:
+            if now - path.stat().st_mtime <= max_age:
+                continue
+        except FileNotFoundError:
+            continue
+        path.unlink(missing_ok=True)
+        removed.append(path)
+
+    return removed
+
+
+def create_manifest(correlation_id: str, pid: str) -> dict[str, Any]:
+    """
+    Create the manifest of a SIP of which the creation has started.
+
+    Storing the PID before the SIP is created makes sure that a redelivered
+    message reuses it instead of minting a new one.
+    """
+    return {
+        "correlation_id": correlation_id,
+        "pid": pid,
+        "status": "started",
+        "started_at": datetime.now().isoformat(),
+    }
+
+
+def complete_manifest(
+    manifest: dict[str, Any], zip_path: Path, mets_path: Path | None
+) -> dict[str, Any]:
+    """
+    Mark the manifest as completed and record the contents of the zip and the
+    copy of its METS, when it was copied.
+
+    The sizes and CRC-32 checksums of the entries are taken from the central
+    directory of the zip, so the essence does not have to be read again.
+    """
+    completed = manifest | {
+        "status": "completed",
+        "completed_at": datetime.now().isoformat(),
+        "zip": str(zip_path),
+        "zip_size": zip_path.stat().st_size,
+        "files": get_zip_entries(zip_path),
+    }
+    if mets_path is not None:
+        completed["mets"] = str(mets_path)
+    return completed
+
+
+def is_completed(manifest: dict[str, Any]) -> bool:
+    """
+    Check whether the manifest describes a finished SIP that is still intact.
+
+    The zip must still exist with the recorded size, and its central directory
+    must list the recorded entries. The copy of the METS must still exist, as
+    the outgoing event is created from it, so a SIP of which the METS was not
+    copied is not reused.
+    """
+    if manifest.get("status") != "completed":
+        return False
+    if "mets" not in manifest or not Path(manifest["mets"]).is_file():
+        return False
+
+    zip_path = Path(manifest["zip"])
+    try:
+        if zip_path.stat().st_size != manifest["zip_size"]:
+            return False
+        return get_zip_entries(zip_path) == manifest["files"]
+    except (OSError, zipfile.BadZipFile):
+        return False
+
+
+def get_zip_entries(zip_path: Path) -> list[dict[str, Any]]:
+    with zipfile.ZipFile(zip_path) as zf:
+        return [
+            {"name": info.filename, "size": info.file_size, "crc32": info.CRC}
+            for info in zf.infolist()
+        ]
@@ -0,0 +1,587 @@
+from collections import deque
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, closing
+from dataclasses import dataclass, field
+from pathlib import Path
+from queue import Full, Queue
+from threading import Event
+from typing import Any, BinaryIO, Final
+import fcntl
+import hashlib
+import itertools
+import os
+import shutil
+import socket
+import time
+import zipfile
+
+
+# Size of the chunks read from the essence files while writing the archive.
+CHUNK_SIZE = 1024 * 1024
+
+# Number of chunks a worker reads ahead of the archive writer, per file.
+PREFETCH_CHUNKS = 8
+
+STAGING_STRATEGIES: Final = ("auto", "hardlink", "reflink", "copy")
+
+PARTIAL_SUFFIX: Final = ".partial"
+PARTIAL_HOST: Final = socket.gethostname().replace(".", "_")
+PARTIAL_OWNER: Final = f"{PARTIAL_HOST}-{os.getpid()}"
+
+# Numbers the partials of this process, so concurrent writes of the same path
+# do not share a partial
+partial_writes = itertools.count()
+
+# Linux ioctl that shares the extents of a file with another file (reflink).
+FICLONE: Final = 0x40049409
+
+COMPRESSION_METHODS: Final = {
+    "stored": zipfile.ZIP_STORED,
+    "deflated": zipfile.ZIP_DEFLATED,
+    "bzip2": zipfile.ZIP_BZIP2,
+    "lzma": zipfile.ZIP_LZMA,
+}
+
+
+class FixityError(Exception):
+    """Raised when the bytes of a packaged file do not match its fixity."""
+
+
+@dataclass(frozen=True)
+class Compression:
+    method: int = zipfile.ZIP_STORED
+    level: int | None = None
+
+
+@dataclass(frozen=True)
+class CompressionPolicy:
+    """
+    Decides how every entry of the MediaHaven zip is compressed.
+
+    A compression set for the extension of a file takes precedence over the
+    compression of its class (`collateral` or `essence`).
+    Files larger than `zip64_threshold` bytes are always written with Zip64
+    extensions.
+    """
+
+    mets: Compression = Compression()
+    collateral: Compression = Compression()
+    essence: Compression = Compression()
+    extensions: dict[str, Compression] = field(default_factory=dict)
+    zip64_threshold: int | None = None
+
+    def for_file(self, file: dict[str, Any]) -> Compression:
+        ext = Path(file["href"]).suffix.lower()
+        if ext in self.extensions:
+            return self.extensions[ext]
+        return self.collateral if file["is_collateral"] else self.essence
+
+
+def parse_compression(config: dict[str, Any]) -> Compression:
+    method = config.get("method", "stored")
+    if method not in COMPRESSION_METHODS:
+        raise ValueError(
+            f"Invalid compression method '{method}', expected one of {list(COMPRESSION_METHODS)}."
+        )
+    return Compression(COMPRESSION_METHODS[method], config.get("level"))
+
+
+def parse_compression_policy(config: dict[str, Any]) -> CompressionPolicy:
+    """
+    Parse the `compression` section of the app config.
+
+    Example:
+        compression:
+          mets: {method: deflated, level: 6}
+          collateral: {method: deflated}
+          essence: {method: stored}
+          extensions:
+            .srt: {method: deflated, level: 9}
+          zip64_threshold: 2147483648
+    """
+    extensions = {
+        ext.lower() if ext.startswith(".") else f".{ext.lower()}": parse_compression(
+            compression
+        )
+        for ext, compression in config.get("extensions", {}).items()
+    }
+    return CompressionPolicy(
+        mets=parse_compression(config.get("mets", {})),
+        collateral=parse_compression(config.get("collateral", {})),
+        essence=parse_compression(config.get("essence", {})),
+        extensions=extensions,
+        zip64_threshold=config.get("zip64_threshold"),
+    )
+
+
+def write_sip_zip(
+    zip_path: Path,
+    mets_xml: str | Iterable[str],
+    files: list[dict[str, Any]],
+    verify_fixity: bool = False,
+    compression: CompressionPolicy = CompressionPolicy(),
+    workers: int = 1,
+    fsync: bool = False,
+    mets_copy: Path | None = None,
+) -> None:
+    """
+    Write a MediaHaven SIP zip in a single pass.
+
+    The `mets.xml` and every file are streamed straight from their source path
+    into the archive, so no staging copy of the SIP is needed.
+
+    The zip is written under a partial name and only renamed to `zip_path`
+    when it is complete, so a zip at `zip_path` is never half written.
+
+    Args:
+        zip_path: The path of the zip to write.
+        mets_xml: The rendered METS document, or an iterable of its chunks that
+            are streamed into the archive as they are rendered.
+        files: The files of the SIP with their `source_href`, `href`, `checksum`
+            and `is_collateral`.
+        verify_fixity: Verify the MD5 checksum of every file while it is written.
+        compression: The compression policy of the entries in the zip.
+        workers: The number of files that are read and hashed at the same time.
+            The entries are always written in the order of `files`.
+        fsync: Flush the zip to disk before it is renamed.
+        mets_copy: A path to which the METS is written as well, while it is
+            streamed into the zip. It is published before the zip, so the METS
+            never has to be read back from the published zip.
+
+    Raises:
+        FixityError: When `verify_fixity` is set and a file does not match its
+            checksum. The incomplete zip is removed.
+    """
+    zip_path.parent.mkdir(parents=True, exist_ok=True)
+    partial_path = get_partial_path(zip_path)
+    partial_mets_path = get_partial_path(mets_copy) if mets_copy else None
+    paths = [Path(file["source_href"]) for file in files]
+    try:
+        with ExitStack() as stack:
+            zf = stack.enter_context(zipfile.ZipFile(partial_path, "w"))
+            sources = stack.enter_context(
+                closing(iter_source_files(paths, verify_fixity, workers))
+            )
+            mets_file = (
+                stack.enter_context(open(partial_mets_path, "wb"))
+                if partial_mets_path
+                else None
+            )
+            write_text_entry(zf, "mets.xml", mets_xml, compression.mets, mets_file)
+            for file, source in zip(files, sources):
+                write_zip_entry(
+                    zf,
+                    source,
+                    file["href"],
+                    compression=compression.for_file(file),
+                    zip64_threshold=compression.zip64_threshold,
+                )
+                if verify_fixity:
+                    source.verify(file["checksum"])
+    except BaseException:
+        partial_path.unlink(missing_ok=True)
+        if partial_mets_path:
+            partial_mets_path.unlink(missing_ok=True)
+        raise
+
+    if mets_copy and partial_mets_path:
+        publish(partial_mets_path, mets_copy, fsync)
+    publish(partial_path, zip_path, fsync)
+
+
+def get_partial_path(path: Path) -> Path:
+    """
+    Get the path under which `path` is written before it is published.
+
+    The name is hidden and contains the owner of the process, so replicas that
+    share the folder can tell their own orphaned partials apart, and a number
+    that is unique per call, so every write has its own partial.
+    """
+    return path.with_name(
+        f".{path.name}.{PARTIAL_OWNER}-{next(partial_writes)}{PARTIAL_SUFFIX}"
+    )
+
+
+def publish(partial_path: Path, path: Path, fsync: bool = False):
+    """
+    Atomically rename the completed `partial_path` to `path`.
+
+    When `fsync` is set, the file is flushed to disk before the rename and the
+    rename itself is flushed afterwards.
+    """
+    if fsync and partial_path.is_file():
+        with open(partial_path, "rb+") as partial_file:
+            os.fsync(partial_file.fileno())
+
+    os.replace(partial_path, path)
+
+    if fsync:
+        dir_fd = os.open(path.parent, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+def cleanup_orphans(folder: Path, max_age: float) -> list[Path]:
+    """
+    Remove the partial files and folders left behind by crashed processes.
+
+    A partial is orphaned when it was written by a process on this host that
+    is no longer running, or when it was not modified for `max_age` seconds.
+
+    Returns:
+        The paths that were removed.
+    """
+    if not folder.is_dir():
+        return []
+
+    removed = []
+    now = time.time()
+    for path in folder.glob(f".*{PARTIAL_SUFFIX}"):
+        owner = path.name.removesuffix(PARTIAL_SUFFIX).rsplit(".", 1)[-1]
+        host, _, pid = owner.rsplit("-", 1)[0].rpartition("-")
+        try:
+            is_stale = now - path.lstat().st_mtime > max_age
+        except FileNotFoundError:
+            continue
+        is_crashed = host == PARTIAL_HOST and not is_running(pid)
+        if not is_crashed and not is_stale:
+            continue
+
+        if path.is_dir() and not path.is_symlink():
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            path.unlink(missing_ok=True)
+        removed.append(path)
+
+    return removed
+
+
+def is_running(pid: str) -> bool:
+    """
+    Check whether the process with `pid` on this host, other than the current
+    one, is still running.
+
+    The partials with the PID of the current process are left behind by a
+    previous container with the same host name, as nothing is written before
+    the orphans are removed.
+    """
+    try:
+        pid_number = int(pid)
+    except ValueError:
+        return False
+    if pid_number == os.getpid():
+        return False
+
+    try:
+        os.kill(pid_number, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # The process exists, but belongs to another user
+        return True
+    return True
+
+
+def read_mets(zip_path: Path) -> str:
+    """
+    Read the `mets.xml` from a MediaHaven SIP zip.
+    """
+    with zipfile.ZipFile(zip_path) as zf:
+        return zf.read("mets.xml").decode("utf-8")
+
+
+def write_text_entry(
+    zf: zipfile.ZipFile,
+    arcname: str,
+    text: str | Iterable[str],
+    compression: Compression = Compression(),
+    copy: BinaryIO | None = None,
+) -> None:
+    """
+    Write `text`, or its chunks, UTF-8 encoded into the archive under `arcname`.
+
+    Small chunks are buffered, so they are compressed and checksummed in blocks
+    of about `CHUNK_SIZE`. The encoded blocks are also written to `copy`.
+    """
+    if isinstance(text, str):
+        encoded = text.encode("utf-8")
+        zf.writestr(
+            arcname,
+            encoded,
+            compress_type=compression.method,
+            compresslevel=compression.level,
+        )
+        if copy is not None:
+            copy.write(encoded)
+        return
+
+    zinfo = zipfile.ZipInfo(arcname, date_time=time.localtime()[:6])
+    zinfo.compress_type = compression.method
+    # ZipInfo has no public compression level attribute before Python 3.13
+    zinfo._compresslevel = compression.level  # type: ignore[attr-defined]
+    zinfo.external_attr = 0o600 << 16
+
+    with zf.open(zinfo, "w") as dest:
+        buffer: list[str] = []
+        buffered = 0
+        for chunk in text:
+            buffer.append(chunk)
+            buffered += len(chunk)
+            if buffered >= CHUNK_SIZE:
+                write_block(dest, "".join(buffer), copy)
+                buffer.clear()
+                buffered = 0
+        write_block(dest, "".join(buffer), copy)
+
+
+def write_block(dest: BinaryIO, text: str, copy: BinaryIO | None = None):
+    encoded = text.encode("utf-8")
+    dest.write(encoded)
+    if copy is not None:
+        copy.write(encoded)
+
+
+def write_zip_entry(
+    zf: zipfile.ZipFile,
+    source: "SourceFile",
+    arcname: str,
+    compression: Compression = Compression(),
+    zip64_threshold: int | None = None,
+) -> None:
+    """
+    Stream the chunks of `source` into the archive under `arcname`.
+    """
+    zinfo = zipfile.ZipInfo.from_file(source.path, arcname)
+    zinfo.compress_type = compression.method
+    # ZipInfo has no public compression level attribute before Python 3.13
+    zinfo._compresslevel = compression.level  # type: ignore[attr-defined]
+    force_zip64 = zip64_threshold is not None and zinfo.file_size >= zip64_threshold
+
+    with zf.open(zinfo, "w", force_zip64=force_zip64) as dest:
+        for chunk in source.chunks():
+            dest.write(chunk)
+
+
+class SourceFile:
+    """
+    A file of the SIP that is read in chunks.
+
+    When `hash_md5` is set, the MD5 of the file is calculated on the chunks
+    while they are read.
+    """
+
+    def __init__(self, path: Path, hash_md5: bool = False):
+        self.path = path
+        self.md5 = hashlib.md5() if hash_md5 else None
+
+    def chunks(self) -> Iterator[bytes]:
+        with open(self.path, "rb") as src:
+            while chunk := src.read(CHUNK_SIZE):
+                if self.md5 is not None:
+                    self.md5.update(chunk)
+                yield chunk
+
+    def verify(self, checksum: str):
+        """
+        Compare the calculated MD5 with `checksum`.
+
+        Raises:
+            FixityError: When the checksums do not match.
+        """
+        if self.md5 is None:
+            raise ValueError(f"The MD5 of '{self.path}' was not calculated.")
+        if self.md5.hexdigest() != checksum.lower():
+            raise FixityError(
+                f"Fixity mismatch for '{self.path}': expected {checksum}, got {self.md5.hexdigest()}."
+            )
+
+
+class PrefetchedSourceFile(SourceFile):
+    """
+    A file of the SIP that is read ahead by a worker thread.
+
+    The worker puts at most `PREFETCH_CHUNKS` chunks in a queue, which are
+    consumed in order by `chunks`.
+    """
+
+    def __init__(self, path: Path, hash_md5: bool, stop: Event):
+        super().__init__(path, hash_md5)
+        self.stop = stop
+        self.queue: Queue[bytes | BaseException | None] = Queue(PREFETCH_CHUNKS)
+
+    def prefetch(self):
+        try:
+            for chunk in super().chunks():
+                if not self._put(chunk):
+                    return
+            self._put(None)
+        except BaseException as e:
+            self._put(e)
+
+    def _put(self, item: bytes | BaseException | None) -> bool:
+        while not self.stop.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def chunks(self) -> Iterator[bytes]:
+        while (item := self.queue.get()) is not None:
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+
+
+def iter_source_files(
+    paths: list[Path], hash_md5: bool = False, workers: int = 1
+) -> Iterator[SourceFile]:
+    """
+    Iterate over the files at `paths` in order.
+
+    With more than one worker, the next `workers - 1` files are already read
+    and hashed by a thread pool while the current file is consumed.
+    """
+    if workers <= 1:
+        for path in paths:
+            yield SourceFile(path, hash_md5)
+        return
+
+    stop = Event()
+    executor = ThreadPoolExecutor(workers, thread_name_prefix="sip-packaging")
+    pending: deque[PrefetchedSourceFile] = deque()
+    remaining = iter(paths)
+
+    def submit_next():
+        path = next(remaining, None)
+        if path is None:
+            return
+        source = PrefetchedSourceFile(path, hash_md5, stop)
+        executor.submit(source.prefetch)
+        pending.append(source)
+
+    try:
+        for _ in range(workers):
+            submit_next()
+        while pending:
+            yield pending.popleft()
+            submit_next()
+    finally:
+        stop.set()
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def write_sip_folder(
+    folder: Path,
+    mets_xml: str,
+    files: list[dict[str, Any]],
+    strategy: str = "auto",
+) -> set[str]:
+    """
+    Write the MediaHaven SIP as an unzipped folder.
+
+    Like the zip, the folder is written under a partial name and renamed when
+    it is complete.
+
+    Args:
+        folder: The folder to write the SIP to.
+        mets_xml: The rendered METS document.
+        files: The files of the SIP with their `source_href` and `href`.
+        strategy: How the files are staged, see `stage_file`.
+
+    Returns:
+        The strategies that were used to stage the files.
+    """
+    if strategy not in STAGING_STRATEGIES:
+        raise ValueError(
+            f"Invalid staging strategy '{strategy}', expected one of {STAGING_STRATEGIES}."
+        )
+
+    partial_folder = get_partial_path(folder)
+    try:
+        partial_folder.mkdir(parents=True, exist_ok=True)
+        with open(partial_folder / "mets.xml", "w") as mets_file:
+            mets_file.write(mets_xml)
+
+        used_strategies = set()
+        for file in files:
+            dest_href = partial_folder / Path(file["href"])
+            dest_href.parent.mkdir(parents=True, exist_ok=True)
+            used_strategies.add(
+                stage_file(Path(file["source_href"]), dest_href, strategy)
+            )
+    except BaseException:
+        shutil.rmtree(partial_folder, ignore_errors=True)
+        raise
+
+    if folder.exists():
+        shutil.rmtree(folder)
+    publish(partial_folder, folder)
+
+    return used_strategies
+
+
+def stage_file(source: Path, dest: Path, strategy: str = "auto") -> str:
+    """
+    Stage the file at `source` to `dest` without copying its bytes when possible.
+
+    The strategies are tried in order, `auto` tries all of them:
+    - `hardlink`: link `dest` to `source`, when both are on the same filesystem.
+    - `reflink`: clone the extents of `source` (FICLONE) or let the kernel copy
+      them (`copy_file_range`), when the filesystem supports it.
+    - `copy`: a plain copy.
+
+    Returns:
+        The strategy that was used, `copy_file_range` when the reflink strategy
+        fell back to it.
+    """
+    dest.unlink(missing_ok=True)
+
+    if strategy in ("auto", "hardlink"):
+        try:
+            os.link(source, dest)
+            return "hardlink"
+        except OSError:
+            if strategy == "hardlink":
+                raise
+
+    if strategy in ("auto", "reflink"):
+        try:
+            return reflink(source, dest)
+        except OSError:
+            dest.unlink(missing_ok=True)
+            if strategy == "reflink":
+                raise
+
+    shutil.copyfile(source, dest)
+    return "copy"
+
+
+def reflink(source: Path, dest: Path) -> str:
+    """
+    Clone `source` to `dest` with FICLONE, or with `copy_file_range` when
+    cloning is not supported.
+
+    Raises:
+        OSError: When neither is supported for `source` and `dest`.
+    """
+    with open(source, "rb") as src, open(dest, "wb") as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            return "reflink"
+        except OSError:
+            if not hasattr(os, "copy_file_range"):
+                raise
+
+        size = os.fstat(src.fileno()).st_size
+        copied = 0
+        while copied < size:
+            count = os.copy_file_range(src.fileno(), dst.fileno(), size - copied)
+            if count == 0:
+                break
+            copied += count
+        return "copy_file_range"
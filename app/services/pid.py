@@ -1,25 +1,318 @@
+from collections import deque
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from threading import Event, Lock, Thread
+import fcntl
+import json
+import time
+
 import requests
 from viaa.configuration import ConfigParser
 from viaa.observability import logging
 
+from app.packaging import get_partial_path, publish
+
+
+# Seconds to wait before a failed refill of the PID pool is retried
+REFILL_RETRY_INTERVAL = 5
+
+DEFAULT_CONNECT_TIMEOUT = 3.05
+DEFAULT_READ_TIMEOUT = 10
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.5
+MAX_BACKOFF = 10
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_TIMEOUT = 30
+
+
+class PidServiceError(Exception): ...
+
+
+class PidServiceUnavailableError(PidServiceError):
+    """Raised without a request while the circuit breaker is open."""
+
+
+@dataclass
+class PidMetrics:
+    """
+    Counters of the requests to the PID webservice, which are updated by both
+    the listener and the thread that refills the pool.
+    """
+
+    requests: int = 0
+    errors: int = 0
+    retries: int = 0
+    rejected: int = 0
+    total_latency: float = 0
+    max_latency: float = 0
+    lock: Lock = field(default_factory=Lock, repr=False, compare=False)
+
+    @property
+    def mean_latency(self) -> float:
+        return self.total_latency / self.requests if self.requests else 0
+
+    def record_request(self, latency: float, error: bool):
+        with self.lock:
+            self.requests += 1
+            self.errors += error
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+
+    def record_retry(self):
+        with self.lock:
+            self.retries += 1
+
+    def record_rejected(self):
+        with self.lock:
+            self.rejected += 1
+
+
+class CircuitBreaker:
+    """
+    Stops calls to a failing service for `reset_timeout` seconds after
+    `failure_threshold` consecutive failures. After that a single call is let
+    through, which closes the circuit again when it succeeds.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: float | None = None
+        self.lock = Lock()
+
+    def allow(self) -> bool:
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            # Half-open, the next failure opens the circuit again right away
+            self.opened_at = None
+            self.failures = self.failure_threshold - 1
+            return True
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
 
 class PidClient:
     """Abstraction for a PID webservice.
 
+    With a `pool_size` in the PID config, PIDs are fetched in batches and
+    handed out from a pool, which is refilled in the background once it holds
+    no more than `low_water_mark` PIDs. The PIDs that are left in the pool
+    are saved to `pool_file` on close and used again on the next start. The
+    pool file can be shared by processes, as it is locked while it is used.
+
+    Requests share a session with connect and read timeouts. Failed requests
+    are retried with exponential backoff, and a circuit breaker stops calling
+    the webservice while it keeps failing.
+
     Attributes:
         log: The logger.
         pid_config: The config regarding the PID webservice.
     """
 
-    def __init__(self):
+    def __init__(self, pid_config: dict | None = None):
         config_parser = ConfigParser()
         self.log = logging.get_logger(__name__, config=config_parser)
-        self.pid_config: dict = config_parser.app_cfg["pid"]
+        self.pid_config: dict = (
+            pid_config if pid_config is not None else config_parser.app_cfg["pid"]
+        )
+
+        self.session = requests.Session()
+        self.timeout = (
+            self.pid_config.get("connect_timeout", DEFAULT_CONNECT_TIMEOUT),
+            self.pid_config.get("read_timeout", DEFAULT_READ_TIMEOUT),
+        )
+        self.retries: int = self.pid_config.get("retries", DEFAULT_RETRIES)
+        self.backoff: float = self.pid_config.get("backoff", DEFAULT_BACKOFF)
+        self.circuit_breaker = CircuitBreaker(
+            self.pid_config.get("failure_threshold", DEFAULT_FAILURE_THRESHOLD),
+            self.pid_config.get("reset_timeout", DEFAULT_RESET_TIMEOUT),
+        )
+        self.metrics = PidMetrics()
+
+        self.pool_size: int = self.pid_config.get("pool_size", 0)
+        self.low_water_mark: int = self.pid_config.get(
+            "low_water_mark", self.pool_size // 2
+        )
+        pool_file = self.pid_config.get("pool_file")
+        self.pool_file = Path(pool_file) if pool_file else None
+
+        self.pool: deque[str] = deque()
+        self.pool_lock = Lock()
+        self.refill_needed = Event()
+        self.stopped = Event()
+        self.refill_thread: Thread | None = None
+
+        if self.pool_size > 0:
+            self.pool.extend(self.load_pool())
+            self.refill_needed.set()
+            self.refill_thread = Thread(
+                target=self.refill_pool, name="pid-pool-refill", daemon=True
+            )
+            self.refill_thread.start()
 
     def get_pid(self) -> str:
-        """Retrieve a new PID from the PID webservice."""
+        """Retrieve a new PID, from the pool when there is one."""
+        if self.pool_size == 0:
+            return self.fetch_pids(1)[0]
+
+        with self.pool_lock:
+            pid = self.pool.popleft() if self.pool else None
+            if len(self.pool) <= self.low_water_mark:
+                self.refill_needed.set()
 
-        resp = requests.get(self.pid_config["url"])
-        pid = resp.json()[0]["id"]
+        if pid is None:
+            # The pool ran dry, so this PID is not worth waiting for the refill
+            self.log.warning("PID pool is empty, fetching a PID directly.")
+            pid = self.fetch_pids(1)[0]
 
         return pid
+
+    def fetch_pids(self, number: int) -> list[str]:
+        """Retrieve `number` new PIDs from the PID webservice.
+
+        Raises:
+            PidServiceUnavailableError: The circuit breaker is open.
+            PidServiceError: The last retry failed.
+        """
+        params = {"number": number} if number > 1 else None
+        attempt = 0
+        while True:
+            if not self.circuit_breaker.allow():
+                self.metrics.record_rejected()
+                raise PidServiceUnavailableError(
+                    "PID webservice is unavailable, the circuit breaker is open."
+                )
+
+            start = time.perf_counter()
+            try:
+                resp = self.session.get(
+                    self.pid_config["url"], params=params, timeout=self.timeout
+                )
+                resp.raise_for_status()
+                pids = [item["id"] for item in resp.json()]
+            except (requests.RequestException, ValueError, KeyError) as e:
+                self.metrics.record_request(time.perf_counter() - start, error=True)
+                self.circuit_breaker.record_failure()
+                if attempt == self.retries:
+                    raise PidServiceError(f"Failed to fetch PIDs: {e}") from e
+
+                delay = min(self.backoff * 2**attempt, MAX_BACKOFF)
+                self.log.warning(f"Failed to fetch PIDs, retrying in {delay}s: {e}")
+                time.sleep(delay)
+                self.metrics.record_retry()
+                attempt += 1
+                continue
+
+            self.metrics.record_request(time.perf_counter() - start, error=False)
+            self.circuit_breaker.record_success()
+            return pids
+
+    def refill_pool(self):
+        """Top up the pool every time it reaches the low-water mark."""
+        while not self.stopped.is_set():
+            self.refill_needed.wait()
+            self.refill_needed.clear()
+            if self.stopped.is_set():
+                return
+
+            with self.pool_lock:
+                missing = self.pool_size - len(self.pool)
+            if missing <= 0:
+                continue
+
+            try:
+                pids = self.fetch_pids(missing)
+            except Exception as e:
+                self.log.warning(f"Failed to refill the PID pool: {e}")
+                self.stopped.wait(REFILL_RETRY_INTERVAL)
+                self.refill_needed.set()
+                continue
+
+            with self.pool_lock:
+                self.pool.extend(pids)
+            self.log.debug(f"Added {len(pids)} PIDs to the PID pool.")
+
+    @contextmanager
+    def lock_pool_file(self, pool_file: Path) -> Iterator[Path]:
+        """
+        Lock the pool file for this process, so processes that share it do not
+        load or overwrite the PIDs of each other.
+        """
+        pool_file.parent.mkdir(parents=True, exist_ok=True)
+        lock_path = pool_file.with_name(f"{pool_file.name}.lock")
+        with open(lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield pool_file
+
+    def read_pool_file(self, pool_file: Path) -> list[str]:
+        if not pool_file.exists():
+            return []
+        try:
+            with open(pool_file) as f:
+                return json.load(f)
+        except json.JSONDecodeError:
+            self.log.warning(f"Ignoring invalid PID pool file {pool_file}.")
+            return []
+
+    def load_pool(self) -> list[str]:
+        """
+        Load the PIDs that were saved on the previous close.
+
+        The file is removed while it is locked, so the PIDs are never handed
+        out twice.
+        """
+        if self.pool_file is None:
+            return []
+
+        with self.lock_pool_file(self.pool_file) as pool_file:
+            pids = self.read_pool_file(pool_file)
+            pool_file.unlink(missing_ok=True)
+
+        self.log.info(f"Loaded {len(pids)} unused PIDs.")
+        return pids
+
+    def save_pool(self):
+        """Save the PIDs that were not handed out, so they are not wasted."""
+        with self.pool_lock:
+            pids = list(self.pool)
+            self.pool.clear()
+        if len(pids) == 0:
+            return
+
+        if self.pool_file is None:
+            self.log.warning(f"Discarding {len(pids)} unused PIDs, no pool file.")
+            return
+
+        with self.lock_pool_file(self.pool_file) as pool_file:
+            # Keep the PIDs that other processes saved
+            saved = self.read_pool_file(pool_file)
+            partial_path = get_partial_path(pool_file)
+            with open(partial_path, "w") as f:
+                json.dump(saved + pids, f)
+            publish(partial_path, pool_file)
+        self.log.info(f"Saved {len(pids)} unused PIDs.")
+
+    def close(self):
+        """Stop refilling the pool and save the unused PIDs."""
+        self.stopped.set()
+        self.refill_needed.set()
+        if self.refill_thread is not None:
+            self.refill_thread.join()
+        self.save_pool()
+        self.session.close()
+        self.log.info(f"PID webservice: {self.metrics}")
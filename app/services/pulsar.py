@@ -1,8 +1,160 @@
+from concurrent.futures import Future, wait
+from threading import Lock
+from typing import Any, Final
+import json
+
 from cloudevents.events import CEMessageMode, Event, PulsarBinding
-from pulsar import Client
+from pulsar import (
+    Client,
+    CompressionType,
+    ConsumerBatchReceivePolicy,
+    ConsumerType,
+    Message,
+    MessageId,
+    Result,
+)
 from viaa.configuration import ConfigParser
 from viaa.observability import logging
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# The body handed to the CloudEvents binding when the data is decoded separately
+EMPTY_BODY: Final = b'{"data": {}}'
+
+# The defaults of the Pulsar client
+DEFAULT_RECEIVER_QUEUE_SIZE = 1000
+DEFAULT_MAX_TOTAL_RECEIVER_QUEUE_SIZE = 50000
+
+DEFAULT_BATCH_MAX_MESSAGES = 100
+DEFAULT_BATCH_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_BATCH_TIMEOUT_MS = 100
+
+COMPRESSION_TYPES: Final = {
+    "none": CompressionType.NONE,
+    "lz4": CompressionType.LZ4,
+    "zlib": CompressionType.ZLib,
+    "zstd": CompressionType.ZSTD,
+    "snappy": CompressionType.SNAPPY,
+}
+
+# The producer options that are passed to the Pulsar client as they are
+PRODUCER_OPTIONS: Final = (
+    "batching_enabled",
+    "batching_max_messages",
+    "batching_max_allowed_size_in_bytes",
+    "batching_max_publish_delay_ms",
+    "max_pending_messages",
+)
+
+
+class PulsarProduceError(Exception): ...
+
+
+SUBSCRIPTION_TYPES: Final = {
+    "exclusive": ConsumerType.Exclusive,
+    "failover": ConsumerType.Failover,
+    "shared": ConsumerType.Shared,
+    "key_shared": ConsumerType.KeyShared,
+}
+
+# Cumulative acknowledgement is not supported by shared subscriptions
+CUMULATIVE_ACK_CONSUMER_TYPES: Final = (ConsumerType.Exclusive, ConsumerType.Failover)
+
+
+def loads(data: bytes) -> Any:
+    """
+    Decode JSON bytes, with orjson when it is installed.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def get_batch_receive_policy(
+    pulsar_config: dict[str, Any],
+) -> ConsumerBatchReceivePolicy | None:
+    """
+    Get the batch receive policy of the `batch_receive` section of the Pulsar
+    config, or None when messages are received one by one.
+    """
+    batch_config = pulsar_config.get("batch_receive")
+    if not batch_config:
+        return None
+
+    return ConsumerBatchReceivePolicy(
+        batch_config.get("max_messages", DEFAULT_BATCH_MAX_MESSAGES),
+        batch_config.get("max_bytes", DEFAULT_BATCH_MAX_BYTES),
+        batch_config.get("timeout_ms", DEFAULT_BATCH_TIMEOUT_MS),
+    )
+
+
+def get_consumer_type(pulsar_config: dict[str, Any]) -> ConsumerType:
+    """
+    Get the consumer type of the `subscription_type` of the Pulsar config,
+    which is exclusive by default.
+    """
+    subscription_type = pulsar_config.get("subscription_type", "exclusive")
+    if subscription_type not in SUBSCRIPTION_TYPES:
+        raise ValueError(f"Unknown subscription type '{subscription_type}'")
+    return SUBSCRIPTION_TYPES[subscription_type]
+
+
+def get_producer_options(producer_config: dict[str, Any]) -> dict[str, Any]:
+    """
+    Get the options to create a producer with from the `producer` section of
+    the Pulsar config. The options that are not set keep the defaults of the
+    Pulsar client.
+    """
+    options: dict[str, Any] = {
+        name: producer_config[name]
+        for name in PRODUCER_OPTIONS
+        if producer_config.get(name) is not None
+    }
+
+    compression = producer_config.get("compression", "none")
+    if compression not in COMPRESSION_TYPES:
+        raise ValueError(f"Unknown producer compression '{compression}'")
+    options["compression_type"] = COMPRESSION_TYPES[compression]
+
+    if producer_config.get("send_async", False):
+        # Wait for room instead of failing when the broker falls behind
+        options["block_if_queue_full"] = True
+    return options
+
+
+class AttributesMessage:
+    """
+    A Pulsar message of which the CloudEvents binding only decodes the
+    attributes, which are kept in the properties of the message.
+    """
+
+    def __init__(self, msg: Message):
+        self.msg = msg
+
+    def data(self) -> bytes:
+        return EMPTY_BODY
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.msg, name)
+
+
+def decode_message(msg: Message) -> tuple[Event, dict[str, Any]]:
+    """
+    Decode the CloudEvent of a message and its data.
+
+    The binding decodes the (small) attributes, while the data is decoded
+    directly from the bytes of the message, with orjson when it is installed.
+
+    Returns:
+        The event, without its data, and the data of the event.
+    """
+    event = PulsarBinding.from_protocol(AttributesMessage(msg))  # type: ignore
+    return event, loads(msg.data())["data"]
+
 
 class PulsarClient:
     """
@@ -18,33 +170,87 @@ class PulsarClient:
         self.client = Client(
             f"pulsar://{self.pulsar_config['host']}:{self.pulsar_config['port']}"
         )
+        self.consumer_type = get_consumer_type(self.pulsar_config)
+        batch_receive_policy = get_batch_receive_policy(self.pulsar_config)
+        self.batch_receive = batch_receive_policy is not None
         self.consumer = self.client.subscribe(
-            self.pulsar_config["consumer_topic"], "sipin-mh-sip-creator-v2"
+            self.pulsar_config["consumer_topic"],
+            "sipin-mh-sip-creator-v2",
+            consumer_type=self.consumer_type,
+            receiver_queue_size=self.pulsar_config.get(
+                "receiver_queue_size", DEFAULT_RECEIVER_QUEUE_SIZE
+            ),
+            max_total_receiver_queue_size_across_partitions=self.pulsar_config.get(
+                "max_total_receiver_queue_size", DEFAULT_MAX_TOTAL_RECEIVER_QUEUE_SIZE
+            ),
+            batch_receive_policy=batch_receive_policy,
         )
         self.log.info(
             f"Started consuming topic: {self.pulsar_config['consumer_topic']}"
         )
+        self.producer_config: dict[str, Any] = self.pulsar_config.get("producer") or {}
         self.producers = {}
+        self.producers_lock = Lock()
+        # The events that were sent asynchronously and are not yet persisted,
+        # which the callbacks of the Pulsar client remove from its own threads
+        self.pending: set[Future[None]] = set()
+        self.pending_lock = Lock()
         self.timeout_ms = timeout_ms
 
-    def produce_event(self, topic: str, event: Event):
+    def produce_event(self, topic: str, event: Event) -> Future[None]:
         """Produce a CloudEvent on a specified topic.
 
         If no producer exists for the topic, a new one is created.
 
+        With `send_async` in the producer config, the event is sent without
+        waiting for the broker.
+
         Args:
             topic (str): The topic to send the CloudEvent to.
             event (Event): The CloudEvent to send.
+
+        Returns:
+            A future that is done once the broker has persisted the event.
         """
-        if topic not in self.producers:
-            self.producers[topic] = self.client.create_producer(topic)
+        with self.producers_lock:
+            if topic not in self.producers:
+                self.producers[topic] = self.client.create_producer(
+                    topic, **get_producer_options(self.producer_config)
+                )
 
         msg = PulsarBinding.to_protocol(event, CEMessageMode.STRUCTURED)
-        self.producers[topic].send(
+        persisted: Future[None] = Future()
+        if not self.producer_config.get("send_async", False):
+            self.producers[topic].send(
+                msg.data,
+                properties=msg.attributes,
+                event_timestamp=event.get_event_time_as_int(),
+            )
+            persisted.set_result(None)
+            return persisted
+
+        def callback(result: Result, msg_id: MessageId):
+            if result == Result.Ok:
+                persisted.set_result(None)
+            else:
+                persisted.set_exception(
+                    PulsarProduceError(f"Failed to produce on {topic}: {result}")
+                )
+
+        with self.pending_lock:
+            self.pending.add(persisted)
+        persisted.add_done_callback(self.discard_pending)
+        self.producers[topic].send_async(
             msg.data,
+            callback,
             properties=msg.attributes,
             event_timestamp=event.get_event_time_as_int(),
         )
+        return persisted
+
+    def discard_pending(self, persisted: Future[None]):
+        with self.pending_lock:
+            self.pending.discard(persisted)
 
     def receive(self):
         """Receive a message from the consumer.
@@ -54,6 +260,26 @@ class PulsarClient:
         """
         return self.consumer.receive(self.timeout_ms)
 
+    @property
+    def supports_cumulative_ack(self) -> bool:
+        return self.consumer_type in CUMULATIVE_ACK_CONSUMER_TYPES
+
+    def receive_batch(self) -> list[Message]:
+        """Receive the messages of a batch, following the batch receive policy.
+
+        Returns:
+            The received messages, which are none when the timeout passed.
+        """
+        return list(self.consumer.batch_receive())
+
+    def acknowledge_cumulative(self, msg):
+        """Acknowledge a message and all messages before it on the consumer.
+
+        Args:
+            msg: The last message to acknowledge.
+        """
+        self.consumer.acknowledge_cumulative(msg)
+
     def acknowledge(self, msg):
         """Acknowledge a message on the consumer.
 
@@ -70,8 +296,26 @@ class PulsarClient:
         """
         self.consumer.negative_acknowledge(msg)
 
+    def flush(self):
+        """Flush all producers.
+
+        Waits until the events that were sent asynchronously are persisted.
+        """
+        with self.producers_lock:
+            producers = list(self.producers.values())
+        for producer in producers:
+            producer.flush()
+        with self.pending_lock:
+            pending = list(self.pending)
+        wait(pending)
+
     def close(self):
-        """Close all producers and the consumer."""
+        """Close all producers and the consumer.
+
+        The producers are flushed first, so the events that are still being
+        sent are persisted before anything is closed.
+        """
+        self.flush()
         for producer in self.producers.values():
             producer.close()
         self.consumer.close()
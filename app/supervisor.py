@@ -0,0 +1,253 @@
+from collections import Counter
+from multiprocessing.context import SpawnProcess
+from pathlib import Path
+from queue import Empty
+from threading import Event, Thread
+from typing import Any, NamedTuple
+import itertools
+import multiprocessing
+import signal
+import time
+
+from viaa.configuration import ConfigParser
+from viaa.observability import logging
+
+from app.app import EventListener, cleanup_leftovers
+
+
+# Seconds between the metrics that the workers report
+DEFAULT_METRICS_INTERVAL = 60
+
+# A worker that crashes is not restarted more often than every few seconds
+RESTART_DELAY = 5
+
+# Seconds that a stopping worker gets to finish the messages in flight
+DEFAULT_SHUTDOWN_TIMEOUT = 60
+
+# Subscriptions that hand out the messages of a topic to more than one consumer
+SHARED_SUBSCRIPTION_TYPES = ("shared", "key_shared")
+
+
+class WorkerReport(NamedTuple):
+    """
+    The metrics of a worker, of generation `generation` of the workers that
+    were started as worker `index`. The final report is the last of a worker
+    that stopped, a worker that crashed has none.
+    """
+
+    index: int
+    generation: int
+    metrics: dict[str, int]
+    final: bool = False
+
+
+def run_worker(
+    metrics: multiprocessing.Queue, index: int, generation: int, interval: float
+):
+    """
+    Run an event listener in a worker process, which reports the metrics of
+    the listener on `metrics` every `interval` seconds.
+
+    The listener stops after the messages in flight on SIGTERM.
+    """
+    # The supervisor stops the workers, also on Ctrl+C
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    config = ConfigParser().app_cfg
+    listener = EventListener(
+        clean_orphans=False, pid_config=get_worker_pid_config(config["pid"], index)
+    )
+    stopped = Event()
+
+    def stop(signum, frame):
+        listener.stop()
+
+    def report():
+        while not stopped.wait(interval):
+            metrics.put(WorkerReport(index, generation, get_worker_metrics(listener)))
+
+    signal.signal(signal.SIGTERM, stop)
+    reporter = Thread(target=report, name="metrics", daemon=True)
+    reporter.start()
+    try:
+        listener.run()
+    finally:
+        stopped.set()
+        # No report may follow the final one
+        reporter.join()
+        metrics.put(
+            WorkerReport(index, generation, get_worker_metrics(listener), final=True)
+        )
+
+
+def get_worker_pid_config(pid_config: dict[str, Any], index: int) -> dict[str, Any]:
+    """
+    Get the PID config of worker `index`, which saves its unused PIDs to its
+    own pool file, `<pool_file stem>-<index><suffix>`.
+    """
+    pool_file = pid_config.get("pool_file")
+    if not pool_file:
+        return pid_config
+    path = Path(pool_file)
+    return pid_config | {"pool_file": str(path.with_stem(f"{path.stem}-{index}"))}
+
+
+def get_worker_metrics(listener: EventListener) -> dict[str, int]:
+    pid_metrics = listener.pid_client.metrics
+    return {
+        **listener.metrics.snapshot(),
+        "pid_requests": pid_metrics.requests,
+        "pid_errors": pid_metrics.errors,
+    }
+
+
+class Supervisor:
+    """
+    Runs `processes` event listeners, each in its own process with its own
+    Pulsar client, on a shared subscription.
+
+    Workers that exit are restarted. Only the supervisor removes orphaned
+    partial output, at startup and after a worker crashed, as a worker cannot
+    tell the output of a crashed sibling from the output of a running one.
+    """
+
+    def __init__(self):
+        config_parser = ConfigParser()
+        self.config = config_parser.app_cfg
+        self.log = logging.get_logger(__name__, config=config_parser)
+
+        self.processes: int = self.config.get("processes", 1)
+        subscription_type = self.config["pulsar"].get("subscription_type", "exclusive")
+        if self.processes > 1 and subscription_type not in SHARED_SUBSCRIPTION_TYPES:
+            raise ValueError(
+                f"Running {self.processes} processes requires a shared subscription,"
+                f" not '{subscription_type}'"
+            )
+        self.metrics_interval: float = self.config.get(
+            "metrics_interval", DEFAULT_METRICS_INTERVAL
+        )
+        self.shutdown_timeout: float = self.config.get(
+            "shutdown_timeout", DEFAULT_SHUTDOWN_TIMEOUT
+        )
+
+        # Spawned workers import the app again, so each has its own partial owner
+        self.context = multiprocessing.get_context("spawn")
+        self.metrics_queue: multiprocessing.Queue = self.context.Queue()
+        self.workers: dict[int, SpawnProcess] = {}
+        self.started_at: dict[int, float] = {}
+        self.generations = itertools.count()
+        # The latest metrics of each worker by index and generation, as the
+        # reports of a worker can still arrive after it was restarted
+        self.worker_metrics: dict[tuple[int, int], dict[str, int]] = {}
+        # The metrics of the workers that sent their final report
+        self.retired_metrics: Counter[str] = Counter()
+        self.running = True
+
+    def cleanup_orphans(self):
+        """
+        Remove the partial output of the processes on this host that are no
+        longer running, and the manifests that expired.
+        """
+        for path in cleanup_leftovers(self.config):
+            self.log.warning(f"Removed leftover output {path}.")
+
+    def start_worker(self, index: int):
+        process = self.context.Process(
+            target=run_worker,
+            args=(
+                self.metrics_queue,
+                index,
+                next(self.generations),
+                self.metrics_interval,
+            ),
+            name=f"worker-{index}",
+        )
+        process.start()
+        self.workers[index] = process
+        self.started_at[index] = time.monotonic()
+        self.log.info(f"Started worker {index} with process ID {process.pid}.")
+
+    def restart_exited_workers(self):
+        """Restart the workers that exited, after a crash or otherwise."""
+        exited = [
+            index for index, process in self.workers.items() if not process.is_alive()
+        ]
+        if not exited:
+            return
+
+        for index in exited:
+            process = self.workers[index]
+            if time.monotonic() - self.started_at[index] < RESTART_DELAY:
+                continue
+            self.log.error(
+                f"Worker {index} exited with code {process.exitcode}, restarting."
+            )
+            process.close()
+            # Its partial output is orphaned now that the process is gone
+            self.cleanup_orphans()
+            self.start_worker(index)
+
+    def collect_metrics(self, timeout: float = 0):
+        """
+        Keep the latest metrics that each worker reported.
+
+        The metrics of a worker are retired with its final report. A worker
+        that crashed keeps the metrics of its last report.
+        """
+        try:
+            while True:
+                report: WorkerReport = self.metrics_queue.get(timeout=timeout)
+                worker = (report.index, report.generation)
+                if report.final:
+                    self.worker_metrics.pop(worker, None)
+                    self.retired_metrics.update(report.metrics)
+                else:
+                    self.worker_metrics[worker] = report.metrics
+                timeout = 0
+        except Empty:
+            pass
+
+    def get_metrics(self) -> dict[str, int]:
+        """Get the metrics of all workers since the supervisor started."""
+        total = Counter(self.retired_metrics)
+        for metrics in self.worker_metrics.values():
+            total.update(metrics)
+        return dict(total)
+
+    def stop(self, signum, frame):
+        self.running = False
+
+    def run(self):
+        """
+        Start the workers and keep them running until SIGTERM or SIGINT, after
+        which the workers get `shutdown_timeout` seconds to finish.
+        """
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        self.cleanup_orphans()
+        for index in range(self.processes):
+            self.start_worker(index)
+
+        reported_at = time.monotonic()
+        while self.running:
+            self.collect_metrics(timeout=1)
+            self.restart_exited_workers()
+            if time.monotonic() - reported_at >= self.metrics_interval:
+                self.log.info(f"Workers: {self.get_metrics()}")
+                reported_at = time.monotonic()
+
+        for process in self.workers.values():
+            process.terminate()
+        deadline = time.monotonic() + self.shutdown_timeout
+        for index, process in self.workers.items():
+            process.join(max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                self.log.warning(f"Killing worker {index}, it did not stop in time.")
+                process.kill()
+                process.join()
+        self.collect_metrics()
+        self.log.info(f"Workers: {self.get_metrics()}")
+
+
+if __name__ == "__main__":
+    Supervisor().run()
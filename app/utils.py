@@ -1,10 +1,14 @@
-from typing import Any
+from typing import Any, Final, Literal
 from collections.abc import Callable
+from concurrent.futures import Future
+from functools import cache
 from pathlib import Path
 
+from pydantic import TypeAdapter
 import sippy
 
 from . import v2_1
+from .admission import AdmissionController
 
 
 class MediaHavenCreatorError(Exception): ...
@@ -12,6 +16,47 @@ class MediaHavenCreatorError(Exception): ...
 
 type Profile = str
 type Version = str
+type DeserializationMode = Literal["full", "fast"]
+
+# The fields of the SIP that are read while the MediaHaven SIP is created
+SIP_READ_FIELDS: Final = ("profile", "entity", "events", "mets_agents", "mets_type")
+
+
+def deserialize_sip(
+    data: dict[str, Any], mode: DeserializationMode = "full"
+) -> sippy.SIP:
+    """
+    Deserialize the SIP of an incoming event.
+
+    The `full` mode validates the whole SIP. The `fast` mode only validates the
+    fields in `SIP_READ_FIELDS` and leaves the other fields as the raw data,
+    which also skips the validators of the SIP model itself. A fast SIP must
+    therefore not be serialized again.
+    """
+    match mode:
+        case "full":
+            return sippy.SIP.deserialize(data)
+        case "fast":
+            values = {}
+            for name, field in sippy.SIP.model_fields.items():
+                key = field.alias or name
+                if key in data:
+                    values[name] = data[key]
+            for name in SIP_READ_FIELDS:
+                if name in values:
+                    values[name] = get_field_adapter(name).validate_python(values[name])
+            return sippy.SIP.model_construct(**values)
+        case _:
+            raise ValueError(f"Unknown SIP deserialization mode '{mode}'")
+
+
+@cache
+def get_field_adapter(name: str) -> TypeAdapter:
+    """
+    Get the validator of a single field of the SIP, which is built once per
+    process.
+    """
+    return TypeAdapter(sippy.SIP.model_fields[name].annotation)
 
 
 def parse_profile_url(sip: sippy.SIP) -> tuple[Profile, Version]:
@@ -36,7 +81,16 @@ def get_mets_creator(sip: sippy.SIP):
 
 def get_sip_creator(
     sip: sippy.SIP,
-) -> Callable[[sippy.SIP, dict[str, Any], str], tuple[Path, str]]:
+) -> Callable[
+    [
+        sippy.SIP,
+        dict[str, Any],
+        str | Future[str],
+        AdmissionController | None,
+        Path | None,
+    ],
+    tuple[Path, Callable[[], str]],
+]:
     _, version = parse_profile_url(sip)
 
     match version:
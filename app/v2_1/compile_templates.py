@@ -0,0 +1,5 @@
+from .creator import COMPILED_TEMPLATES_PATH, compile_templates
+
+if __name__ == "__main__":
+    compile_templates()
+    print(f"Compiled templates to {COMPILED_TEMPLATES_PATH}")
@@ -1,20 +1,40 @@
+from concurrent.futures import Future
+from contextlib import nullcontext
 from datetime import datetime
+from collections.abc import Callable, Iterator, Sequence
+from functools import cache, partial
 from pathlib import Path
 from typing import Literal
 from typing import Any
-import shutil
-import zipfile
+import hashlib
 
-from jinja2 import Environment, FileSystemLoader
+from jinja2 import Environment, FileSystemLoader, ModuleLoader
+
+from viaa.observability import logging
 
 import sippy
 
-from app.v2_1.langstrings import get_nl_string
+from app.admission import AdmissionController, estimate_output_size
+from app.packaging import (
+    parse_compression_policy,
+    write_sip_folder,
+    write_sip_zip,
+)
+from app.v2_1.langstrings import DEFAULT_LANGUAGES, LangStringResolver
+
+from . import mets_writer, profiles
+
+
+log = logging.get_logger(__name__)
+
+TEMPLATES_PATH = Path(__file__).parent / "templates"
+COMPILED_TEMPLATES_PATH = Path(__file__).parent / "compiled_templates"
 
-from . import profiles
+# The hash of the templates that the compiled modules were compiled from
+TEMPLATES_HASH_FILE = "templates.sha256"
 
 
-def create_mh_sidecar_data(sip: sippy.SIP) -> dict:
+def create_mh_sidecar_data(sip: sippy.SIP, strings: LangStringResolver) -> dict:
     splitted = sip.profile.split("/")
     profile = splitted[-1]
     version = splitted[-2]
@@ -29,19 +49,89 @@ def create_mh_sidecar_data(sip: sippy.SIP) -> dict:
         case _:
             raise ValueError(f"Unsupported profile '{profile}' for version '{version}'")
 
-    return profile_module.get_mh_mapping(sip)
+    return profile_module.get_mh_mapping(sip, strings)
+
+
+@cache
+def get_jinja_environment() -> Environment:
+    """
+    Gets the Jinja environment for the `templates` within the current package.
+
+    The environment, and so its cache of parsed templates, is created once per
+    process. When the templates were precompiled with `compile_templates`, they
+    are loaded from the compiled modules instead of being parsed, unless the
+    templates were changed since.
+    """
+    if is_compiled(COMPILED_TEMPLATES_PATH, TEMPLATES_PATH):
+        loader = ModuleLoader(COMPILED_TEMPLATES_PATH)
+    else:
+        if COMPILED_TEMPLATES_PATH.is_dir():
+            log.warning("The compiled templates are out of date, parsing them.")
+        loader = FileSystemLoader(TEMPLATES_PATH)
+
+    return Environment(loader=loader, autoescape=True, auto_reload=False)
 
 
 def get_jinja_template():
     """
     Gets the `templates/base.jinja` within the current package.
     """
-    templates_path = Path(__file__).parent / "templates"
-    env = Environment(
-        loader=FileSystemLoader(templates_path),
-        autoescape=True,
-    )
-    return env.get_template("base.jinja")
+    return get_jinja_environment().get_template("base.jinja")
+
+
+def get_mets_engine(
+    engine: str,
+) -> tuple[Callable[[dict[str, Any]], str], Callable[[dict[str, Any]], Iterator[str]]]:
+    """
+    Gets the functions that render the METS, as a string and in chunks.
+
+    Args:
+        engine: `jinja` to render the templates, `writer` to write the METS
+            directly with `mets_writer`.
+    """
+    match engine:
+        case "jinja":
+            template = get_jinja_template()
+            return template.render, template.generate
+        case "writer":
+            return mets_writer.render_mets, mets_writer.generate_mets
+        case _:
+            raise ValueError(f"Unsupported METS engine '{engine}'")
+
+
+def compile_templates(
+    target: Path = COMPILED_TEMPLATES_PATH, templates: Path = TEMPLATES_PATH
+):
+    """
+    Compile the `templates` within the current package to Python modules,
+    next to the hash of the templates they were compiled from.
+    """
+    env = Environment(loader=FileSystemLoader(templates), autoescape=True)
+    env.compile_templates(target, zip=None, ignore_errors=False)
+    (target / TEMPLATES_HASH_FILE).write_text(get_templates_hash(templates))
+
+
+def get_templates_hash(templates: Path) -> str:
+    """
+    Get the SHA-256 hash of the names and contents of the templates.
+    """
+    digest = hashlib.sha256()
+    for path in sorted(templates.rglob("*.jinja")):
+        content = path.read_bytes()
+        digest.update(f"{path.relative_to(templates)}\0{len(content)}\0".encode())
+        digest.update(content)
+    return digest.hexdigest()
+
+
+def is_compiled(compiled: Path, templates: Path) -> bool:
+    """
+    Check whether `compiled` holds the modules of the current templates.
+    """
+    try:
+        compiled_hash = (compiled / TEMPLATES_HASH_FILE).read_text()
+    except FileNotFoundError:
+        return False
+    return compiled_hash == get_templates_hash(templates)
 
 
 def create_mh_mets_data(
@@ -49,10 +139,33 @@ def create_mh_mets_data(
     pid: str,
     essence_archive_location: Literal["Disk", "Tape"],
     mh_sidecar_version: str,
+    languages: Sequence[str] = DEFAULT_LANGUAGES,
 ) -> dict[str, Any]:
     """
     Create the data needed to render a METS XML file.
+
+    Language strings are resolved to the first of `languages` they have a
+    value in.
     """
+    mets_data = prepare_mh_mets_data(
+        sip, essence_archive_location, mh_sidecar_version, languages
+    )
+    return assign_pid(mets_data, pid)
+
+
+def prepare_mh_mets_data(
+    sip: sippy.SIP,
+    essence_archive_location: Literal["Disk", "Tape"],
+    mh_sidecar_version: str,
+    languages: Sequence[str] = DEFAULT_LANGUAGES,
+) -> dict[str, Any]:
+    """
+    Create the data needed to render a METS XML file, apart from the PID.
+
+    None of the mapping depends on the PID, so it can be done while the PID is
+    being fetched. The PID is added with `assign_pid`.
+    """
+    strings = LangStringResolver(languages)
 
     profile = str(sip.profile).split("/")[-1]
 
@@ -78,8 +191,9 @@ def create_mh_mets_data(
             file_path = Path(file.stored_at.file_path)
             file_name = file_path.name
 
+            file_is_collateral = is_collateral(profile, file)
             archive_location = (
-                "Disk" if is_collateral(profile, file) else essence_archive_location
+                "Disk" if file_is_collateral else essence_archive_location
             )
 
             files.append(
@@ -92,34 +206,33 @@ def create_mh_mets_data(
                     "archive_location": archive_location,
                     "source_href": file_path,
                     "href": f"representation_{rep_idx}/{file_name}",
+                    "is_collateral": file_is_collateral,
                     #
                     # file DMD section
                     "dmd_id": f"DMDID-{profile.upper()}-REPRESENTATION-{rep_idx}-{file_idx}",
-                    "external_id": f"{pid}_{rep_idx}_{file_idx}",
-                    "pid": pid,
+                    "external_id_suffix": f"{rep_idx}_{file_idx}",
                     "cp_id": sip.entity.maintainer.identifier,
                     "sp_name": "sipin",
                 }
             )
 
-    sidecar = create_mh_sidecar_data(sip)
+    sidecar = create_mh_sidecar_data(sip, strings)
 
     # A meemoo VIDEO SIP with profile "film"
     # should receive the "Basic" record type in mediahaven
     if sip.entity.type == sippy.EntityClass.video:
         profile = "basic"
 
-    events = [transform_event(event) for event in sip.events]
+    events = [transform_event(event, strings) for event in sip.events]
 
     return {
         "mh_sidecar_version": mh_sidecar_version,
         "createdate": datetime.now().isoformat(),
         "profile": profile,
-        "pid": pid,
         "files": files,
         "ie": sip.entity,
-        "dc_title": get_nl_string(sip.entity.name),
-        "cp": get_nl_string(sip.entity.maintainer.pref_label),
+        "dc_title": strings.get_string(sip.entity.name),
+        "cp": strings.get_string(sip.entity.maintainer.pref_label),
         "cp_id": sip.entity.maintainer.identifier,
         "sp_name": "sipin",
         "sp_id": get_service_provider_id(sip),
@@ -130,6 +243,30 @@ def create_mh_mets_data(
     }
 
 
+def assign_pid(mets_data: dict[str, Any], pid: str) -> dict[str, Any]:
+    """
+    Add the PID of the MediaHaven SIP to the data of `prepare_mh_mets_data`.
+    """
+    for file in mets_data["files"]:
+        file["external_id"] = f"{pid}_{file['external_id_suffix']}"
+        file["pid"] = pid
+    mets_data["pid"] = pid
+    return mets_data
+
+
+def check_source_files(files: list[dict[str, Any]]):
+    """
+    Check that all files of the SIP can be read, before anything is written.
+
+    Raises:
+        FileNotFoundError: A file is missing.
+        PermissionError: A file cannot be read.
+    """
+    for file in files:
+        with open(file["source_href"], "rb"):
+            pass
+
+
 def is_collateral(profile: str, file: sippy.File) -> bool:
     # altought this field is optional in the KG datamodels (and sippy),
     # the sipin transformator always copies this value over from the SIP
@@ -147,39 +284,93 @@ def is_collateral(profile: str, file: sippy.File) -> bool:
 
 
 def write_mediahaven_sip(
-    sip: sippy.SIP, config: dict[str, Any], pid: str
-) -> tuple[Path, str]:
+    sip: sippy.SIP,
+    config: dict[str, Any],
+    pid: str | Future[str],
+    admission: AdmissionController | None = None,
+    mets_path: Path | None = None,
+) -> tuple[Path, Callable[[], str]]:
+    """
+    Write the MediaHaven SIP of `sip` as `<pid>.zip` in the AIP folder.
+
+    The PID can be a future of a PID that is still being fetched. It is only
+    waited for after the SIP has been mapped and its files have been checked.
+
+    With an admission controller, the estimated size of the SIP is reserved
+    before it is written, which waits until there is room for it.
+
+    With `stream_mets` enabled, the METS is streamed into the zip while it is
+    rendered and never held in memory as a whole. It is then also streamed
+    into a copy at `mets_path`, which is published before the zip. Otherwise
+    a copy is only written when `mets_path` is given.
+
+    Returns:
+        The path of the MediaHaven SIP (without `.zip`) and a function that
+        loads the METS, from the copy when it was streamed.
+    """
     mh_sidecar_version = config["mh_sidecar_version"]
     aip_folder = config["aip_folder"]
     essence_archive_location = determine_archive_location(sip, config)
-    mets_data = create_mh_mets_data(
-        sip, pid, essence_archive_location, mh_sidecar_version
+    mets_data = prepare_mh_mets_data(
+        sip,
+        essence_archive_location,
+        mh_sidecar_version,
+        languages=config.get("languages", DEFAULT_LANGUAGES),
     )
+    check_source_files(mets_data["files"])
 
-    template = get_jinja_template()
-    mets_xml = template.render(mets_data)
-    mh_sip_path = Path(aip_folder) / pid
-
-    mh_sip_path.mkdir(parents=True, exist_ok=True)
-    mets_file_path = mh_sip_path / "mets.xml"
-    with open(mets_file_path, "w") as mets_file:
-        mets_file.write(mets_xml)
-
-    for file in mets_data["files"]:
-        dest_href = mh_sip_path / Path(file["href"])
-        dest_href.parent.mkdir(parents=True, exist_ok=True)
-        shutil.copyfile(file["source_href"], dest_href)
+    # Cleanup is default, but for testing it is usefull to keep the unzipped SIP
+    should_cleanup = config.get("cleanup_sip", True)
 
-    with zipfile.ZipFile(mh_sip_path.with_suffix(".zip"), "w") as zf:
-        for path in mh_sip_path.rglob("*"):
-            zf.write(path, arcname=path.relative_to(mh_sip_path))
+    reservation = (
+        admission.reserve(
+            estimate_output_size(mets_data["files"], staged=not should_cleanup)
+        )
+        if admission is not None
+        else nullcontext()
+    )
+    with reservation:
+        if isinstance(pid, Future):
+            pid = pid.result()
+        mets_data = assign_pid(mets_data, pid)
+
+        render_mets, generate_mets = get_mets_engine(config.get("mets_engine", "jinja"))
+        mh_sip_path = Path(aip_folder) / pid
+        zip_path = mh_sip_path.with_suffix(".zip")
+
+        if config.get("stream_mets", False):
+            if mets_path is None:
+                raise ValueError("A streamed METS needs `mets_path` for its copy")
+            mets = generate_mets(mets_data)
+            load_mets = partial(mets_path.read_text, encoding="utf-8")
+        else:
+            mets = render_mets(mets_data)
+            load_mets = partial(str, mets)
+
+        write_sip_zip(
+            zip_path,
+            mets,
+            mets_data["files"],
+            verify_fixity=config.get("verify_fixity", False),
+            compression=parse_compression_policy(config.get("compression", {})),
+            workers=config.get("packaging_workers", 1),
+            fsync=config.get("fsync_output", False),
+            mets_copy=mets_path,
+        )
 
-    # Cleanup is default, but for testing it is usefull disable it
-    should_cleanup = config.get("cleanup_sip", True)
-    if should_cleanup:
-        shutil.rmtree(mh_sip_path)
+        if not should_cleanup:
+            staging_strategies = write_sip_folder(
+                mh_sip_path,
+                load_mets(),
+                mets_data["files"],
+                strategy=config.get("staging_strategy", "auto"),
+            )
+            log.info(
+                f"Staged unzipped SIP using {', '.join(sorted(staging_strategies))}.",
+                pid=pid,
+            )
 
-    return mh_sip_path, mets_xml
+    return mh_sip_path, load_mets
 
 
 def determine_archive_location(
@@ -208,7 +399,7 @@ def determine_archive_location(
     return archive_location
 
 
-def transform_event(event: sippy.Event) -> dict[str, Any]:
+def transform_event(event: sippy.Event, strings: LangStringResolver) -> dict[str, Any]:
     return {
         "mets_id": "PREMIS-ID-" + event.id.split("/")[-1],
         "identifier": {
@@ -220,7 +411,7 @@ def transform_event(event: sippy.Event) -> dict[str, Any]:
         "detail": event.note,
         "outcome": map_event_outcome(event.outcome),
         "outcome_note": event.outcome_note,
-        "agents": get_event_agents(event),
+        "agents": get_event_agents(event, strings),
         "objects": get_event_objects(event),
     }
 
@@ -237,11 +428,13 @@ def map_event_outcome(outcome: sippy.URIRef[sippy.EventOutcome] | None) -> str |
             return "fail"
 
 
-def get_event_agents(event: sippy.Event) -> list[dict[str, str]]:
+def get_event_agents(
+    event: sippy.Event, strings: LangStringResolver
+) -> list[dict[str, str]]:
     implementer_agent = [
         {
             "type": "Implementer name",
-            "value": get_nl_string(event.implemented_by.name),
+            "value": strings.get_string(event.implemented_by.name),
             "role": "implementer",
         }
     ]
@@ -249,7 +442,7 @@ def get_event_agents(event: sippy.Event) -> list[dict[str, str]]:
         [
             {
                 "type": "Executing program name",
-                "value": get_nl_string(event.executed_by.name),
+                "value": strings.get_string(event.executed_by.name),
                 "role": "executing program",
             }
         ]
@@ -259,7 +452,7 @@ def get_event_agents(event: sippy.Event) -> list[dict[str, str]]:
     instrument_agents = [
         {
             "type": "Instrument name",
-            "value": get_nl_string(instrument.name),
+            "value": strings.get_string(instrument.name),
             "role": "instrument",
         }
         for instrument in event.instrument
@@ -267,7 +460,7 @@ def get_event_agents(event: sippy.Event) -> list[dict[str, str]]:
     associated_agents = [
         {
             "type": "Agent name",
-            "value": get_nl_string(associated_with.name),
+            "value": strings.get_string(associated_with.name),
             "role": "associated",
         }
         for associated_with in event.was_associated_with
@@ -1,21 +1,62 @@
+from collections.abc import Sequence
+from typing import Final
+
 from sippy import UniqueLangStrings, LangStrings
 
 
-def get_nl_strings(strings: LangStrings | UniqueLangStrings) -> list[str]:
-    return [
-        lang_string.value for lang_string in strings.root if lang_string.lang == "nl"
-    ]
+DEFAULT_LANGUAGES: Final = ("nl",)
+
+
+class MissingLangStringError(ValueError):
+    """Raised when language strings have no value in any of the languages."""
+
+
+class LangStringResolver:
+    """
+    Resolves language strings to the values of the first language of
+    `languages` that has any.
+
+    A resolver is meant to live as long as a single SIP. Every `LangStrings` it
+    sees is indexed by language once, so resolving the same strings again is a
+    lookup instead of a scan.
+    """
+
+    def __init__(self, languages: Sequence[str] = DEFAULT_LANGUAGES):
+        self.languages = tuple(languages)
+        # Keyed on the id of the strings, which are kept alive by the cache entry
+        self._cache: dict[
+            int, tuple[LangStrings | UniqueLangStrings, dict[str, list[str]]]
+        ] = {}
+
+    def index(self, strings: LangStrings | UniqueLangStrings) -> dict[str, list[str]]:
+        cached = self._cache.get(id(strings))
+        if cached is not None and cached[0] is strings:
+            return cached[1]
 
+        index: dict[str, list[str]] = {}
+        for lang_string in strings.root:
+            index.setdefault(lang_string.lang, []).append(lang_string.value)
+        self._cache[id(strings)] = (strings, index)
+        return index
 
-def get_nl_string(strings: LangStrings | UniqueLangStrings) -> str:
-    return next(
-        lang_string.value for lang_string in strings.root if lang_string.lang == "nl"
-    )
+    def get_strings(self, strings: LangStrings | UniqueLangStrings) -> list[str]:
+        index = self.index(strings)
+        for language in self.languages:
+            if language in index:
+                return index[language]
+        return []
 
+    def get_string(self, strings: LangStrings | UniqueLangStrings) -> str:
+        values = self.get_strings(strings)
+        if len(values) == 0:
+            raise MissingLangStringError(
+                f"No value in any of the languages {self.languages} for {strings}."
+            )
+        return values[0]
 
-def get_optional_nl_string(
-    strings: LangStrings | UniqueLangStrings | None,
-) -> str | None:
-    if strings is None:
-        return None
-    return get_nl_string(strings)
+    def get_optional_string(
+        self, strings: LangStrings | UniqueLangStrings | None
+    ) -> str | None:
+        if strings is None:
+            return None
+        return self.get_string(strings)
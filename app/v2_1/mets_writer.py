@@ -0,0 +1,316 @@
+from collections.abc import Iterator
+from typing import Any, Final
+
+
+# Size in characters after which the written XML is handed out as a chunk.
+CHUNK_SIZE = 64 * 1024
+
+INDENT: Final = "  "
+
+METS_NAMESPACES: Final = {
+    "xmlns:mets": "http://www.loc.gov/METS/",
+    "xmlns:premis": "http://www.loc.gov/premis/v3",
+    "xmlns:revtmd": "http://nwtssite.nwts.nara/schema/",
+    "xmlns:viaa": "http://viaa.be",
+    "xmlns:xlink": "http://www.w3.org/1999/xlink",
+    "xmlns:xsi": "http://www.w3.org/2001/XMLSchema-instance",
+    # The newlines are kept as they are in `templates/base.jinja`
+    "xsi:schemaLocation": (
+        "http://www.loc.gov/METS/ http://www.loc.gov/standards/mets/mets.xsd\n"
+        "                      http://nwtssite.nwts.nara/schema/ http://www.archives.gov/preservation/products/reVTMD.xsd\n"
+        "                      info:lc/xmlns/premis-v2 http://www.loc.gov/standards/premis/premis.xsd"
+    ),
+}
+
+STRUCT_MAP_TYPES: Final = {
+    "film": "Film",
+    "basic": "Basic",
+    "material-artwork": "MaterialArtwork",
+}
+
+
+def escape(value: Any) -> str:
+    return (
+        str(value)
+        .replace("&", "&amp;")
+        .replace("<", "&lt;")
+        .replace(">", "&gt;")
+        .replace('"', "&quot;")
+    )
+
+
+def format_attributes(attributes: dict[str, Any]) -> str:
+    return "".join(f' {name}="{escape(value)}"' for name, value in attributes.items())
+
+
+class XmlWriter:
+    """
+    Writes indented XML into a buffer that is handed out in chunks.
+    """
+
+    def __init__(self):
+        self.parts: list[str] = []
+        self.size = 0
+        self.depth = 0
+
+    def write(self, text: str):
+        self.parts.append(text)
+        self.size += len(text)
+
+    def start(self, tag: str, attributes: dict[str, Any] | None = None):
+        attrs = format_attributes(attributes) if attributes else ""
+        self.write(f"{INDENT * self.depth}<{tag}{attrs}>\n")
+        self.depth += 1
+
+    def end(self, tag: str):
+        self.depth -= 1
+        self.write(f"{INDENT * self.depth}</{tag}>\n")
+
+    def element(self, tag: str, text: Any, attributes: dict[str, Any] | None = None):
+        attrs = format_attributes(attributes) if attributes else ""
+        self.write(f"{INDENT * self.depth}<{tag}{attrs}>{escape(text)}</{tag}>\n")
+
+    def empty(self, tag: str, attributes: dict[str, Any] | None = None):
+        attrs = format_attributes(attributes) if attributes else ""
+        self.write(f"{INDENT * self.depth}<{tag}{attrs} />\n")
+
+    def flush(self) -> str:
+        chunk = "".join(self.parts)
+        self.parts.clear()
+        self.size = 0
+        return chunk
+
+    def chunks(self) -> Iterator[str]:
+        """
+        Hand out the buffer when it holds at least `CHUNK_SIZE` characters.
+        """
+        if self.size >= CHUNK_SIZE:
+            yield self.flush()
+
+
+def render_mets(data: dict[str, Any]) -> str:
+    """
+    Write the MediaHaven METS from the data of `create_mh_mets_data`.
+
+    The result is the same XML document as the one rendered by
+    `templates/base.jinja`, apart from insignificant whitespace.
+    """
+    return "".join(generate_mets(data))
+
+
+def generate_mets(data: dict[str, Any]) -> Iterator[str]:
+    """
+    Write the MediaHaven METS from the data of `create_mh_mets_data` in chunks.
+    """
+    w = XmlWriter()
+    w.write("<?xml version='1.0' encoding='UTF-8'?>\n")
+    w.start("mets:mets", METS_NAMESPACES)
+
+    write_header(w, data)
+    yield from write_dmd_sections(w, data)
+    yield from write_amd_sections(w, data)
+    yield from write_file_section(w, data)
+    if data["profile"] in STRUCT_MAP_TYPES:
+        yield from write_struct_map(w, data)
+
+    w.end("mets:mets")
+    yield w.flush()
+
+
+def write_header(w: XmlWriter, data: dict[str, Any]):
+    w.start("mets:metsHdr", {"CREATEDATE": data["createdate"]})
+    w.start("mets:agent", {"ROLE": "CUSTODIAN", "TYPE": "ORGANIZATION"})
+    w.element("mets:name", "meemoo")
+    w.end("mets:agent")
+    w.end("mets:metsHdr")
+
+
+def start_sidecar(w: XmlWriter, id: str, data: dict[str, Any], created: str | None):
+    version = data["mh_sidecar_version"]
+    attributes = {"ID": id}
+    if created is not None:
+        attributes |= {"CREATED": created, "STATUS": "original"}
+
+    w.start("mets:dmdSec", attributes)
+    w.start("mets:mdWrap", {"MDTYPE": "OTHER", "OTHERMDTYPE": "mhs:Sidecar"})
+    w.start("mets:xmlData")
+    w.start(
+        "mhs:Sidecar",
+        {
+            "xmlns:mhs": f"https://zeticon.mediahaven.com/metadata/{version}/mhs/",
+            "xmlns:mh": f"https://zeticon.mediahaven.com/metadata/{version}/mh/",
+            "version": version,
+        },
+    )
+
+
+def end_sidecar(w: XmlWriter):
+    w.end("mhs:Sidecar")
+    w.end("mets:xmlData")
+    w.end("mets:mdWrap")
+    w.end("mets:dmdSec")
+
+
+def write_sidecar_fields(w: XmlWriter, fields: dict[str, Any]):
+    for tag, value in fields.items():
+        if isinstance(value, list) and value:
+            w.start(tag)
+            for item in value:
+                w.element(item[0], item[1])
+            w.end(tag)
+        elif value:
+            w.element(tag, value)
+
+
+def write_dmd_sections(w: XmlWriter, data: dict[str, Any]) -> Iterator[str]:
+    profile = data["profile"].upper()
+    pid = data["pid"]
+    sidecar = data["sidecar"]
+
+    start_sidecar(w, f"DMDID-{profile}", data, data["createdate"])
+    w.start("mhs:Administrative")
+    w.element("mh:ExternalId", pid)
+    w.end("mhs:Administrative")
+    w.start("mhs:Descriptive")
+    write_sidecar_fields(w, sidecar["Descriptive"])
+    w.end("mhs:Descriptive")
+    w.start("mhs:Dynamic")
+    write_sidecar_fields(w, sidecar["Dynamic"])
+    w.element("dc_title", data["dc_title"])
+    w.element("PID", pid)
+    w.element("CP", data["cp"])
+    w.element("CP_id", data["cp_id"])
+    w.element("sp_name", data["sp_name"])
+    w.element("sp_id", data["sp_id"])
+    w.end("mhs:Dynamic")
+    end_sidecar(w)
+
+    start_sidecar(w, f"DMDID-{profile}-METS", data, "2023-11-20T21:44:28")
+    w.start("mhs:Administrative")
+    w.element("mh:ExternalId", f"{pid}_mets")
+    w.end("mhs:Administrative")
+    w.start("mhs:Descriptive")
+    w.element("mh:Title", f"{pid}_mets")
+    w.end("mhs:Descriptive")
+    end_sidecar(w)
+
+    for file in data["files"]:
+        start_sidecar(w, file["dmd_id"], data, None)
+        w.start("mhs:Administrative")
+        w.element("mh:ExternalId", file["external_id"])
+        w.end("mhs:Administrative")
+        w.start("mhs:Descriptive")
+        w.element("mh:OriginalFilename", file["original_name"])
+        w.end("mhs:Descriptive")
+        w.start("mhs:Dynamic")
+        w.element("PID", file["pid"])
+        w.element("CP_id", file["cp_id"])
+        w.element("sp_name", file["sp_name"])
+        w.end("mhs:Dynamic")
+        end_sidecar(w)
+        yield from w.chunks()
+
+
+def write_amd_sections(w: XmlWriter, data: dict[str, Any]) -> Iterator[str]:
+    w.start("mets:amdSec", {"ID": "EVENTS"})
+    for event in data["events"]:
+        w.start("mets:digiprovMD", {"ID": event["mets_id"]})
+        w.start("mets:mdWrap", {"MDTYPE": "PREMIS:EVENT"})
+        w.start("mets:xmlData")
+        w.start("premis:event")
+
+        w.start("premis:eventIdentifier")
+        w.element("premis:eventIdentifierType", event["identifier"]["type"])
+        w.element("premis:eventIdentifierValue", event["identifier"]["value"])
+        w.end("premis:eventIdentifier")
+        w.element("premis:eventType", event["type"])
+        w.element("premis:eventDateTime", event["datetime"])
+
+        if event["detail"]:
+            w.start("premis:eventDetailInformation")
+            w.element("premis:eventDetail", event["detail"])
+            w.end("premis:eventDetailInformation")
+
+        if event["outcome"] or event["outcome_note"]:
+            w.start("premis:eventOutcomeInformation")
+            if event["outcome"]:
+                w.element("premis:eventOutcome", event["outcome"])
+            if event["outcome_note"]:
+                w.start("premis:eventOutcomeDetail")
+                w.element("premis:eventOutcomeDetailNote", event["outcome_note"])
+                w.end("premis:eventOutcomeDetail")
+            w.end("premis:eventOutcomeInformation")
+
+        for agent in event["agents"]:
+            w.start("premis:linkingAgentIdentifier")
+            w.element("premis:linkingAgentIdentifierType", agent["type"])
+            w.element("premis:linkingAgentIdentifierValue", agent["value"])
+            if agent["role"]:
+                w.element("premis:linkingAgentRole", agent["role"])
+            w.end("premis:linkingAgentIdentifier")
+
+        for object in event["objects"]:
+            w.start("premis:linkingObjectIdentifier")
+            w.element("premis:linkingObjectIdentifierType", object["type"])
+            w.element("premis:linkingObjectIdentifierValue", object["value"])
+            if object["role"]:
+                w.element("premis:linkingObjectRole", object["role"])
+            w.end("premis:linkingObjectIdentifier")
+
+        w.end("premis:event")
+        w.end("mets:xmlData")
+        w.end("mets:mdWrap")
+        w.end("mets:digiprovMD")
+        yield from w.chunks()
+    w.end("mets:amdSec")
+
+
+def write_file_section(w: XmlWriter, data: dict[str, Any]) -> Iterator[str]:
+    w.start("mets:fileSec")
+    w.start("mets:fileGrp", {"USE": "Original"})
+    for file in data["files"]:
+        w.start(
+            "mets:file",
+            {
+                "ID": file["id"],
+                "CHECKSUM": file["checksum"],
+                "CHECKSUMTYPE": "MD5",
+                "USE": file["archive_location"],
+            },
+        )
+        w.empty("mets:FLocat", {"xlink:href": file["href"], "LOCTYPE": "URL"})
+        w.end("mets:file")
+        yield from w.chunks()
+
+    w.start("mets:file", {"ID": "FILEID-METS", "USE": "Disk"})
+    w.empty("mets:FLocat", {"xlink:href": "mets.xml", "LOCTYPE": "URL"})
+    w.end("mets:file")
+    w.end("mets:fileGrp")
+    w.end("mets:fileSec")
+
+
+def write_struct_map(w: XmlWriter, data: dict[str, Any]) -> Iterator[str]:
+    profile = data["profile"]
+    attributes = {
+        "TYPE": STRUCT_MAP_TYPES[profile],
+        "DMDID": f"DMDID-{profile.upper()}",
+    }
+    if data["amdid"] != "":
+        attributes["ADMID"] = data["amdid"]
+
+    w.start("mets:structMap")
+    w.start("mets:div", attributes)
+    w.start("mets:div", {"TYPE": "Media", "DMDID": f"DMDID-{profile.upper()}-METS"})
+    w.start("mets:div", {"TYPE": "Representation", "LABEL": "Original"})
+    w.empty("mets:fptr", {"FILEID": "FILEID-METS"})
+    w.end("mets:div")
+    w.end("mets:div")
+    for file in data["files"]:
+        w.start("mets:div", {"TYPE": "Media", "DMDID": file["dmd_id"]})
+        w.start("mets:div", {"TYPE": "Representation", "LABEL": "Original"})
+        w.empty("mets:fptr", {"FILEID": file["id"]})
+        w.end("mets:div")
+        w.end("mets:div")
+        yield from w.chunks()
+    w.end("mets:div")
+    w.end("mets:structMap")
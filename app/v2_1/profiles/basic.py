@@ -1,15 +1,16 @@
-from typing import Any
+from typing import Any, Final
 
 from sippy import SIP
 
 from . import common
-from . import helpers
+from .helpers import MappingPlan
+from ..langstrings import LangStringResolver
 
 
-def get_mh_mapping(sip: SIP) -> dict[str, Any]:
-    common_fields = common.get_mh_mapping(sip)
-    basic_fields = {
-        "Dynamic": {},
-    }
+PLAN: Final = MappingPlan(common.FIELDS)
 
-    return helpers.deepmerge(common_fields, basic_fields)
+
+def get_mh_mapping(
+    sip: SIP, strings: LangStringResolver | None = None
+) -> dict[str, Any]:
+    return PLAN.evaluate(common.MappingContext(sip, strings))
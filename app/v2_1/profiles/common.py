@@ -1,3 +1,5 @@
+from collections.abc import Iterable
+from functools import cached_property
 from typing import Any, Final
 from urllib.parse import urlparse
 from pathlib import Path
@@ -5,7 +7,8 @@ from datetime import datetime
 
 import sippy
 
-from ..langstrings import get_nl_string, get_nl_strings, get_optional_nl_string
+from ..langstrings import LangStringResolver
+from .helpers import Field, MappingPlan
 
 registration_event_id: Final = "https://data.hetarchief.be/id/event-type/registration"
 inspection_event_id: Final = "https://data.hetarchief.be/id/event-type/inspection"
@@ -18,67 +21,176 @@ quality_control_event_id: Final = (
 )
 
 
-def get_mh_mapping(sip: sippy.SIP) -> dict[str, Any]:
-    ie = sip.entity
-
-    mapping = {
-        "Descriptive": {
-            "mh:Title": get_nl_string(ie.name),
-            "mh:Description": get_optional_nl_string(ie.description),
-        },
-        "Dynamic": {
-            "dc_title": get_nl_string(ie.name),
-            "dc_description": get_optional_nl_string(ie.description),
-            "dcterms_created": ie.date_created.value,
-            "dcterms_issued": ie.date_published.value if ie.date_published else None,
-            "dc_rights_rightsOwners": [
-                ("Auteursrechthouder", get_nl_string(owner.name))
-                for owner in ie.copyright_holder
-            ],
-            "dc_subjects": get_dc_subjects(ie),
-            "dc_identifier_localid": get_dc_identifier_localid(ie),
-            "dc_identifier_localids": get_dc_identifier_localids(ie),
-            "dc_languages": [("multiselect", lang) for lang in ie.in_language],
-            "dc_titles": get_dc_titles(ie),
-            "dc_creators": get_creators(ie),
-            "dc_contributors": get_contributors(ie),
-            "dc_publishers": get_publishers(ie),
-            "dc_types": get_dc_types(ie),
-            "dc_coverages": get_coverages(ie),
-            "artmedium": get_optional_nl_string(ie.art_medium),
-            "artform": get_optional_nl_string(ie.artform),
-            "dc_rights_credit": get_optional_nl_string(ie.credit_text),
-            "dc_rights_comment": get_optional_nl_string(ie.rights),
-            "dc_rights_licenses": get_licenses(sip),
-            "dimensions": get_dimensions(ie),
-            "created_on": get_event_date(sip, registration_event_id),
-            #
-            # Premis events
-            "inspection_date": get_event_date(sip, inspection_event_id),
-            "inspection_outcome": get_event_outcome(sip, inspection_event_id),
-            "inspection_note": get_event_note(sip, inspection_event_id),
-            "repair_date": get_event_date(sip, repair_event_id),
-            "repair_outcome": get_event_outcome(sip, repair_event_id),
-            "repair_note": get_event_note(sip, repair_event_id),
-            "cleaning_date": get_event_date(sip, cleaning_event_id),
-            "cleaning_outcome": get_event_outcome(sip, cleaning_event_id),
-            "cleaning_note": get_event_note(sip, cleaning_event_id),
-            "baking_date": get_event_date(sip, baking_event_id),
-            "baking_outcome": get_event_outcome(sip, baking_event_id),
-            "baking_note": get_event_note(sip, baking_event_id),
-            "digitization_date": get_event_date(sip, digitization_event_id),
-            "digitization_time": get_event_time(sip, digitization_event_id),
-            "digitization_outcome": get_event_outcome(sip, digitization_event_id),
-            "digitization_note": get_event_note(sip, digitization_event_id),
-            "qc_date": get_event_date(sip, quality_control_event_id),
-            "qc_outcome": get_event_outcome(sip, quality_control_event_id),
-            "qc_note": get_event_note(sip, quality_control_event_id),
-            "qc_by": get_event_implementer(sip, quality_control_event_id),
-            "ContentCategory": sip.mets_type,
-        },
-    }
-
-    return mapping
+class IndexedEvent:
+    """
+    An event in the index, of which the start is only parsed when it is used,
+    so a malformed start of an event that is never looked up is ignored.
+    """
+
+    def __init__(self, event: sippy.Event):
+        self.event = event
+
+    @cached_property
+    def started_at(self) -> datetime:
+        return datetime.fromisoformat(self.event.started_at_time.value)
+
+
+type EventIndex = dict[str, IndexedEvent]
+
+
+def get_event_index(events: Iterable[sippy.Event]) -> EventIndex:
+    """
+    Index the first event of every event type.
+
+    The index is built once per SIP, so looking up an event type does not scan
+    all events of the SIP.
+    """
+    index: EventIndex = {}
+    for event in events:
+        if event.type not in index:
+            index[event.type] = IndexedEvent(event)
+    return index
+
+
+class MappingContext:
+    """
+    The SIP that is being mapped, with the lookups its fields share.
+    """
+
+    def __init__(self, sip: sippy.SIP, strings: LangStringResolver | None = None):
+        self.sip = sip
+        self.ie = sip.entity
+        self.strings = strings if strings is not None else LangStringResolver()
+
+    @cached_property
+    def events(self) -> EventIndex:
+        return get_event_index(self.sip.events)
+
+
+def event_fields(prefix: str, event_type: str) -> list[Field]:
+    return [
+        Field(
+            "Dynamic", f"{prefix}_date", lambda c: get_event_date(c.events, event_type)
+        ),
+        Field(
+            "Dynamic",
+            f"{prefix}_outcome",
+            lambda c: get_event_outcome(c.events, event_type),
+        ),
+        Field(
+            "Dynamic", f"{prefix}_note", lambda c: get_event_note(c.events, event_type)
+        ),
+    ]
+
+
+FIELDS: Final[list[Field]] = [
+    Field("Descriptive", "mh:Title", lambda c: c.strings.get_string(c.ie.name)),
+    Field(
+        "Descriptive",
+        "mh:Description",
+        lambda c: c.strings.get_optional_string(c.ie.description),
+    ),
+    Field("Dynamic", "dc_title", lambda c: c.strings.get_string(c.ie.name)),
+    Field(
+        "Dynamic",
+        "dc_description",
+        lambda c: c.strings.get_optional_string(c.ie.description),
+    ),
+    Field("Dynamic", "dcterms_created", lambda c: c.ie.date_created.value),
+    Field(
+        "Dynamic",
+        "dcterms_issued",
+        lambda c: c.ie.date_published.value if c.ie.date_published else None,
+    ),
+    Field(
+        "Dynamic",
+        "dc_rights_rightsOwners",
+        lambda c: [
+            ("Auteursrechthouder", c.strings.get_string(owner.name))
+            for owner in c.ie.copyright_holder
+        ],
+    ),
+    Field("Dynamic", "dc_subjects", lambda c: get_dc_subjects(c.ie, c.strings)),
+    Field(
+        "Dynamic", "dc_identifier_localid", lambda c: get_dc_identifier_localid(c.ie)
+    ),
+    Field(
+        "Dynamic", "dc_identifier_localids", lambda c: get_dc_identifier_localids(c.ie)
+    ),
+    Field(
+        "Dynamic",
+        "dc_languages",
+        lambda c: [("multiselect", lang) for lang in c.ie.in_language],
+    ),
+    Field("Dynamic", "dc_titles", lambda c: get_dc_titles(c.ie, c.strings)),
+    Field("Dynamic", "dc_creators", lambda c: get_creators(c.ie, c.strings)),
+    Field("Dynamic", "dc_contributors", lambda c: get_contributors(c.ie, c.strings)),
+    Field("Dynamic", "dc_publishers", lambda c: get_publishers(c.ie, c.strings)),
+    Field("Dynamic", "dc_types", lambda c: get_dc_types(c.ie, c.strings)),
+    Field("Dynamic", "dc_coverages", lambda c: get_coverages(c.ie, c.strings)),
+    Field(
+        "Dynamic", "artmedium", lambda c: c.strings.get_optional_string(c.ie.art_medium)
+    ),
+    Field("Dynamic", "artform", lambda c: c.strings.get_optional_string(c.ie.artform)),
+    Field(
+        "Dynamic",
+        "dc_rights_credit",
+        lambda c: c.strings.get_optional_string(c.ie.credit_text),
+    ),
+    Field(
+        "Dynamic",
+        "dc_rights_comment",
+        lambda c: c.strings.get_optional_string(c.ie.rights),
+    ),
+    Field("Dynamic", "dc_rights_licenses", lambda c: get_licenses(c.sip, c.strings)),
+    Field("Dynamic", "dimensions", lambda c: get_dimensions(c.ie)),
+    Field(
+        "Dynamic",
+        "created_on",
+        lambda c: get_event_date(c.events, registration_event_id),
+    ),
+    #
+    # Premis events
+    *event_fields("inspection", inspection_event_id),
+    *event_fields("repair", repair_event_id),
+    *event_fields("cleaning", cleaning_event_id),
+    *event_fields("baking", baking_event_id),
+    Field(
+        "Dynamic",
+        "digitization_date",
+        lambda c: get_event_date(c.events, digitization_event_id),
+    ),
+    Field(
+        "Dynamic",
+        "digitization_time",
+        lambda c: get_event_time(c.events, digitization_event_id),
+    ),
+    Field(
+        "Dynamic",
+        "digitization_outcome",
+        lambda c: get_event_outcome(c.events, digitization_event_id),
+    ),
+    Field(
+        "Dynamic",
+        "digitization_note",
+        lambda c: get_event_note(c.events, digitization_event_id),
+    ),
+    *event_fields("qc", quality_control_event_id),
+    Field(
+        "Dynamic",
+        "qc_by",
+        lambda c: get_event_implementer(c.events, quality_control_event_id, c.strings),
+    ),
+    Field("Dynamic", "ContentCategory", lambda c: c.sip.mets_type),
+]
+
+PLAN: Final = MappingPlan(FIELDS)
+
+
+def get_mh_mapping(
+    sip: sippy.SIP, strings: LangStringResolver | None = None
+) -> dict[str, Any]:
+    return PLAN.evaluate(MappingContext(sip, strings))
 
 
 def quantitive_value_to_millimetres(
@@ -114,7 +226,7 @@ def get_dimensions(ie: sippy.IntellectualEntity) -> list[tuple[str, str]]:
     return [dim for dim in dimensions if dim[1] is not None]  # pyright: ignore[reportReturnType]
 
 
-def get_licenses(sip: sippy.SIP) -> list[tuple[str, str]]:
+def get_licenses(sip: sippy.SIP, strings: LangStringResolver) -> list[tuple[str, str]]:
     if len(sip.entity.license) == 0:
         return [
             ("multiselect", "VIAA-ONDERWIJS"),
@@ -127,7 +239,7 @@ def get_licenses(sip: sippy.SIP) -> list[tuple[str, str]]:
         ]
 
     concepts = [
-        ("multiselect", get_nl_string(license.pref_label))
+        ("multiselect", strings.get_string(license.pref_label))
         for license in sip.entity.license
         if isinstance(license, sippy.Concept)
     ]
@@ -159,20 +271,24 @@ def get_local_id_type(local_id: sippy.LocalIdentifier) -> str:
     return Path(urlparse(local_id_url).path).name
 
 
-def get_creators(entity: sippy.IntellectualEntity) -> list[tuple[str, str]] | None:
+def get_creators(
+    entity: sippy.IntellectualEntity, strings: LangStringResolver
+) -> list[tuple[str, str]] | None:
     creators = [
-        (creator.role_name, get_nl_string(creator.creator.name))
+        (creator.role_name, strings.get_string(creator.creator.name))
         for creator in entity.creator
         if creator.creator
     ]
     return creators if len(creators) > 0 else None
 
 
-def get_contributors(entity: sippy.IntellectualEntity) -> list[tuple[str, str]] | None:
+def get_contributors(
+    entity: sippy.IntellectualEntity, strings: LangStringResolver
+) -> list[tuple[str, str]] | None:
     contributors = [
         (
             contributor.role_name,
-            get_nl_string(contributor.contributor.name),
+            strings.get_string(contributor.contributor.name),
         )
         for contributor in entity.contributor
         if contributor.contributor
@@ -181,11 +297,13 @@ def get_contributors(entity: sippy.IntellectualEntity) -> list[tuple[str, str]]
     return contributors if len(contributors) > 0 else None
 
 
-def get_publishers(entity: sippy.IntellectualEntity) -> list[tuple[str, str]] | None:
+def get_publishers(
+    entity: sippy.IntellectualEntity, strings: LangStringResolver
+) -> list[tuple[str, str]] | None:
     publishers = [
         (
             publisher.role_name,
-            get_nl_string(publisher.publisher.name),
+            strings.get_string(publisher.publisher.name),
         )
         for publisher in entity.publisher
         if publisher.publisher
@@ -194,10 +312,12 @@ def get_publishers(entity: sippy.IntellectualEntity) -> list[tuple[str, str]] |
     return publishers if len(publishers) > 0 else None
 
 
-def get_coverages(entity: sippy.IntellectualEntity) -> list[tuple[str, str]] | None:
-    spatial = [("ruimte", get_nl_string(ruimte.name)) for ruimte in entity.spatial]
+def get_coverages(
+    entity: sippy.IntellectualEntity, strings: LangStringResolver
+) -> list[tuple[str, str]] | None:
+    spatial = [("ruimte", strings.get_string(ruimte.name)) for ruimte in entity.spatial]
     temporal = (
-        [("tijd", tijd) for tijd in get_nl_strings(entity.temporal)]
+        [("tijd", tijd) for tijd in strings.get_strings(entity.temporal)]
         if entity.temporal
         else []
     )
@@ -206,50 +326,45 @@ def get_coverages(entity: sippy.IntellectualEntity) -> list[tuple[str, str]] | N
     return coverages if len(coverages) > 0 else None
 
 
-def get_dc_types(entity: sippy.IntellectualEntity) -> list[tuple[str, str]] | None:
+def get_dc_types(
+    entity: sippy.IntellectualEntity, strings: LangStringResolver
+) -> list[tuple[str, str]] | None:
     return (
-        [("multiselect", genre) for genre in get_nl_strings(entity.genre)]
+        [("multiselect", genre) for genre in strings.get_strings(entity.genre)]
         if entity.genre
         else None
     )
 
 
-def get_dc_subjects(entity: sippy.IntellectualEntity) -> list[tuple[str, str]] | None:
+def get_dc_subjects(
+    entity: sippy.IntellectualEntity, strings: LangStringResolver
+) -> list[tuple[str, str]] | None:
     return (
-        [("Trefwoord", trefwoord) for trefwoord in get_nl_strings(entity.keywords)]
+        [("Trefwoord", trefwoord) for trefwoord in strings.get_strings(entity.keywords)]
         if entity.keywords
         else None
     )
 
 
-def get_event_with_type(
-    sip: sippy.SIP, event_type: sippy.EventClass
-) -> sippy.Event | None:
-    for event in sip.events:
-        if event.type == event_type:
-            return event
-
-    return None
-
-
-def get_event_date(sip: sippy.SIP, event_type: sippy.EventClass) -> str | None:
-    event = get_event_with_type(sip, event_type)
-    if event is None:
+def get_event_date(events: EventIndex, event_type: sippy.EventClass) -> str | None:
+    indexed = events.get(event_type)
+    if indexed is None:
         return None
-    return datetime.fromisoformat(event.started_at_time.value).date().isoformat()
+    return indexed.started_at.date().isoformat()
 
 
-def get_event_time(sip: sippy.SIP, event_type: sippy.EventClass) -> str | None:
-    event = get_event_with_type(sip, event_type)
-    if event is None:
+def get_event_time(events: EventIndex, event_type: sippy.EventClass) -> str | None:
+    indexed = events.get(event_type)
+    if indexed is None:
         return None
-    return datetime.fromisoformat(event.started_at_time.value).time().isoformat()
+    return indexed.started_at.time().isoformat()
 
 
-def get_event_outcome(sip: sippy.SIP, event_type: sippy.EventClass) -> str | None:
-    event = get_event_with_type(sip, event_type)
-    if event is None:
+def get_event_outcome(events: EventIndex, event_type: sippy.EventClass) -> str | None:
+    indexed = events.get(event_type)
+    if indexed is None:
         return None
+    event = indexed.event
     if event.outcome is None:
         return "n"
 
@@ -262,57 +377,60 @@ def get_event_outcome(sip: sippy.SIP, event_type: sippy.EventClass) -> str | Non
             return "y"
 
 
-def get_event_note(sip: sippy.SIP, event_type: sippy.EventClass) -> str | None:
-    event = get_event_with_type(sip, event_type)
-    if event is None:
+def get_event_note(events: EventIndex, event_type: sippy.EventClass) -> str | None:
+    indexed = events.get(event_type)
+    if indexed is None:
         return None
-    return event.note
+    return indexed.event.note
 
 
-def get_quality_control_by(sip: sippy.SIP, event_type: sippy.EventClass) -> str | None:
-    event = get_event_with_type(sip, event_type)
-    if event is None:
-        return None
-    return get_nl_string(event.implemented_by.name)
+def get_quality_control_by(
+    events: EventIndex, event_type: sippy.EventClass, strings: LangStringResolver
+) -> str | None:
+    return get_event_implementer(events, event_type, strings)
 
 
-def get_event_implementer(sip: sippy.SIP, event_type: sippy.EventClass) -> str | None:
-    event = get_event_with_type(sip, event_type)
-    if event is None:
+def get_event_implementer(
+    events: EventIndex, event_type: sippy.EventClass, strings: LangStringResolver
+) -> str | None:
+    indexed = events.get(event_type)
+    if indexed is None:
         return None
-    return get_nl_string(event.implemented_by.name)
+    return strings.get_string(indexed.event.implemented_by.name)
 
 
-def get_dc_titles(ie: sippy.IntellectualEntity) -> list[tuple[str, str]]:
+def get_dc_titles(
+    ie: sippy.IntellectualEntity, strings: LangStringResolver
+) -> list[tuple[str, str]]:
     titles: list[tuple[str, str]] = []
 
     if ie.alternative_name:
-        alternative = get_nl_string(ie.alternative_name)
+        alternative = strings.get_string(ie.alternative_name)
         titles.append(("alternatief", alternative))
 
     for item in ie.schema_is_part_of:
         match item:
             case sippy.BroadcastEvent():
-                titles.append(("programma", get_nl_string(item.name)))
+                titles.append(("programma", strings.get_string(item.name)))
             case sippy.Newspaper():
                 # Dit heeft geen mapping nodig naar dc_titles
                 pass
             case sippy.CreativeWorkSeason():
-                titles.append(("seizoen", get_nl_string(item.name)))
+                titles.append(("seizoen", strings.get_string(item.name)))
             case sippy.CreativeWorkSeries():
-                titles.append(("serie", get_nl_string(item.name)))
+                titles.append(("serie", strings.get_string(item.name)))
             case sippy.ArchiveComponent():
-                titles.append(("archief", get_nl_string(item.name)))
+                titles.append(("archief", strings.get_string(item.name)))
                 sub_archives = [
                     sub
                     for sub in item.has_part
                     if isinstance(sub, sippy.ArchiveComponent)
                 ]
                 for sub_archive in sub_archives:
-                    titles.append(("deelarchief", get_nl_string(sub_archive.name)))
+                    titles.append(("deelarchief", strings.get_string(sub_archive.name)))
 
             case sippy.Episode():
-                titles.append(("aflevering", get_nl_string(item.name)))
+                titles.append(("aflevering", strings.get_string(item.name)))
             case sippy.CreativeWork():
                 # Dit heeft geen mapping nodig naar dc_titles
                 pass
@@ -1,63 +1,122 @@
-from typing import Any, Literal
+from typing import Any, Final, Literal
+from functools import cached_property
 from itertools import chain
 
 import sippy
 
 
 from . import common
-from . import helpers
-
-from .common import get_nl_string
-
-
-def get_mh_mapping(sip: sippy.SIP) -> dict[str, Any]:
-    carrier_rep = get_carrier_representation(sip.entity)
-    first_physical_carrier = get_first_physical_carrier(carrier_rep)
-    common_fields = common.get_mh_mapping(sip)
-
-    fields = {
-        "Dynamic": {
-            #
-            # Carrier representation
-            "num_reels": get_number_of_reels(carrier_rep),
-            #
-            # Intellectual entity
-            "type_viaa": sip.entity.format.value,
-            "image_sound": get_image_sound(sip.entity),
-            #
-            # Physical carrier
-            "preservation_problems": get_preservation_problems(first_physical_carrier),
-            "film_base": get_film_base(first_physical_carrier),
-            "dc_description_cast": get_cast(sip.entity),
-            "subtitles": get_subtitles(first_physical_carrier),
-            "language_subtitles": get_language_subtitles(first_physical_carrier),
-            "original_location": get_original_location(first_physical_carrier),
-            "format": get_format(first_physical_carrier),
-            "format_version": get_format_version(first_physical_carrier),
-            "carrier_barcode": get_carrier_barcode(first_physical_carrier),
-            "original_carrier_id": common.get_dc_identifier_localid(sip.entity),
-            "date": sip.entity.date_created.value,
-            #
-            # Image and audio reels
-            "gauge": get_format_version(first_physical_carrier),
-            "material_type": get_material_type(first_physical_carrier),
-            "aspect_ratio": get_aspect_ratio(first_physical_carrier),
-            "brand_of_film_stock": get_brand_of_film_stock(first_physical_carrier),
-            #
-            # Image Reel
-            "color_or_bw": get_color_or_bw(first_physical_carrier),
-            "barcode_image_reels": get_barcode_image_reels(carrier_rep),
-            "barcode_sound_reels": get_barcode_audio_reels(carrier_rep),
-            "batch_pickup_date": common.get_event_date(
-                sip, "https://data.hetarchief.be/id/event-type/check-out"
-            ),
-            #
-            # Video
-            "brand": get_brand(first_physical_carrier),
-        },
-    }
-
-    return helpers.deepmerge(fields, common_fields)
+from .helpers import Field, MappingPlan
+from ..langstrings import LangStringResolver
+
+
+class FilmContext(common.MappingContext):
+    @cached_property
+    def carrier_representation(self) -> sippy.CarrierRepresentation:
+        return get_carrier_representation(self.ie)
+
+    @cached_property
+    def first_physical_carrier(self) -> sippy.AnyPhysicalCarrier | None:
+        return get_first_physical_carrier(self.carrier_representation)
+
+
+FIELDS: Final[list[Field]] = [
+    #
+    # Carrier representation
+    Field(
+        "Dynamic", "num_reels", lambda c: get_number_of_reels(c.carrier_representation)
+    ),
+    #
+    # Intellectual entity
+    Field("Dynamic", "type_viaa", lambda c: c.ie.format.value),
+    Field("Dynamic", "image_sound", lambda c: get_image_sound(c.ie)),
+    #
+    # Physical carrier
+    Field(
+        "Dynamic",
+        "preservation_problems",
+        lambda c: get_preservation_problems(c.first_physical_carrier, c.strings),
+    ),
+    Field("Dynamic", "film_base", lambda c: get_film_base(c.first_physical_carrier)),
+    Field("Dynamic", "dc_description_cast", lambda c: get_cast(c.ie)),
+    Field("Dynamic", "subtitles", lambda c: get_subtitles(c.first_physical_carrier)),
+    Field(
+        "Dynamic",
+        "language_subtitles",
+        lambda c: get_language_subtitles(c.first_physical_carrier),
+    ),
+    Field(
+        "Dynamic",
+        "original_location",
+        lambda c: get_original_location(c.first_physical_carrier),
+    ),
+    Field("Dynamic", "format", lambda c: get_format(c.first_physical_carrier)),
+    Field(
+        "Dynamic",
+        "format_version",
+        lambda c: get_format_version(c.first_physical_carrier),
+    ),
+    Field(
+        "Dynamic",
+        "carrier_barcode",
+        lambda c: get_carrier_barcode(c.first_physical_carrier),
+    ),
+    Field(
+        "Dynamic",
+        "original_carrier_id",
+        lambda c: common.get_dc_identifier_localid(c.ie),
+    ),
+    Field("Dynamic", "date", lambda c: c.ie.date_created.value),
+    #
+    # Image and audio reels
+    Field("Dynamic", "gauge", lambda c: get_format_version(c.first_physical_carrier)),
+    Field(
+        "Dynamic",
+        "material_type",
+        lambda c: get_material_type(c.first_physical_carrier),
+    ),
+    Field(
+        "Dynamic", "aspect_ratio", lambda c: get_aspect_ratio(c.first_physical_carrier)
+    ),
+    Field(
+        "Dynamic",
+        "brand_of_film_stock",
+        lambda c: get_brand_of_film_stock(c.first_physical_carrier, c.strings),
+    ),
+    #
+    # Image Reel
+    Field(
+        "Dynamic", "color_or_bw", lambda c: get_color_or_bw(c.first_physical_carrier)
+    ),
+    Field(
+        "Dynamic",
+        "barcode_image_reels",
+        lambda c: get_barcode_image_reels(c.carrier_representation),
+    ),
+    Field(
+        "Dynamic",
+        "barcode_sound_reels",
+        lambda c: get_barcode_audio_reels(c.carrier_representation),
+    ),
+    Field(
+        "Dynamic",
+        "batch_pickup_date",
+        lambda c: common.get_event_date(
+            c.events, "https://data.hetarchief.be/id/event-type/check-out"
+        ),
+    ),
+    #
+    # Video
+    Field("Dynamic", "brand", lambda c: get_brand(c.first_physical_carrier, c.strings)),
+]
+
+PLAN: Final = MappingPlan(FIELDS, common.FIELDS)
+
+
+def get_mh_mapping(
+    sip: sippy.SIP, strings: LangStringResolver | None = None
+) -> dict[str, Any]:
+    return PLAN.evaluate(FilmContext(sip, strings))
 
 
 def get_original_location(carrier: sippy.AnyPhysicalCarrier | None) -> str | None:
@@ -104,12 +163,14 @@ def get_number_of_reels(rep: sippy.CarrierRepresentation) -> int | None:
 
 
 def get_preservation_problems(
-    carrier: sippy.AnyPhysicalCarrier | None,
+    carrier: sippy.AnyPhysicalCarrier | None, strings: LangStringResolver
 ) -> list[tuple[str, str]] | None:
     if carrier is None:
         return None
 
-    problems = [get_nl_string(prob.pref_label) for prob in carrier.preservation_problem]
+    problems = [
+        strings.get_string(prob.pref_label) for prob in carrier.preservation_problem
+    ]
     return [("multiselect", problem) for problem in problems]
 
 
@@ -194,21 +255,25 @@ def get_format(carrier: sippy.AnyPhysicalCarrier | None) -> str | None:
     return None
 
 
-def get_brand_of_film_stock(carrier: sippy.AnyPhysicalCarrier | None) -> str | None:
+def get_brand_of_film_stock(
+    carrier: sippy.AnyPhysicalCarrier | None, strings: LangStringResolver
+) -> str | None:
     if not isinstance(carrier, (sippy.ImageReel, sippy.AudioReel)):
         return None
     if carrier.brand is None:
         return None
-    return get_nl_string(carrier.brand.name)
+    return strings.get_string(carrier.brand.name)
 
 
-def get_brand(carrier: sippy.AnyPhysicalCarrier | None) -> str | None:
+def get_brand(
+    carrier: sippy.AnyPhysicalCarrier | None, strings: LangStringResolver
+) -> str | None:
     # brand is only for video (which uses hasip:physicalCarrier), brand_of_film_stock is for film
     if not isinstance(carrier, sippy.PhysicalCarrier):
         return None
     if carrier.brand is None:
         return None
-    return get_nl_string(carrier.brand.name)
+    return strings.get_string(carrier.brand.name)
 
 
 def get_subtitles(
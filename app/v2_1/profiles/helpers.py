@@ -1,14 +1,51 @@
-from typing import Any
-
-
-def deepmerge(dict1: dict[str, Any], dict2: dict[str, Any]) -> dict[str, Any]:
-    result = dict1.copy()
-    for key, value in dict2.items():
-        if key in result:
-            if isinstance(result[key], dict) and isinstance(value, dict):
-                result[key] = deepmerge(result[key], value)
-            else:
-                raise ValueError()
-        else:
-            result[key] = value
-    return result
+from collections.abc import Callable, Iterable
+from typing import Any, NamedTuple
+
+
+class MappingConflictError(ValueError):
+    """Raised when a MediaHaven field is mapped more than once in a profile."""
+
+
+class Field(NamedTuple):
+    """
+    A MediaHaven sidecar field, with the function that maps a SIP onto it.
+
+    Args:
+        section: The sidecar section of the field, e.g. `Dynamic`.
+        name: The name of the field.
+        get: Gets the value of the field from the mapping context of a SIP.
+    """
+
+    section: str
+    name: str
+    get: Callable[[Any], Any]
+
+
+class MappingPlan:
+    """
+    The flat list of fields that maps a SIP onto the MediaHaven sidecar.
+
+    Plans are compiled when the profile modules are imported, so a field that
+    is mapped twice is detected at startup instead of for every SIP.
+    The fields keep the order of `field_groups`.
+    """
+
+    def __init__(self, *field_groups: Iterable[Field]):
+        self.fields: list[Field] = []
+        mapped: set[tuple[str, str]] = set()
+        for field in (field for group in field_groups for field in group):
+            key = (field.section, field.name)
+            if key in mapped:
+                raise MappingConflictError(
+                    f"Field '{field.name}' of section '{field.section}' is mapped more than once."
+                )
+            mapped.add(key)
+            self.fields.append(field)
+
+        self.sections = list(dict.fromkeys(field.section for field in self.fields))
+
+    def evaluate(self, context: Any) -> dict[str, Any]:
+        mapping: dict[str, dict[str, Any]] = {section: {} for section in self.sections}
+        for section, name, get in self.fields:
+            mapping[section][name] = get(context)
+        return mapping
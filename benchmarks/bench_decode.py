@@ -0,0 +1,46 @@
+"""
+Compare decoding the data of an incoming event with the standard library and
+with orjson.
+
+The payload is the body of a Pulsar message, as produced by the sipin
+transformator, either read from a file or created from an example SIP.
+
+    python -m benchmarks.bench_decode --payload <message body>.json
+    python -m benchmarks.bench_decode --sip tests/sip-examples/2.1/<sip>/<uuid>
+"""
+
+from pathlib import Path
+import argparse
+import json
+import timeit
+
+import orjson
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--payload", type=Path)
+    source.add_argument("--sip", type=Path)
+    parser.add_argument("--number", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.payload is not None:
+        body = args.payload.read_bytes()
+    else:
+        from transformator.v2_1 import transform_sip
+
+        body = json.dumps({"data": transform_sip(args.sip)}).encode("utf-8")
+
+    print(f"{len(body) / 1024 / 1024:.2f} MiB, {args.number} runs")
+    decoders = {
+        "json": lambda: json.loads(body)["data"],
+        "orjson": lambda: orjson.loads(body)["data"],
+    }
+    for name, decode in decoders.items():
+        seconds = timeit.timeit(decode, number=args.number)
+        print(f"{name:>8}: {seconds / args.number * 1000:.2f} ms per message")
+
+
+if __name__ == "__main__":
+    main()
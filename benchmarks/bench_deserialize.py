@@ -0,0 +1,41 @@
+"""
+Compare the full and the fast deserialization of the example SIPs.
+
+    python -m benchmarks.bench_deserialize tests/sip-examples/2.1
+"""
+
+from pathlib import Path
+import argparse
+import timeit
+
+from transformator.v2_1 import transform_sip
+
+from app.utils import deserialize_sip
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("examples_path", type=Path)
+    parser.add_argument("--number", type=int, default=20)
+    args = parser.parse_args()
+
+    for example in sorted(args.examples_path.iterdir()):
+        try:
+            data = transform_sip(next(example.iterdir()))
+        except Exception as e:
+            print(f"{example.name}: skipped ({e})")
+            continue
+
+        data.pop("is_valid", None)
+        print(f"{example.name}: {len(data.get('events', []))} events")
+        for mode in ("full", "fast"):
+            # Build the validators before timing
+            deserialize_sip(data, mode)
+            seconds = timeit.timeit(
+                lambda: deserialize_sip(data, mode), number=args.number
+            )
+            print(f"{mode:>8}: {seconds / args.number * 1000:.2f} ms per SIP")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Compare the PREMIS event lookups of the profile mappings with and without the
+event index, for a growing number of events.
+
+    python -m benchmarks.bench_event_index
+"""
+
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+import timeit
+
+from app.v2_1.profiles import common
+
+EVENT_TYPES = [
+    common.registration_event_id,
+    common.inspection_event_id,
+    common.repair_event_id,
+    common.cleaning_event_id,
+    common.baking_event_id,
+    common.digitization_event_id,
+    common.quality_control_event_id,
+]
+
+# The lookups done by `common.get_mh_mapping` and `film.get_mh_mapping`
+LOOKUPS = 26
+
+
+def make_events(count: int) -> list[SimpleNamespace]:
+    # QC and transfer events dominate, the looked up events are at the end
+    start = datetime(2024, 1, 1)
+    filler = [
+        SimpleNamespace(
+            type="https://data.hetarchief.be/id/event-type/transfer",
+            started_at_time=SimpleNamespace(
+                value=(start + timedelta(minutes=idx)).isoformat()
+            ),
+        )
+        for idx in range(count)
+    ]
+    looked_up = [
+        SimpleNamespace(
+            type=event_type, started_at_time=SimpleNamespace(value=start.isoformat())
+        )
+        for event_type in EVENT_TYPES
+    ]
+    return filler + looked_up
+
+
+def linear_scan(events: list[SimpleNamespace]):
+    # The lookups as they were done before the index, one scan per field
+    for idx in range(LOOKUPS):
+        event_type = EVENT_TYPES[idx % len(EVENT_TYPES)]
+        event = next((event for event in events if event.type == event_type), None)
+        if event is not None:
+            datetime.fromisoformat(event.started_at_time.value).date()
+
+
+def indexed(events: list[SimpleNamespace]):
+    index = common.get_event_index(events)  # type: ignore[arg-type]
+    for idx in range(LOOKUPS):
+        common.get_event_date(index, EVENT_TYPES[idx % len(EVENT_TYPES)])
+
+
+def main():
+    number = 20
+    print(f"{'events':>8} {'linear scan':>14} {'index':>10}")
+    for count in (10, 100, 1_000, 10_000):
+        events = make_events(count)
+        linear = timeit.timeit(lambda: linear_scan(events), number=number) / number
+        index = timeit.timeit(lambda: indexed(events), number=number) / number
+        print(f"{count:>8} {linear * 1000:>11.3f} ms {index * 1000:>7.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
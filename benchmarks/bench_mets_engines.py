@@ -0,0 +1,43 @@
+"""
+Compare the Jinja and the direct-writer METS engines.
+
+The files and events of the example SIP are repeated `--scale` times to
+simulate large SIPs.
+
+    python -m benchmarks.bench_mets_engines tests/sip-examples/2.1/<sip>/<uuid> --scale 1000
+"""
+
+from pathlib import Path
+import argparse
+import timeit
+
+import sippy
+from transformator.v2_1 import transform_sip
+
+from app.v2_1.creator import create_mh_mets_data, get_mets_engine
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("sip_path", type=Path)
+    parser.add_argument("--scale", type=int, default=1)
+    parser.add_argument("--number", type=int, default=10)
+    args = parser.parse_args()
+
+    sip = sippy.SIP.deserialize(transform_sip(args.sip_path))
+    mets_data = create_mh_mets_data(sip, sip.entity.identifier, "Disk", "25.1")
+    mets_data["files"] = mets_data["files"] * args.scale
+    mets_data["events"] = mets_data["events"] * args.scale
+
+    print(
+        f"{len(mets_data['files'])} files, {len(mets_data['events'])} events, "
+        f"{args.number} runs"
+    )
+    for engine in ("jinja", "writer"):
+        render_mets, _ = get_mets_engine(engine)
+        seconds = timeit.timeit(lambda: render_mets(mets_data), number=args.number)
+        print(f"{engine:>8}: {seconds / args.number * 1000:.2f} ms per METS")
+
+
+if __name__ == "__main__":
+    main()
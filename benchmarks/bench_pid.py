@@ -0,0 +1,39 @@
+"""
+Compare getting PIDs with a new connection per request, with the pooled
+session of the PID client and from the prefetched PID pool, against a local
+stub of the PID webservice.
+
+    python -m benchmarks.bench_pid --delay 0.01
+"""
+
+import argparse
+import time
+
+import requests
+
+from app.services.pid import PidClient
+from tests.stub_pid_server import StubPidServer
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--delay", type=float, default=0.0)
+    parser.add_argument("--number", type=int, default=200)
+    args = parser.parse_args()
+
+    with StubPidServer(delay=args.delay) as server:
+        clients = {
+            "requests": lambda: requests.get(server.url).json()[0]["id"],
+            "session": PidClient({"url": server.url}).get_pid,
+            "pool": PidClient({"url": server.url, "pool_size": 50}).get_pid,
+        }
+        for name, get_pid in clients.items():
+            start = time.perf_counter()
+            for _ in range(args.number):
+                get_pid()
+            seconds = time.perf_counter() - start
+            print(f"{name:>8}: {seconds / args.number * 1000:.3f} ms per PID")
+
+
+if __name__ == "__main__":
+    main()
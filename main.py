@@ -1,4 +1,10 @@
+from viaa.configuration import ConfigParser
+
 from app.app import EventListener
+from app.supervisor import Supervisor
 
 if __name__ == "__main__":
-    EventListener().start_listening()
+    if ConfigParser().app_cfg.get("processes", 1) > 1:
+        Supervisor().run()
+    else:
+        EventListener().run()
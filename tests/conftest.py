@@ -1,7 +1,13 @@
+from collections.abc import Callable, Iterator
+from types import ModuleType, SimpleNamespace
+from typing import Any
+import logging
 import pytest
 import shutil
 from pathlib import Path
 
+from stub_pid_server import StubPidServer
+
 
 def pytest_addoption(parser: pytest.Parser):
     parser.addoption(
@@ -17,3 +23,35 @@ def clear_output(request):
     if should_clear and path.exists():
         shutil.rmtree("tests/output")
         Path("tests/output").mkdir()
+
+
+@pytest.fixture
+def pid_server() -> Iterator[StubPidServer]:
+    with StubPidServer() as server:
+        yield server
+
+
+@pytest.fixture
+def configure(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> Callable[..., dict[str, Any]]:
+    """
+    Configure modules of the app with an app config, of which the AIP folder is
+    `tmp_path`, and let them log to the standard logging.
+    """
+
+    def configure(*modules: ModuleType, **config) -> dict[str, Any]:
+        app_cfg = {"aip_folder": str(tmp_path)} | config
+        config_parser = SimpleNamespace(app_cfg=app_cfg)
+        for module in modules:
+            monkeypatch.setattr(module, "ConfigParser", lambda: config_parser)
+            monkeypatch.setattr(
+                module,
+                "logging",
+                SimpleNamespace(
+                    get_logger=lambda name, config: logging.getLogger(name)
+                ),
+            )
+        return app_cfg
+
+    return configure
@@ -0,0 +1,84 @@
+"""
+A local stand-in for the PID webservice, to test and benchmark the PID client
+offline.
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import count
+from threading import Lock, Thread
+from urllib.parse import parse_qs, urlparse
+import json
+import time
+
+
+class StubPidServer:
+    """
+    Serves `[{"id": ...}, ...]` with `number` new PIDs on every GET.
+
+    Attributes:
+        delay: Seconds to wait before every response.
+        failures: The number of upcoming requests that get a 503 response.
+        requests: The number of requests received.
+    """
+
+    def __init__(self, delay: float = 0):
+        self.delay = delay
+        self.failures = 0
+        self.requests = 0
+        self.pids = count()
+        self.lock = Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.create_handler())
+        self.thread = Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def create_handler(self) -> type[BaseHTTPRequestHandler]:
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keeps the connections alive, like the PID webservice
+            protocol_version = "HTTP/1.1"
+            # Sends the headers and body at once, instead of waiting for an ACK
+            wbufsize = 64 * 1024
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                with stub.lock:
+                    stub.requests += 1
+                    fail = stub.failures > 0
+                    stub.failures -= fail
+
+                time.sleep(stub.delay)
+                if fail:
+                    self.send_response(503)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+                query = parse_qs(urlparse(self.path).query)
+                number = int(query.get("number", ["1"])[0])
+                with stub.lock:
+                    pids = [{"id": f"pid{next(stub.pids)}"} for _ in range(number)]
+
+                body = json.dumps(pids).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self) -> "StubPidServer":
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
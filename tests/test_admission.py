@@ -0,0 +1,166 @@
+from collections import namedtuple
+from pathlib import Path
+from threading import Event, Thread
+import shutil
+import time
+
+import pytest
+
+from app import admission
+from app.admission import (
+    METS_SIZE,
+    METS_SIZE_PER_FILE,
+    AdmissionController,
+    AdmissionError,
+    AdmissionTimeout,
+    estimate_output_size,
+)
+
+
+DiskUsage = namedtuple("DiskUsage", ["total", "used", "free"])
+
+
+@pytest.fixture
+def free_bytes(monkeypatch: pytest.MonkeyPatch) -> list[int]:
+    free = [1000]
+    monkeypatch.setattr(
+        admission.shutil,
+        "disk_usage",
+        lambda _: DiskUsage(2000, 2000 - free[0], free[0]),
+    )
+    return free
+
+
+def test_estimate_output_size(tmp_path: Path):
+    files = []
+    for idx, size in enumerate((10, 20)):
+        path = tmp_path / f"{idx}.mxf"
+        path.write_bytes(b"\0" * size)
+        files.append({"source_href": path})
+
+    size = estimate_output_size(files)
+
+    assert size == 30 + METS_SIZE + 2 * METS_SIZE_PER_FILE
+    assert estimate_output_size(files, staged=True) == size + 30
+
+
+def test_reserve_waits_for_in_flight_bytes(tmp_path: Path):
+    controller = AdmissionController(tmp_path, max_in_flight_bytes=100)
+    reserved = Event()
+    release = Event()
+
+    def package():
+        with controller.reserve(60):
+            reserved.set()
+            release.wait()
+
+    with controller.reserve(60):
+        assert not controller.can_admit(60)
+        thread = Thread(target=package)
+        thread.start()
+        assert not reserved.wait(0.1)
+
+    assert reserved.wait(1)
+    assert controller.in_flight_bytes == 60
+    release.set()
+    thread.join()
+    assert controller.in_flight_bytes == 0
+
+
+def test_reserve_admits_large_sip_alone(tmp_path: Path):
+    controller = AdmissionController(tmp_path, max_in_flight_bytes=100)
+
+    with controller.reserve(500):
+        assert controller.in_flight_bytes == 500
+        assert not controller.is_open()
+
+    assert controller.in_flight_bytes == 0
+    assert controller.is_open()
+
+
+def test_min_free_bytes(tmp_path: Path, free_bytes: list[int]):
+    controller = AdmissionController(tmp_path, min_free_bytes=500)
+
+    with controller.reserve(400):
+        assert controller.get_free_bytes() == 600
+        assert controller.is_open()
+        assert not controller.can_admit(200)
+        free_bytes[0] = 400
+        assert not controller.wait_until_open(timeout=0.01)
+
+    with pytest.raises(AdmissionError):
+        with controller.reserve(1600):
+            pass
+
+
+def test_reserve_times_out(tmp_path: Path, free_bytes: list[int]):
+    controller = AdmissionController(
+        tmp_path, min_free_bytes=500, poll_interval=0.01, timeout=0.05
+    )
+    free_bytes[0] = 400
+
+    with pytest.raises(AdmissionTimeout):
+        with controller.reserve(100):
+            pass
+
+    assert controller.waiting == []
+    assert controller.in_flight_bytes == 0
+
+
+def test_stop_gives_up_waiting(tmp_path: Path, free_bytes: list[int]):
+    controller = AdmissionController(tmp_path, min_free_bytes=500, timeout=0)
+    free_bytes[0] = 400
+    errors = []
+
+    def package():
+        try:
+            with controller.reserve(100):
+                pass
+        except AdmissionTimeout as e:
+            errors.append(e)
+
+    thread = Thread(target=package)
+    thread.start()
+    controller.stop()
+    thread.join(1)
+
+    assert not thread.is_alive()
+    assert len(errors) == 1
+
+
+def test_reserve_in_order(tmp_path: Path):
+    controller = AdmissionController(tmp_path, max_in_flight_bytes=100)
+    admitted: list[int] = []
+    release = {size: Event() for size in (200, 10)}
+
+    def package(size: int):
+        with controller.reserve(size):
+            admitted.append(size)
+            release[size].wait()
+
+    with controller.reserve(60):
+        large = Thread(target=package, args=(200,))
+        large.start()
+        while not controller.waiting:
+            time.sleep(0.01)
+        assert not controller.is_open()
+        # Fits next to the first SIP, but waits behind the large one
+        small = Thread(target=package, args=(10,))
+        small.start()
+        time.sleep(0.1)
+        assert admitted == []
+
+    while not admitted:
+        time.sleep(0.01)
+    assert admitted == [200]
+    release[200].set()
+    large.join()
+    release[10].set()
+    small.join()
+    assert admitted == [200, 10]
+
+
+def test_disk_usage_of_folder(tmp_path: Path):
+    controller = AdmissionController(tmp_path, min_free_bytes=1)
+
+    assert controller.get_free_bytes() == shutil.disk_usage(tmp_path).free
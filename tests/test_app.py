@@ -1,2 +1,431 @@
+from collections.abc import Callable
+from concurrent.futures import Future
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any
+from threading import Lock, Timer
+import asyncio
+import time
+import zipfile
+
+import _pulsar
+import pytest
+from cloudevents.events import EventOutcome
+
+from app import app as app_module
+from app.admission import AdmissionError
+from app.app import EventListener, OutgoingEvent
+from app.services.pulsar import PulsarProduceError
+
+
 def test_sanity_check():
     assert True
+
+
+class FakeMessage:
+    def __init__(self, idx: int, topic: str = "topic-partition-0"):
+        self.idx = idx
+        self.topic = topic
+
+    def message_id(self):
+        return SimpleNamespace(serialize=lambda: str(self.idx).encode())
+
+    def topic_name(self) -> str:
+        return self.topic
+
+    @property
+    def correlation_id(self) -> str:
+        return f"correlation-{self.idx}"
+
+    def __repr__(self) -> str:
+        return f"FakeMessage({self.idx})"
+
+
+class FakePulsarClient:
+    def __init__(self, messages: list[FakeMessage], batch_receive: bool = False):
+        self.messages = messages
+        self.batch_receive = batch_receive
+        self.supports_cumulative_ack = True
+        self.acknowledged: list[int] = []
+        self.negatively_acknowledged: list[int] = []
+        self.acknowledged_cumulative: list[int] = []
+        # The most messages that were received but not yet acknowledged
+        self.unacknowledged = 0
+        self.max_unacknowledged = 0
+        self.lock = Lock()
+
+    def received(self, count: int):
+        with self.lock:
+            self.unacknowledged += count
+            self.max_unacknowledged = max(self.max_unacknowledged, self.unacknowledged)
+
+    def receive(self) -> FakeMessage:
+        if not self.messages:
+            time.sleep(0.01)
+            raise _pulsar.Timeout()
+        self.received(1)
+        return self.messages.pop(0)
+
+    def receive_batch(self) -> list[FakeMessage]:
+        batch, self.messages = self.messages[:2], self.messages[2:]
+        self.received(len(batch))
+        return batch
+
+    def acknowledge(self, msg: FakeMessage):
+        self.received(-1)
+        self.acknowledged.append(msg.idx)
+
+    def acknowledge_cumulative(self, msg: FakeMessage):
+        self.acknowledged_cumulative.append(msg.idx)
+
+    def negative_acknowledge(self, msg: FakeMessage):
+        self.received(-1)
+        self.negatively_acknowledged.append(msg.idx)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakePidClient:
+    def __init__(self, pid_config: dict | None = None):
+        self.pid_config = pid_config
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def make_listener(
+    monkeypatch: pytest.MonkeyPatch, configure: Callable[..., dict[str, Any]]
+) -> Callable[..., EventListener]:
+    def make(pulsar_client: FakePulsarClient, **config) -> EventListener:
+        configure(app_module, **config)
+        monkeypatch.setattr(
+            app_module, "PulsarClient", lambda timeout_ms: pulsar_client
+        )
+        monkeypatch.setattr(app_module, "PidClient", FakePidClient)
+        return EventListener(clean_orphans=False)
+
+    return make
+
+
+def handled(failing: set[int]) -> Callable[[FakeMessage], Future[None]]:
+    """Handle messages, of which the ones in `failing` fail."""
+
+    def handle_message(msg: FakeMessage) -> Future[None]:
+        future: Future[None] = Future()
+        if msg.idx in failing:
+            future.set_exception(ValueError(f"message {msg.idx}"))
+        else:
+            future.set_result(None)
+        return future
+
+    return handle_message
+
+
+def test_process_batch_acknowledges_cumulative(make_listener):
+    client = FakePulsarClient([])
+    listener = make_listener(client)
+    listener.handle_message = handled(set())
+
+    listener.process_batch([FakeMessage(0), FakeMessage(1), FakeMessage(2)])
+
+    assert client.acknowledged_cumulative == [2]
+    assert client.acknowledged == []
+    assert listener.metrics.acknowledged == 3
+
+
+def test_process_batch_of_partitions(make_listener):
+    client = FakePulsarClient([])
+    listener = make_listener(client)
+    listener.handle_message = handled(set())
+
+    listener.process_batch(
+        [FakeMessage(0), FakeMessage(1, "topic-partition-1"), FakeMessage(2)]
+    )
+
+    assert client.acknowledged_cumulative == []
+    assert client.acknowledged == [0, 1, 2]
+    assert listener.metrics.acknowledged == 3
+
+
+def test_process_batch_with_failure(make_listener):
+    client = FakePulsarClient([])
+    listener = make_listener(client)
+    listener.handle_message = handled({1})
+
+    listener.process_batch([FakeMessage(0), FakeMessage(1), FakeMessage(2)])
+
+    assert client.acknowledged_cumulative == []
+    assert client.acknowledged == [0, 2]
+    assert client.negatively_acknowledged == [1]
+    assert listener.pending_redelivery == {b"1"}
+
+
+def test_process_batch_with_pending_redelivery(make_listener):
+    client = FakePulsarClient([])
+    listener = make_listener(client)
+    listener.handle_message = handled({1})
+    listener.process_batch([FakeMessage(0), FakeMessage(1)])
+
+    listener.process_batch([FakeMessage(2), FakeMessage(3)])
+
+    assert client.acknowledged_cumulative == []
+    assert client.acknowledged == [0, 2, 3]
+
+    # The redelivered message was handled, so cumulative acks are safe again
+    listener.process_batch([FakeMessage(4), FakeMessage(5)])
+    listener.handle_message = handled(set())
+    listener.process_batch([FakeMessage(1), FakeMessage(6)])
+
+    assert listener.pending_redelivery == set()
+    assert client.acknowledged_cumulative == [6]
+
+
+def test_start_listening_batches(make_listener):
+    client = FakePulsarClient([FakeMessage(idx) for idx in range(5)], True)
+    listener = make_listener(client, workers=2)
+    handle_message = handled({3})
+
+    def stop_when_done(msg: FakeMessage) -> Future[None]:
+        if not client.messages:
+            listener.running = False
+        return handle_message(msg)
+
+    listener.handle_message = stop_when_done
+    listener.start_listening()
+
+    assert sorted(client.acknowledged) == [0, 1, 2, 4]
+    assert client.negatively_acknowledged == [3]
+
+
+def test_stopped_batch_is_negatively_acknowledged(make_listener):
+    client = FakePulsarClient([FakeMessage(0), FakeMessage(1)], True)
+    listener = make_listener(client, workers=2, max_in_flight=1)
+
+    def stop(msg: FakeMessage) -> Future[None]:
+        # Holds the only slot until the listener gave up waiting for it
+        listener.running = False
+        time.sleep(1.2)
+        return handled(set())(msg)
+
+    listener.handle_message = stop
+    listener.start_listening()
+
+    assert client.acknowledged == [0]
+    assert client.negatively_acknowledged == [1]
+
+
+def persisted_later(error: Exception | None = None) -> Future[None]:
+    """An event that is persisted, or fails, after a while."""
+    persisted: Future[None] = Future()
+    if error is None:
+        Timer(0.05, persisted.set_result, [None]).start()
+    else:
+        Timer(0.05, persisted.set_exception, [error]).start()
+    return persisted
+
+
+def test_process_message_acknowledges_once_persisted(make_listener):
+    client = FakePulsarClient([])
+    listener = make_listener(client)
+    listener.handle_incoming_message = lambda event, data: persisted_later()
+    listener.decode = lambda msg: (msg, None)
+
+    acknowledged = listener.process_message(FakeMessage(0))
+
+    assert client.acknowledged == []
+    acknowledged.result(timeout=1)
+    assert client.acknowledged == [0]
+
+
+def test_process_message_on_produce_error(make_listener):
+    client = FakePulsarClient([])
+    listener = make_listener(client)
+    listener.handle_incoming_message = lambda event, data: persisted_later(
+        PulsarProduceError("broker is gone")
+    )
+    listener.decode = lambda msg: (msg, None)
+
+    listener.process_message(FakeMessage(0)).result(timeout=1)
+
+    assert client.acknowledged == []
+    assert client.negatively_acknowledged == [0]
+
+
+class FakeEvent:
+    correlation_id = "correlation"
+
+    def has_successful_outcome(self) -> bool:
+        return True
+
+    def get_attributes(self) -> dict[str, str]:
+        return {"subject": "/sips/sip/unzipped"}
+
+    def get_data(self) -> dict[str, Any]:
+        return {"is_valid": True}
+
+
+def test_sip_that_never_fits_fails(make_listener, monkeypatch):
+    client = FakePulsarClient([])
+    listener = make_listener(client, host="host", pulsar={"producer_topic": "topic"})
+    monkeypatch.setattr(app_module, "deserialize_sip", lambda data, mode: None)
+    listener.decode = lambda msg: (FakeEvent(), None)
+    outgoing_events: list[OutgoingEvent] = []
+
+    def create_mediahaven_sip(sip, correlation_id: str):
+        raise AdmissionError("SIP does not fit")
+
+    def produce_event(*outgoing_event) -> Future[None]:
+        outgoing_events.append(OutgoingEvent(*outgoing_event))
+        return persisted_later()
+
+    listener.create_mediahaven_sip = create_mediahaven_sip
+    listener.produce_event = produce_event
+    listener.process_message(FakeMessage(0)).result(timeout=1)
+
+    # Redelivering the message would not make the SIP fit
+    assert client.acknowledged == [0]
+    [outgoing_event] = outgoing_events
+    assert outgoing_event.outcome == EventOutcome.FAIL
+    assert outgoing_event.correlation_id == "correlation"
+    assert outgoing_event.data["message"].endswith("SIP does not fit")
+
+
+def test_start_listening_bounds_unacknowledged(make_listener):
+    client = FakePulsarClient([FakeMessage(idx) for idx in range(6)])
+    listener = make_listener(client, workers=2, max_in_flight=2)
+    listener.decode = lambda msg: (msg, None)
+
+    def handle_incoming_message(msg: FakeMessage, data) -> Future[None]:
+        if not client.messages:
+            listener.running = False
+        return persisted_later()
+
+    listener.handle_incoming_message = handle_incoming_message
+    listener.start_listening()
+
+    assert sorted(client.acknowledged) == list(range(6))
+    assert client.max_unacknowledged == 2
+
+
+def write_mediahaven_sip(sip, config, pid, admission, mets_path: Path | None):
+    """Write a fake MediaHaven SIP, and the copy of its METS when it is given."""
+    pid = pid.result()
+    mh_sip_path = Path(config["aip_folder"]) / pid
+    with zipfile.ZipFile(f"{mh_sip_path}.zip", "w") as zf:
+        zf.writestr("mets.xml", "<mets/>")
+    if mets_path is None:
+        return mh_sip_path, lambda: "<mets/>"
+    mets_path.write_text("<mets/>")
+    return mh_sip_path, mets_path.read_text
+
+
+def test_create_mediahaven_sip_with_reference(make_listener, monkeypatch, tmp_path):
+    client = FakePulsarClient([])
+    listener = make_listener(
+        client, metadata_mode="reference", metadata_threshold=0, stream_mets=True
+    )
+    monkeypatch.setattr(app_module, "get_sip_creator", lambda sip: write_mediahaven_sip)
+    sip = SimpleNamespace(entity=SimpleNamespace(identifier="pid0000000"))
+
+    pid, mh_sip_path, metadata = listener.create_mediahaven_sip(sip, "correlation")
+
+    reference_path = tmp_path / "pid0000000.mets.xml"
+    assert pid == "pid0000000"
+    assert metadata["metadata_reference"]["path"] == str(reference_path)
+    assert reference_path.read_text() == "<mets/>"
+
+    # A redelivery reuses the SIP, without reading its zip
+    reference_path.unlink()
+    assert listener.create_mediahaven_sip(sip, "correlation") == (
+        pid,
+        mh_sip_path,
+        metadata,
+    )
+    assert reference_path.exists()
+
+
+def test_create_mediahaven_sip_without_mets_copy(make_listener, monkeypatch, tmp_path):
+    client = FakePulsarClient([])
+    listener = make_listener(client)
+    written: list[Path | None] = []
+
+    def write_and_record(sip, config, pid, admission, mets_path: Path | None):
+        written.append(mets_path)
+        return write_mediahaven_sip(sip, config, pid, admission, mets_path)
+
+    monkeypatch.setattr(app_module, "get_sip_creator", lambda sip: write_and_record)
+    sip = SimpleNamespace(entity=SimpleNamespace(identifier="pid0000000"))
+
+    pid, _, metadata = listener.create_mediahaven_sip(sip, "correlation")
+
+    assert metadata == {"metadata": "<mets/>"}
+    assert list((tmp_path / ".state").iterdir()) == [
+        tmp_path / ".state" / "correlation.manifest.json"
+    ]
+
+    # Without a copy of the METS, a redelivery writes the SIP again
+    assert listener.create_mediahaven_sip(sip, "correlation")[0] == pid
+    assert written == [None, None]
+
+
+def test_manifests_are_removed_once_acknowledged(make_listener, monkeypatch, tmp_path):
+    client = FakePulsarClient([FakeMessage(idx) for idx in range(4)])
+    listener = make_listener(client, workers=2, stream_mets=True)
+    monkeypatch.setattr(app_module, "get_sip_creator", lambda sip: write_mediahaven_sip)
+    listener.decode = lambda msg: (msg, None)
+
+    def create_outgoing_event(msg: FakeMessage, data) -> OutgoingEvent:
+        if not client.messages:
+            listener.running = False
+        sip = SimpleNamespace(entity=SimpleNamespace(identifier=f"pid000000{msg.idx}"))
+        _, _, metadata = listener.create_mediahaven_sip(sip, msg.correlation_id)
+        return OutgoingEvent(
+            "topic", metadata, str(msg.idx), "success", msg.correlation_id
+        )
+
+    def produce_event(topic, data, subject, *args) -> Future[None]:
+        if subject == "2":
+            return persisted_later(PulsarProduceError("broker is gone"))
+        return persisted_later()
+
+    listener.create_outgoing_event = create_outgoing_event
+    listener.produce_event = produce_event
+    listener.start_listening()
+
+    assert sorted(client.acknowledged) == [0, 1, 3]
+    assert sorted(path.name for path in tmp_path.glob("*.zip")) == [
+        f"pid000000{idx}.zip" for idx in range(4)
+    ]
+    # Only the SIP of the event that was not persisted keeps its manifest
+    assert sorted(path.name for path in (tmp_path / ".state").iterdir()) == [
+        "correlation-2.manifest.json",
+        "correlation-2.mets.xml",
+    ]
+
+
+@pytest.mark.parametrize("batch_receive", [False, True])
+def test_listen(make_listener, batch_receive: bool):
+    client = FakePulsarClient([FakeMessage(idx) for idx in range(6)], batch_receive)
+    listener = make_listener(client, workers=2, max_in_flight=2)
+    listener.decode = lambda msg: (msg, None)
+
+    def create_outgoing_event(msg: FakeMessage, data) -> OutgoingEvent:
+        if not client.messages:
+            listener.running = False
+        if msg.idx == 3:
+            raise ValueError("invalid SIP")
+        return OutgoingEvent("topic", {}, str(msg.idx), "success", "correlation")
+
+    listener.create_outgoing_event = create_outgoing_event
+    listener.produce_event = lambda *outgoing_event: persisted_later()
+    asyncio.run(listener.listen())
+
+    assert sorted(client.acknowledged) == [0, 1, 2, 4, 5]
+    assert client.negatively_acknowledged == [3]
+    # The second message of a batch of two waits for a slot after receiving
+    assert client.max_unacknowledged <= (3 if batch_receive else 2)
@@ -0,0 +1,60 @@
+from pathlib import Path
+import base64
+import gzip
+import hashlib
+
+import pytest
+
+from app.claim_check import get_event_metadata
+
+METS = "<mets:mets>" + "<mets:file />" * 100 + "</mets:mets>"
+
+
+@pytest.fixture
+def mets(tmp_path: Path) -> Path:
+    path = tmp_path / ".correlation-id.mets.xml"
+    path.write_text(METS)
+    return path
+
+
+@pytest.mark.parametrize("mode", ["inline", "reference", "compressed"])
+def test_below_threshold_is_inline(mode: str, mets: Path, tmp_path: Path):
+    reference_path = tmp_path / "pid.mets.xml"
+    fields = get_event_metadata(mets, reference_path, mode, threshold=len(METS))
+
+    assert fields == {"metadata": METS}
+    assert not reference_path.exists()
+
+
+def test_reference(mets: Path, tmp_path: Path):
+    reference_path = tmp_path / "pid.mets.xml"
+    fields = get_event_metadata(mets, reference_path, "reference", threshold=10)
+
+    assert fields["metadata"] is None
+    reference = fields["metadata_reference"]
+    assert reference["path"] == str(reference_path)
+    assert reference["size"] == len(METS)
+    assert reference["checksum"] == hashlib.sha256(METS.encode()).hexdigest()
+    assert reference_path.read_text() == METS
+    assert sorted(tmp_path.iterdir()) == sorted([mets, reference_path])
+
+
+def test_compressed(mets: Path, tmp_path: Path):
+    fields = get_event_metadata(mets, tmp_path / "pid.mets.xml", "compressed", 10)
+
+    assert fields["metadata"] is None
+    data = fields["metadata_compressed"]["data"]
+    assert gzip.decompress(base64.b64decode(data)).decode() == METS
+
+
+def test_unknown_mode(mets: Path, tmp_path: Path):
+    with pytest.raises(ValueError):
+        get_event_metadata(mets, tmp_path / "pid.mets.xml", "zipped")
+
+
+@pytest.mark.parametrize("mode", ["inline", "reference", "compressed"])
+def test_mets_in_memory(mode: str, mets: Path, tmp_path: Path):
+    reference_path = tmp_path / "pid.mets.xml"
+    fields = get_event_metadata(METS, reference_path, mode, threshold=10)
+
+    assert fields == get_event_metadata(mets, reference_path, mode, threshold=10)
@@ -0,0 +1,124 @@
+from pathlib import Path
+import os
+import time
+import zipfile
+
+from app.manifest import (
+    cleanup_manifests,
+    complete_manifest,
+    create_manifest,
+    get_manifest_path,
+    get_mets_copy_path,
+    get_state_folder,
+    is_completed,
+    read_manifest,
+    remove_manifest,
+    write_manifest,
+)
+
+
+def write_zip(zip_path: Path) -> Path:
+    with zipfile.ZipFile(zip_path, "w") as zf:
+        zf.writestr("mets.xml", "<mets/>")
+        zf.writestr("representation_0/video.mxf", b"\x00" * 1024)
+    mets_path = zip_path.with_name(".mets.xml")
+    mets_path.write_text("<mets/>")
+    return mets_path
+
+
+def test_get_manifest_path():
+    path = get_manifest_path("state", "persistent://a/b 1")
+
+    assert path == Path("state/persistent___a_b_1.manifest.json")
+    assert get_mets_copy_path(path) == Path("state/persistent___a_b_1.mets.xml")
+
+
+def test_get_state_folder():
+    assert get_state_folder({"aip_folder": "aip"}) == Path("aip/.state")
+    assert get_state_folder({"aip_folder": "aip", "state_folder": "state"}) == Path(
+        "state"
+    )
+
+
+def test_read_missing_manifest(tmp_path: Path):
+    assert read_manifest(tmp_path / "missing.manifest.json") is None
+
+
+def test_manifest_roundtrip(tmp_path: Path):
+    zip_path = tmp_path / "pid.zip"
+    mets_path = write_zip(zip_path)
+    manifest_path = get_manifest_path(tmp_path, "correlation-id")
+
+    manifest = create_manifest("correlation-id", "pid")
+    write_manifest(manifest_path, manifest)
+    assert not is_completed(read_manifest(manifest_path))  # type: ignore[arg-type]
+
+    write_manifest(manifest_path, complete_manifest(manifest, zip_path, mets_path))
+    completed = read_manifest(manifest_path)
+
+    assert completed is not None
+    assert completed["pid"] == "pid"
+    assert completed["files"][1] == {
+        "name": "representation_0/video.mxf",
+        "size": 1024,
+        "crc32": zipfile.crc32(b"\x00" * 1024),
+    }
+    assert is_completed(completed)
+
+
+def test_manifest_of_changed_zip(tmp_path: Path):
+    zip_path = tmp_path / "pid.zip"
+    mets_path = write_zip(zip_path)
+    manifest = complete_manifest(
+        create_manifest("correlation-id", "pid"), zip_path, mets_path
+    )
+
+    zip_path.write_bytes(zip_path.read_bytes()[:100])
+
+    assert not is_completed(manifest)
+
+    zip_path.unlink()
+
+    assert not is_completed(manifest)
+
+
+def test_manifest_without_mets_copy(tmp_path: Path):
+    zip_path = tmp_path / "pid.zip"
+    mets_path = write_zip(zip_path)
+    manifest = complete_manifest(
+        create_manifest("correlation-id", "pid"), zip_path, mets_path
+    )
+
+    mets_path.unlink()
+
+    assert not is_completed(manifest)
+
+
+def test_remove_manifest(tmp_path: Path):
+    manifest_path = get_manifest_path(tmp_path, "correlation-id")
+    write_manifest(manifest_path, create_manifest("correlation-id", "pid"))
+    get_mets_copy_path(manifest_path).write_text("<mets/>")
+
+    remove_manifest(manifest_path)
+
+    assert list(tmp_path.iterdir()) == []
+    # A manifest that is already gone is fine
+    remove_manifest(manifest_path)
+
+
+def test_cleanup_manifests(tmp_path: Path):
+    expired_path = get_manifest_path(tmp_path, "expired")
+    write_manifest(expired_path, create_manifest("expired", "pid0"))
+    expired_mets_path = get_mets_copy_path(expired_path)
+    expired_mets_path.write_text("<mets/>")
+    day_ago = time.time() - 24 * 60 * 60
+    for path in (expired_path, expired_mets_path):
+        os.utime(path, (day_ago, day_ago))
+    recent_path = get_manifest_path(tmp_path, "recent")
+    write_manifest(recent_path, create_manifest("recent", "pid1"))
+
+    removed = cleanup_manifests(tmp_path, max_age=3600)
+
+    assert sorted(removed) == sorted([expired_path, expired_mets_path])
+    assert list(tmp_path.iterdir()) == [recent_path]
+    assert cleanup_manifests(tmp_path / "missing", max_age=3600) == []
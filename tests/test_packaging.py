@@ -0,0 +1,248 @@
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import hashlib
+import os
+import zipfile
+
+import pytest
+
+from app.packaging import (
+    CHUNK_SIZE,
+    PARTIAL_HOST,
+    PARTIAL_SUFFIX,
+    FixityError,
+    cleanup_orphans,
+    get_partial_path,
+    read_mets,
+    parse_compression_policy,
+    write_sip_folder,
+    write_sip_zip,
+)
+
+
+@pytest.fixture
+def files(tmp_path: Path) -> list[dict]:
+    source = tmp_path / "source"
+    source.mkdir()
+    (source / "video.mxf").write_bytes(b"\x00\x01" * 1024)
+    (source / "metadata.xml").write_text("<metadata/>")
+
+    return [
+        {
+            "source_href": source / "video.mxf",
+            "href": "representation_0/video.mxf",
+            "is_collateral": False,
+        },
+        {
+            "source_href": source / "metadata.xml",
+            "href": "representation_1/metadata.xml",
+            "is_collateral": True,
+        },
+    ]
+
+
+def test_write_sip_zip(tmp_path: Path, files: list[dict]):
+    zip_path = tmp_path / "output" / "pid.zip"
+
+    write_sip_zip(zip_path, "<mets/>", files)
+
+    with zipfile.ZipFile(zip_path) as zf:
+        assert zf.namelist() == [
+            "mets.xml",
+            "representation_0/video.mxf",
+            "representation_1/metadata.xml",
+        ]
+        assert zf.read("mets.xml") == b"<mets/>"
+        assert zf.read("representation_0/video.mxf") == b"\x00\x01" * 1024
+    assert not (tmp_path / "output" / "pid").exists()
+
+
+def test_write_sip_folder(tmp_path: Path, files: list[dict]):
+    folder = tmp_path / "output" / "pid"
+
+    strategies = write_sip_folder(folder, "<mets/>", files, strategy="copy")
+
+    assert strategies == {"copy"}
+    assert (folder / "mets.xml").read_text() == "<mets/>"
+    assert (folder / "representation_1/metadata.xml").read_text() == "<metadata/>"
+    assert (folder / "representation_0/video.mxf").stat().st_ino != (
+        files[0]["source_href"].stat().st_ino
+    )
+
+
+def test_write_sip_folder_auto_staging(tmp_path: Path, files: list[dict]):
+    folder = tmp_path / "output" / "pid"
+
+    strategies = write_sip_folder(folder, "<mets/>", files)
+
+    # The source and the staging folder share a filesystem
+    assert strategies == {"hardlink"}
+    assert (folder / "representation_0/video.mxf").samefile(files[0]["source_href"])
+
+
+def test_write_sip_folder_invalid_strategy(tmp_path: Path, files: list[dict]):
+    with pytest.raises(ValueError):
+        write_sip_folder(tmp_path / "pid", "<mets/>", files, strategy="symlink")
+
+
+def test_write_sip_zip_verify_fixity(tmp_path: Path, files: list[dict]):
+    files[0]["checksum"] = hashlib.md5(b"\x00\x01" * 1024).hexdigest().upper()
+    files[1]["checksum"] = hashlib.md5(b"<metadata/>").hexdigest()
+    zip_path = tmp_path / "pid.zip"
+
+    write_sip_zip(zip_path, "<mets/>", files, verify_fixity=True)
+
+    assert zip_path.exists()
+
+
+def test_write_sip_zip_fixity_mismatch(tmp_path: Path, files: list[dict]):
+    files[0]["checksum"] = hashlib.md5(b"\x00\x01" * 1024).hexdigest()
+    files[1]["checksum"] = hashlib.md5(b"something else").hexdigest()
+    zip_path = tmp_path / "pid.zip"
+
+    with pytest.raises(FixityError):
+        write_sip_zip(zip_path, "<mets/>", files, verify_fixity=True)
+
+    assert not zip_path.exists()
+    assert list(tmp_path.glob(".*.partial")) == []
+
+
+def test_write_sip_zip_compression(tmp_path: Path, files: list[dict]):
+    policy = parse_compression_policy(
+        {
+            "mets": {"method": "deflated", "level": 9},
+            "collateral": {"method": "deflated"},
+            "extensions": {"MXF": {"method": "bzip2"}},
+            "zip64_threshold": 1024,
+        }
+    )
+    zip_path = tmp_path / "pid.zip"
+
+    write_sip_zip(zip_path, "<mets/>", files, compression=policy)
+
+    with zipfile.ZipFile(zip_path) as zf:
+        assert zf.getinfo("mets.xml").compress_type == zipfile.ZIP_DEFLATED
+        video = zf.getinfo("representation_0/video.mxf")
+        assert video.compress_type == zipfile.ZIP_BZIP2
+        assert zf.read(video) == b"\x00\x01" * 1024
+        metadata = zf.getinfo("representation_1/metadata.xml")
+        assert metadata.compress_type == zipfile.ZIP_DEFLATED
+
+
+def test_parse_compression_policy_invalid_method():
+    with pytest.raises(ValueError):
+        parse_compression_policy({"essence": {"method": "zstd"}})
+
+
+def test_write_sip_zip_workers(tmp_path: Path):
+    files = []
+    for idx in range(20):
+        source = tmp_path / f"page_{idx}.tif"
+        source.write_bytes(bytes([idx]) * (CHUNK_SIZE * (idx % 3) + idx))
+        files.append(
+            {
+                "source_href": source,
+                "href": f"representation_0/page_{idx}.tif",
+                "checksum": hashlib.md5(source.read_bytes()).hexdigest(),
+                "is_collateral": False,
+            }
+        )
+    zip_path = tmp_path / "pid.zip"
+
+    write_sip_zip(zip_path, "<mets/>", files, verify_fixity=True, workers=4)
+
+    with zipfile.ZipFile(zip_path) as zf:
+        assert zf.namelist() == ["mets.xml"] + [file["href"] for file in files]
+        for file in files:
+            assert zf.read(file["href"]) == file["source_href"].read_bytes()
+
+
+def test_write_sip_zip_workers_missing_file(tmp_path: Path, files: list[dict]):
+    files[1]["source_href"] = tmp_path / "missing.xml"
+    zip_path = tmp_path / "pid.zip"
+
+    with pytest.raises(FileNotFoundError):
+        write_sip_zip(zip_path, "<mets/>", files, workers=2)
+
+
+def test_write_sip_zip_is_published(tmp_path: Path, files: list[dict]):
+    zip_path = tmp_path / "pid.zip"
+
+    write_sip_zip(zip_path, "<mets/>", files, fsync=True)
+
+    assert zip_path.exists()
+    assert list(tmp_path.glob(f".*{PARTIAL_SUFFIX}")) == []
+
+
+def test_get_partial_path_is_unique(tmp_path: Path):
+    zip_path = tmp_path / "pid.zip"
+
+    assert get_partial_path(zip_path) != get_partial_path(zip_path)
+
+
+def test_concurrent_writes_of_zip(tmp_path: Path, files: list[dict]):
+    zip_path = tmp_path / "pid.zip"
+
+    with ThreadPoolExecutor(2) as executor:
+        futures = [
+            executor.submit(write_sip_zip, zip_path, "<mets/>", files) for _ in range(2)
+        ]
+        for future in futures:
+            future.result()
+
+    assert read_mets(zip_path) == "<mets/>"
+    assert list(tmp_path.glob(f".*{PARTIAL_SUFFIX}")) == []
+
+
+def test_cleanup_orphans(tmp_path: Path):
+    own = tmp_path / f".pid_1.zip.{PARTIAL_HOST}-{os.getpid()}-0{PARTIAL_SUFFIX}"
+    own.write_bytes(b"")
+    sibling = tmp_path / f".pid_5.zip.{PARTIAL_HOST}-{os.getppid()}-1{PARTIAL_SUFFIX}"
+    sibling.write_bytes(b"")
+    other = tmp_path / f".pid_2.zip.other-host-1-0{PARTIAL_SUFFIX}"
+    other.write_bytes(b"")
+    stale = tmp_path / f".pid_3.other-host-1-1{PARTIAL_SUFFIX}"
+    stale.mkdir()
+    (stale / "mets.xml").write_text("<mets/>")
+    os.utime(stale, (0, 0))
+    published = tmp_path / "pid_4.zip"
+    published.write_bytes(b"")
+
+    removed = cleanup_orphans(tmp_path, max_age=3600)
+
+    assert sorted(removed) == sorted([own, stale])
+    assert other.exists()
+    assert sibling.exists()
+    assert published.exists()
+
+
+def test_write_sip_zip_streamed_mets(tmp_path: Path, files: list[dict]):
+    chunks = ["<mets>", *(f"<file id='{idx}'/>" for idx in range(10_000)), "</mets>"]
+    zip_path = tmp_path / "pid.zip"
+
+    write_sip_zip(zip_path, iter(chunks), files)
+
+    assert read_mets(zip_path) == "".join(chunks)
+
+
+def test_write_sip_zip_mets_copy(tmp_path: Path, files: list[dict]):
+    chunks = ["<mets>", *(f"<file id='{idx}'/>" for idx in range(1000)), "</mets>"]
+    zip_path = tmp_path / "pid.zip"
+    mets_path = tmp_path / ".pid.mets.xml"
+
+    write_sip_zip(zip_path, iter(chunks), files, mets_copy=mets_path)
+    zip_path.unlink()
+
+    assert mets_path.read_text() == "".join(chunks)
+    assert list(tmp_path.glob(f".*{PARTIAL_SUFFIX}")) == []
+
+
+def test_write_sip_zip_mets_copy_on_failure(tmp_path: Path, files: list[dict]):
+    files[1]["source_href"] = tmp_path / "missing.xml"
+    mets_path = tmp_path / ".pid.mets.xml"
+
+    with pytest.raises(FileNotFoundError):
+        write_sip_zip(tmp_path / "pid.zip", "<mets/>", files, mets_copy=mets_path)
+
+    assert not mets_path.exists()
+    assert list(tmp_path.glob(".*.partial")) == []
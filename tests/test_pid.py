@@ -0,0 +1,138 @@
+from itertools import count
+from pathlib import Path
+import json
+import time
+
+import pytest
+
+from app.services.pid import PidClient, PidServiceError, PidServiceUnavailableError
+from stub_pid_server import StubPidServer
+
+
+@pytest.fixture
+def fetched(monkeypatch: pytest.MonkeyPatch) -> list[int]:
+    numbers = count()
+    batches: list[int] = []
+
+    def fetch_pids(self: PidClient, number: int) -> list[str]:
+        batches.append(number)
+        return [f"pid{next(numbers)}" for _ in range(number)]
+
+    monkeypatch.setattr(PidClient, "fetch_pids", fetch_pids)
+    return batches
+
+
+def wait_for_pool(client: PidClient, size: int):
+    deadline = time.monotonic() + 5
+    while len(client.pool) < size and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_get_pid_without_pool(fetched: list[int]):
+    client = PidClient({"url": "http://pid"})
+
+    assert client.get_pid() == "pid0"
+    assert client.get_pid() == "pid1"
+    assert fetched == [1, 1]
+
+
+def test_pool_is_refilled(fetched: list[int]):
+    client = PidClient({"url": "http://pid", "pool_size": 4, "low_water_mark": 2})
+    wait_for_pool(client, 4)
+
+    pids = [client.get_pid() for _ in range(2)]
+    wait_for_pool(client, 4)
+    client.close()
+
+    assert pids == ["pid0", "pid1"]
+    assert fetched == [4, 2]
+
+
+def test_pool_is_saved(fetched: list[int], tmp_path: Path):
+    pool_file = tmp_path / "pids.json"
+    config = {"url": "http://pid", "pool_size": 3, "pool_file": str(pool_file)}
+    client = PidClient(config)
+    wait_for_pool(client, 3)
+    client.get_pid()
+    client.close()
+
+    assert json.loads(pool_file.read_text()) == ["pid1", "pid2"]
+
+    client = PidClient(config | {"pool_size": 2, "low_water_mark": 0})
+    assert client.get_pid() == "pid1"
+    assert not pool_file.exists()
+    client.close()
+
+
+def test_pool_file_is_shared(fetched: list[int], tmp_path: Path):
+    pool_file = tmp_path / "pids.json"
+    pool_file.write_text(json.dumps(["saved0", "saved1"]))
+    config = {"url": "http://pid", "pool_file": str(pool_file)}
+
+    first, second = PidClient(config), PidClient(config)
+    loaded = [first.load_pool(), second.load_pool()]
+
+    assert sorted(loaded) == [[], ["saved0", "saved1"]]
+
+    first.pool.extend(["pid0"])
+    second.pool.extend(["pid1", "pid2"])
+    first.save_pool()
+    second.save_pool()
+
+    assert json.loads(pool_file.read_text()) == ["pid0", "pid1", "pid2"]
+
+
+def pid_config(server: StubPidServer, **config) -> dict:
+    return {"url": server.url, "backoff": 0} | config
+
+
+def test_fetch_pids(pid_server: StubPidServer):
+    client = PidClient(pid_config(pid_server))
+
+    assert client.fetch_pids(3) == ["pid0", "pid1", "pid2"]
+    assert client.get_pid() == "pid3"
+    assert client.metrics.requests == 2
+    assert client.metrics.errors == 0
+
+
+def test_fetch_pids_retries(pid_server: StubPidServer):
+    client = PidClient(pid_config(pid_server, retries=2))
+    pid_server.failures = 2
+
+    assert client.get_pid() == "pid0"
+    assert client.metrics.retries == 2
+    assert client.metrics.errors == 2
+
+
+def test_fetch_pids_fails(pid_server: StubPidServer):
+    client = PidClient(pid_config(pid_server, retries=1, failure_threshold=10))
+    pid_server.failures = 2
+
+    with pytest.raises(PidServiceError):
+        client.get_pid()
+    assert pid_server.requests == 2
+
+
+def test_circuit_breaker(pid_server: StubPidServer):
+    config = pid_config(pid_server, retries=0, failure_threshold=2, reset_timeout=0.2)
+    client = PidClient(config)
+    pid_server.failures = 2
+
+    for _ in range(2):
+        with pytest.raises(PidServiceError):
+            client.get_pid()
+    with pytest.raises(PidServiceUnavailableError):
+        client.get_pid()
+    assert pid_server.requests == 2
+    assert client.metrics.rejected == 1
+
+    time.sleep(0.2)
+    assert client.get_pid() == "pid0"
+
+
+def test_read_timeout(pid_server: StubPidServer):
+    client = PidClient(pid_config(pid_server, retries=0, read_timeout=0.05))
+    pid_server.delay = 0.2
+
+    with pytest.raises(PidServiceError):
+        client.get_pid()
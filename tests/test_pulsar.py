@@ -0,0 +1,50 @@
+from types import SimpleNamespace
+
+from pulsar import CompressionType, ConsumerType
+import pytest
+
+from app.services.pulsar import (
+    EMPTY_BODY,
+    AttributesMessage,
+    get_consumer_type,
+    get_producer_options,
+    loads,
+)
+
+
+def test_loads():
+    assert loads(b'{"data": {"a": [1, "b"]}}') == {"data": {"a": [1, "b"]}}
+
+
+def test_attributes_message():
+    msg = SimpleNamespace(
+        data=lambda: b'{"data": {"large": "payload"}}',
+        properties=lambda: {"subject": "path"},
+    )
+    attributes_msg = AttributesMessage(msg)  # type: ignore[arg-type]
+
+    assert attributes_msg.data() == EMPTY_BODY
+    assert attributes_msg.properties() == {"subject": "path"}
+
+
+def test_get_consumer_type():
+    assert get_consumer_type({}) == ConsumerType.Exclusive
+    assert get_consumer_type({"subscription_type": "key_shared"}) == (
+        ConsumerType.KeyShared
+    )
+    with pytest.raises(ValueError):
+        get_consumer_type({"subscription_type": "broadcast"})
+
+
+def test_get_producer_options():
+    options = get_producer_options(
+        {"compression": "zstd", "batching_enabled": True, "max_pending_messages": None}
+    )
+
+    assert options == {
+        "batching_enabled": True,
+        "compression_type": CompressionType.ZSTD,
+    }
+    assert get_producer_options({"send_async": True})["block_if_queue_full"]
+    with pytest.raises(ValueError):
+        get_producer_options({"compression": "brotli"})
@@ -0,0 +1,199 @@
+from collections.abc import Callable
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any
+import subprocess
+import sys
+import time
+
+import pytest
+
+from app import supervisor as supervisor_module
+from app.app import ListenerMetrics
+from app.packaging import PARTIAL_HOST
+from app.supervisor import (
+    RESTART_DELAY,
+    Supervisor,
+    WorkerReport,
+    get_worker_pid_config,
+)
+
+
+class FakeProcess:
+    """A worker process that runs its target in the test when it is asked to."""
+
+    def __init__(self, target: Callable, args: tuple, name: str):
+        self.target = target
+        self.args = args
+        self.name = name
+        self.pid: int | None = None
+        self.exitcode: int | None = None
+        self.closed = False
+
+    def start(self):
+        self.pid = 1000 + self.args[2]
+
+    def run(self):
+        try:
+            self.target(*self.args)
+            self.exitcode = 0
+        except Exception:
+            self.exitcode = 1
+
+    def crash(self):
+        self.exitcode = -9
+
+    def is_alive(self) -> bool:
+        return self.pid is not None and self.exitcode is None
+
+    def close(self):
+        self.closed = True
+
+
+class FakeListener:
+    """A listener that acknowledges `acknowledged` messages and then stops."""
+
+    acknowledged = 0
+    error: Exception | None = None
+    instances: list["FakeListener"] = []
+
+    def __init__(self, clean_orphans: bool, pid_config: dict[str, Any]):
+        self.pid_config = pid_config
+        self.metrics = ListenerMetrics()
+        self.pid_client = SimpleNamespace(metrics=SimpleNamespace(requests=1, errors=0))
+        self.instances.append(self)
+
+    def run(self):
+        for _ in range(self.acknowledged):
+            self.metrics.record(acknowledged=1)
+            # Leaves time for the reports in between
+            time.sleep(0.02)
+        if self.error is not None:
+            raise self.error
+
+
+def get_dead_pid() -> int:
+    process = subprocess.Popen([sys.executable, "-c", ""])
+    process.wait()
+    return process.pid
+
+
+@pytest.fixture
+def make_supervisor(
+    monkeypatch: pytest.MonkeyPatch, configure: Callable[..., dict[str, Any]]
+) -> Callable[..., Supervisor]:
+    def make(**config) -> Supervisor:
+        configure(
+            supervisor_module,
+            **{"pulsar": {}, "pid": {"pool_file": "pids.json"}} | config,
+        )
+        monkeypatch.setattr(supervisor_module, "EventListener", FakeListener)
+        monkeypatch.setattr(FakeListener, "instances", [])
+        # The workers run in the test instead of in a process of their own
+        monkeypatch.setattr(supervisor_module.signal, "signal", lambda *args: None)
+        supervisor = Supervisor()
+        supervisor.context = SimpleNamespace(Process=FakeProcess)
+        return supervisor
+
+    return make
+
+
+def wait_for_reports(supervisor: Supervisor, workers: list[tuple[int, int]]):
+    """
+    Collect the reports until only `workers` have not sent their final report.
+    """
+    deadline = time.monotonic() + 5
+    while list(supervisor.worker_metrics) != workers and time.monotonic() < deadline:
+        supervisor.collect_metrics(timeout=0.1)
+    assert list(supervisor.worker_metrics) == workers
+
+
+@pytest.mark.parametrize("subscription_type", ["exclusive", "failover"])
+def test_processes_require_shared_subscription(make_supervisor, subscription_type):
+    with pytest.raises(ValueError):
+        make_supervisor(processes=2, pulsar={"subscription_type": subscription_type})
+
+    assert make_supervisor(pulsar={"subscription_type": subscription_type})
+    assert make_supervisor(processes=2, pulsar={"subscription_type": "key_shared"})
+
+
+def test_restart_after_crash(make_supervisor, tmp_path: Path):
+    supervisor = make_supervisor(processes=2, pulsar={"subscription_type": "shared"})
+    supervisor.start_worker(0)
+    supervisor.start_worker(1)
+    crashed, running = supervisor.workers[0], supervisor.workers[1]
+    crashed.crash()
+    supervisor.started_at[0] -= RESTART_DELAY
+    # Partial output of a process that is gone
+    orphan = tmp_path / f".pid0000000.zip.{PARTIAL_HOST}-{get_dead_pid()}-0.partial"
+    orphan.touch()
+
+    supervisor.restart_exited_workers()
+
+    assert crashed.closed
+    restarted = supervisor.workers[0]
+    assert restarted is not crashed
+    assert restarted.is_alive()
+    # The restarted worker is a new generation of worker 0
+    assert restarted.args[1:3] == (0, 2)
+    assert supervisor.workers[1] is running
+    assert not orphan.exists()
+
+
+def test_no_restart_within_restart_delay(make_supervisor):
+    supervisor = make_supervisor(processes=2, pulsar={"subscription_type": "shared"})
+    supervisor.start_worker(0)
+    crashed = supervisor.workers[0]
+    crashed.crash()
+
+    supervisor.restart_exited_workers()
+
+    assert supervisor.workers[0] is crashed
+    assert not crashed.closed
+
+
+def test_metrics_add_up_over_restarts(make_supervisor, monkeypatch):
+    supervisor = make_supervisor(
+        processes=2, metrics_interval=0.01, pulsar={"subscription_type": "shared"}
+    )
+    supervisor.start_worker(0)
+    supervisor.start_worker(1)
+
+    # Worker 0 fails after 3 messages, its final report can still be underway
+    monkeypatch.setattr(FakeListener, "acknowledged", 3)
+    monkeypatch.setattr(FakeListener, "error", RuntimeError("crash"))
+    supervisor.workers[0].run()
+    supervisor.collect_metrics()
+    supervisor.started_at[0] -= RESTART_DELAY
+    supervisor.restart_exited_workers()
+
+    # The restarted worker 0 counts from zero again
+    monkeypatch.setattr(FakeListener, "acknowledged", 2)
+    monkeypatch.setattr(FakeListener, "error", None)
+    supervisor.workers[0].run()
+
+    # Worker 1 is killed without a final report
+    supervisor.metrics_queue.put(WorkerReport(1, 1, {"acknowledged": 4}))
+
+    # Only the worker without a final report keeps its metrics
+    wait_for_reports(supervisor, [(1, 1)])
+    assert supervisor.get_metrics() == {
+        "acknowledged": 9,
+        "negatively_acknowledged": 0,
+        "pid_requests": 2,
+        "pid_errors": 0,
+    }
+    assert [listener.pid_config for listener in FakeListener.instances] == [
+        {"pool_file": "pids-0.json"},
+        {"pool_file": "pids-0.json"},
+    ]
+
+
+def test_get_worker_pid_config():
+    pid_config = {"url": "http://pid", "pool_file": "/var/lib/pids.json"}
+
+    assert get_worker_pid_config(pid_config, 1) == {
+        "url": "http://pid",
+        "pool_file": "/var/lib/pids-1.json",
+    }
+    assert get_worker_pid_config({"url": "http://pid"}, 1) == {"url": "http://pid"}
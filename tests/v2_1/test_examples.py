@@ -1,10 +1,18 @@
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Any
+import xml.etree.ElementTree as ET
 
 import pytest
 
 import sippy
-from app.utils import get_mets_creator, get_sip_creator
+from app.utils import (
+    SIP_READ_FIELDS,
+    deserialize_sip,
+    get_mets_creator,
+    get_sip_creator,
+)
+from app.v2_1.creator import get_mets_engine
 
 
 """
@@ -68,3 +76,43 @@ def test_create_mediahave_sip(sip_path: Path, config: dict[str, Any]):
 
     sip_creator_fn = get_sip_creator(sip)
     sip_creator_fn(sip, config, sip.entity.identifier)
+
+
+@pytest.mark.parametrize("sip_path", sip_paths, ids=sip_path_names)
+def test_create_mediahave_sip_with_pid_future(sip_path: Path, config: dict[str, Any]):
+    data = transform_sip(sip_path)
+    sip = sippy.SIP.deserialize(data)
+
+    with ThreadPoolExecutor() as executor:
+        pid = executor.submit(lambda: sip.entity.identifier)
+        sip_creator_fn = get_sip_creator(sip)
+        mh_sip_path, _ = sip_creator_fn(sip, config, pid)
+
+    assert mh_sip_path.name == sip.entity.identifier
+
+
+@pytest.mark.parametrize("sip_path", sip_paths, ids=sip_path_names)
+def test_mets_engines_are_equal(sip_path: Path):
+    data = transform_sip(sip_path)
+    sip = sippy.SIP.deserialize(data)
+
+    mets_creator_fn = get_mets_creator(sip)
+    mets_data = mets_creator_fn(sip, sip.entity.identifier, "Disk", "25.1")
+    render_jinja, _ = get_mets_engine("jinja")
+    render_writer, generate_writer = get_mets_engine("writer")
+
+    jinja_mets = ET.canonicalize(render_jinja(mets_data), strip_text=True)
+    writer_mets = ET.canonicalize(render_writer(mets_data), strip_text=True)
+
+    assert writer_mets == jinja_mets
+    assert "".join(generate_writer(mets_data)) == render_writer(mets_data)
+
+
+@pytest.mark.parametrize("sip_path", sip_paths, ids=sip_path_names)
+def test_fast_deserialize_is_equal(sip_path: Path):
+    data = transform_sip(sip_path)
+    full_sip = deserialize_sip(data, "full")
+    fast_sip = deserialize_sip(data, "fast")
+
+    for name in SIP_READ_FIELDS:
+        assert getattr(fast_sip, name) == getattr(full_sip, name)
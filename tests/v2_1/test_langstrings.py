@@ -0,0 +1,35 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.v2_1.langstrings import LangStringResolver, MissingLangStringError
+
+
+def lang_strings(**values: str) -> SimpleNamespace:
+    return SimpleNamespace(
+        root=[SimpleNamespace(lang=lang, value=value) for lang, value in values.items()]
+    )
+
+
+def test_get_string():
+    strings = LangStringResolver()
+
+    assert strings.get_string(lang_strings(en="title", nl="titel")) == "titel"
+    assert strings.get_strings(lang_strings(en="title")) == []
+    assert strings.get_optional_string(None) is None
+
+
+def test_get_string_fallback():
+    strings = LangStringResolver(["nl", "en"])
+
+    assert strings.get_string(lang_strings(en="title", fr="titre")) == "title"
+    with pytest.raises(MissingLangStringError):
+        strings.get_string(lang_strings(fr="titre"))
+
+
+def test_index_is_memoized():
+    strings = LangStringResolver()
+    name = lang_strings(nl="titel")
+
+    assert strings.index(name) is strings.index(name)
+    assert strings.index(name) is not strings.index(lang_strings(nl="titel"))
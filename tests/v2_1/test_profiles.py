@@ -0,0 +1,54 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.v2_1.profiles import basic, film, material_artwork
+from app.v2_1.profiles.common import get_event_date, get_event_index
+from app.v2_1.profiles.helpers import Field, MappingConflictError, MappingPlan
+
+
+def test_mapping_plan_evaluate():
+    plan = MappingPlan(
+        [Field("Dynamic", "b", lambda c: c["b"])],
+        [
+            Field("Descriptive", "a", lambda c: c["a"]),
+            Field("Dynamic", "a", lambda c: c["a"]),
+        ],
+    )
+
+    mapping = plan.evaluate({"a": 1, "b": 2})
+
+    assert mapping == {"Dynamic": {"b": 2, "a": 1}, "Descriptive": {"a": 1}}
+    assert list(mapping["Dynamic"]) == ["b", "a"]
+
+
+def test_mapping_plan_conflict():
+    with pytest.raises(MappingConflictError):
+        MappingPlan(
+            [Field("Dynamic", "a", lambda c: 1)],
+            [Field("Dynamic", "a", lambda c: 2)],
+        )
+
+
+@pytest.mark.parametrize("profile", [basic, film, material_artwork])
+def test_profile_plans_are_compiled(profile):
+    names = [(field.section, field.name) for field in profile.PLAN.fields]
+
+    assert len(names) == len(set(names))
+    assert ("Descriptive", "mh:Title") in names
+
+
+def test_event_index_parses_start_on_lookup():
+    events = [
+        SimpleNamespace(
+            type="registration",
+            started_at_time=SimpleNamespace(value="2024-05-01T10:00:00"),
+        ),
+        SimpleNamespace(type="repair", started_at_time=SimpleNamespace(value="?")),
+    ]
+
+    index = get_event_index(events)  # type: ignore[arg-type]
+
+    assert get_event_date(index, "registration") == "2024-05-01"  # type: ignore[arg-type]
+    with pytest.raises(ValueError):
+        get_event_date(index, "repair")  # type: ignore[arg-type]
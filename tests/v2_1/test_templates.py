@@ -0,0 +1,48 @@
+from pathlib import Path
+
+import pytest
+from jinja2 import FileSystemLoader, ModuleLoader
+
+from app.v2_1 import creator
+from app.v2_1.creator import compile_templates, get_jinja_environment
+
+
+@pytest.fixture
+def templates(monkeypatch: pytest.MonkeyPatch, tmp_path: Path):
+    templates_path = tmp_path / "templates"
+    templates_path.mkdir()
+    monkeypatch.setattr(creator, "TEMPLATES_PATH", templates_path)
+    monkeypatch.setattr(creator, "COMPILED_TEMPLATES_PATH", tmp_path / "compiled")
+    get_jinja_environment.cache_clear()
+    yield templates_path
+    get_jinja_environment.cache_clear()
+
+
+def test_compiled_templates(templates: Path):
+    (templates / "base.jinja").write_text("compiled {{ value }}")
+    compile_templates(creator.COMPILED_TEMPLATES_PATH, templates)
+
+    env = get_jinja_environment()
+
+    assert isinstance(env.loader, ModuleLoader)
+    assert env.get_template("base.jinja").render(value=1) == "compiled 1"
+
+
+def test_edited_template_is_picked_up(templates: Path):
+    (templates / "base.jinja").write_text("compiled {{ value }}")
+    compile_templates(creator.COMPILED_TEMPLATES_PATH, templates)
+
+    (templates / "base.jinja").write_text("edited {{ value }}")
+    env = get_jinja_environment()
+
+    assert isinstance(env.loader, FileSystemLoader)
+    assert env.get_template("base.jinja").render(value=1) == "edited 1"
+
+
+def test_uncompiled_templates(templates: Path):
+    (templates / "base.jinja").write_text("parsed {{ value }}")
+
+    env = get_jinja_environment()
+
+    assert isinstance(env.loader, FileSystemLoader)
+    assert env.get_template("base.jinja").render(value=1) == "parsed 1"